@@ -1,19 +1,32 @@
 import os
-import srt
+import functools
 import tkinter as tk
 from tkinter import ttk, scrolledtext
-from srt import parse, compose
 import tkinter.messagebox as messagebox
-from tkinterdnd2 import DND_FILES, TkinterDnD
 import threading
 import queue
-import requests
-import json
-import ollama
 import time
-import re
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from throughput_controller import ThroughputController, record_translated
+from cue_store import CueStore
+from cue_merge import group_fragments, merged_text, expand_group, describe_merge
+from pipeline import Pipeline, describe_queues, format_stage_stats
+from sampling_profiler import run_profiled
+from translation_memory import TranslationMemory
+from generation_profiles import GenerationProfile, DEFAULT_PROFILE, available_profiles, profile_name_for, save_profile_name
+from model_cache import last_api_url, cached_models, save_models, fetch_models, default_model
+from translate_worker import TranslationWorker, has_checkpoint, recover_partial
+from translate_common import (
+    SPECIAL_MODEL, MAX_CHUNK_LENGTH, split_api_urls, build_output_path, max_retries_for,
+    build_general_messages, build_batch_messages, parse_batch_response, build_special_prompt,
+    check_special_result, split_text_chunks, join_chunks, compress_repetitive_text,
+    reconstruct_with_repetition, describe_repetition, PromptEvalStats
+)
 
 # 如果需要自动检测文件编码，请安装：pip install charset-normalizer
+# requests、ollama、httpx、tkinterdnd2 导入较慢（打包后更明显），都在第一次用到时才导入，窗口先显示出来
 
 class SRTTranslatorApp:
     def __init__(self, root):
@@ -24,7 +37,11 @@ class SRTTranslatorApp:
         # 创建消息队列用于线程间通信
         self.message_queue = queue.Queue()
         self.translation_thread = None
+        self.translation_worker = None
         self.stop_translation = False
+        self.throughput_controller = None
+        self.translation_memory = None
+        self.prompt_stats = PromptEvalStats()
         
         # 状态标签
         self.status_label = ttk.Label(root, text="正在检查Ollama服务...", font=('微软雅黑', 10))
@@ -35,9 +52,8 @@ class SRTTranslatorApp:
         self.drop_frame.pack(pady=10, padx=20, fill="both", expand=True)
         self.drop_label = tk.Label(self.drop_frame, text="将SRT文件拖放到此处", font=('微软雅黑', 12))
         self.drop_label.pack(expand=True, fill="both")
-        # 绑定拖放事件
-        self.drop_frame.drop_target_register(DND_FILES)
-        self.drop_frame.dnd_bind('<<Drop>>', self.on_drop)
+        # 窗口显示后再加载拖放扩展并绑定拖放事件
+        self.root.after_idle(self.enable_drag_and_drop)
 
         # 语言选择框架
         self.lang_frame = tk.Frame(root)
@@ -79,12 +95,21 @@ class SRTTranslatorApp:
         self.api_label.grid(row=3, column=0, padx=5, pady=10, sticky="w")
         self.api_entry = ttk.Entry(self.lang_frame)
         self.api_entry.grid(row=3, column=1, padx=5, pady=10, sticky="ew")
-        self.api_entry.insert(0, "http://localhost:11434")
+        self.api_entry.insert(0, last_api_url())
 
         # 刷新模型按钮
         self.refresh_btn = ttk.Button(self.lang_frame, text="刷新模型列表", command=self.refresh_models)
         self.refresh_btn.grid(row=3, column=2, padx=5, pady=10)
 
+        # 生成参数方案：输出上限、上下文大小、确定性解码等，按模型保存，切换模型时选中该模型的方案
+        self.profile_label = ttk.Label(self.lang_frame, text="生成参数：")
+        self.profile_label.grid(row=4, column=0, padx=5, pady=10, sticky="w")
+        self.profile_combo = ttk.Combobox(self.lang_frame, values=list(available_profiles()), state="readonly")
+        self.profile_combo.grid(row=4, column=1, padx=5, pady=10, sticky="ew")
+        self.profile_combo.set(DEFAULT_PROFILE)
+        self.model_combo.bind('<<ComboboxSelected>>', self.on_model_selected)
+        self.generation_profile = None
+
         self.lang_frame.grid_columnconfigure(1, weight=1)
 
         # 按钮框架
@@ -98,6 +123,38 @@ class SRTTranslatorApp:
         # 中止按钮
         self.stop_btn = ttk.Button(self.button_frame, text="中止翻译", command=self.stop_translation_process, state="disabled")
         self.stop_btn.pack(side="left", padx=5)
+        
+        # 翻译引擎：独立进程（异步引擎运行在子进程中，界面不卡顿）、异步（当前进程）、线程（兼容旧版）
+        self.engine_label = ttk.Label(self.button_frame, text="翻译引擎：")
+        self.engine_label.pack(side="left", padx=(20, 0))
+        self.engine_combo = ttk.Combobox(
+            self.button_frame,
+            values=["独立进程", "异步", "线程"],
+            state="readonly",
+            width=10
+        )
+        self.engine_combo.pack(side="left", padx=5)
+        self.engine_combo.current(0)
+
+        # 翻译记忆：与以前译过的句子几乎相同时直接复用译文，相似时作为参考传给模型
+        self.use_memory = tk.BooleanVar(value=True)
+        self.memory_check = ttk.Checkbutton(self.button_frame, text="使用翻译记忆", variable=self.use_memory)
+        self.memory_check.pack(side="left", padx=5)
+
+        # 慢请求对冲：请求超过同长度请求的p95仍未返回时再发一份，先返回的被采用（仅异步和独立进程引擎）
+        self.use_hedge = tk.BooleanVar(value=False)
+        self.hedge_check = ttk.Checkbutton(self.button_frame, text="慢请求对冲", variable=self.use_hedge)
+        self.hedge_check.pack(side="left", padx=5)
+
+        # 合并断句：语音识别生成的字幕常把一句话切成几条，合成整句翻译后按原文长度分回各条
+        self.merge_fragments = tk.BooleanVar(value=True)
+        self.merge_check = ttk.Checkbutton(self.button_frame, text="合并断句字幕", variable=self.merge_fragments)
+        self.merge_check.pack(side="left", padx=5)
+
+        # 性能分析：在采样分析下翻译，各阶段的火焰图数据和热点摘要写在输出SRT旁边；不勾选时没有任何额外开销
+        self.profiling = tk.BooleanVar(value=False)
+        self.profiling_check = ttk.Checkbutton(self.button_frame, text="性能分析", variable=self.profiling)
+        self.profiling_check.pack(side="left", padx=5)
 
         # 进度框架
         self.progress_frame = tk.Frame(root)
@@ -114,47 +171,87 @@ class SRTTranslatorApp:
         # 初始化时禁用所有控件
         self.disable_controls()
         
-        # 启动时检查Ollama服务并获取模型列表
-        threading.Thread(target=self.initialize_ollama, daemon=True).start()
+        # 有上次的模型列表时立即填充并启用控件，同时在后台检查Ollama服务并刷新模型列表
+        models = cached_models(self.get_api_url())
+        if models:
+            self.set_model_list(models)
+            self.status_label.config(text="就绪（正在后台刷新模型列表...）")
+            self.enable_controls()
+        threading.Thread(target=self.initialize_ollama, args=(bool(models),), daemon=True).start()
         
         # 定期检查消息队列
         self.root.after(100, self.check_message_queue)
 
-    def initialize_ollama(self):
-        """初始化Ollama服务检查并获取模型列表"""
+    def set_model_list(self, models, selected=None):
+        """填充模型下拉框，依次优先选中：当前选中的模型、基准测试推荐的默认模型、第一个模型"""
+        self.model_combo['values'] = models
+        for model in (selected, default_model()):
+            if model and model in models:
+                self.model_combo.set(model)
+                break
+        else:
+            if models:
+                self.model_combo.current(0)
+        self.on_model_selected()
+
+    def on_model_selected(self, event=None):
+        model = SPECIAL_MODEL if self.use_translate_model.get() else self.model_combo.get()
+        if model:
+            self.profile_combo.set(profile_name_for(model))
+
+    def enable_drag_and_drop(self):
+        """加载tkdnd扩展并把拖放区域注册为文件拖放目标"""
+        try:
+            from tkinterdnd2 import DND_FILES, TkinterDnD
+            # 与 TkinterDnD.Tk() 创建窗口时做的相同，只是放到窗口显示之后
+            TkinterDnD._require(self.root)
+            self.drop_frame.drop_target_register(DND_FILES)
+            self.drop_frame.dnd_bind('<<Drop>>', self.on_drop)
+        except Exception as e:
+            print(f"加载拖放功能失败: {str(e)}")
+            self.drop_label.config(text=f"拖放功能不可用: {str(e)}")
+
+    def initialize_ollama(self, background=False):
+        """初始化Ollama服务检查并获取模型列表；background为True时控件已用缓存的列表启用，失败只提示不报错"""
+        api_url = self.get_api_url()
         try:
             # 检查Ollama服务是否运行
-            api_url = self.api_entry.get().strip()
-            response = requests.get(f"{api_url}/api/tags")
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                model_names = [model["name"] for model in models]
-                if model_names:
-                    self.message_queue.put({
-                        "type": "update_models",
-                        "models": model_names
-                    })
+            model_names = fetch_models(api_url)
+            if model_names:
+                save_models(api_url, model_names)
+                self.message_queue.put({
+                    "type": "update_models",
+                    "models": model_names
+                })
+                if not self.is_translating():
                     self.message_queue.put({
                         "type": "status",
                         "text": "就绪"
                     })
+                if not background:
                     self.enable_controls()
-                else:
-                    self.message_queue.put({
-                        "type": "error",
-                        "text": "未找到可用的Ollama模型，请先下载模型"
-                    })
             else:
                 self.message_queue.put({
                     "type": "error",
-                    "text": "Ollama服务未运行或无法访问"
+                    "text": "未找到可用的Ollama模型，请先下载模型"
                 })
         except Exception as e:
+            if background:
+                print(f"后台刷新模型列表失败: {str(e)}")
+                if not self.is_translating():
+                    self.message_queue.put({
+                        "type": "status",
+                        "text": "暂时无法连接Ollama服务，显示的是上次的模型列表"
+                    })
+                return
             self.message_queue.put({
                 "type": "error",
                 "text": f"连接Ollama服务失败: {str(e)}"
             })
 
+    def is_translating(self):
+        return self.translation_thread is not None and self.translation_thread.is_alive()
+
     def refresh_models(self):
         """刷新模型列表"""
         self.disable_controls()
@@ -169,6 +266,8 @@ class SRTTranslatorApp:
             while True:
                 message = self.message_queue.get_nowait()
                 if message["type"] == "progress":
+                    if "maximum" in message:
+                        self.progress_bar["maximum"] = message["maximum"]
                     self.progress_bar["value"] = message["value"]
                 elif message["type"] == "status":
                     self.status_label.config(text=message["text"])
@@ -188,9 +287,10 @@ class SRTTranslatorApp:
                     self.enable_controls()
                     messagebox.showerror("错误", message["text"])
                 elif message["type"] == "update_models":
-                    self.model_combo['values'] = message["models"]
-                    if message["models"]:
-                        self.model_combo.current(0)
+                    # 后台刷新时保留已选中的模型
+                    self.set_model_list(message["models"], self.model_combo.get())
+                elif message["type"] == "worker_exited":
+                    self.handle_worker_exit(message)
                 elif message["type"] == "preview":
                     self.preview_text.insert(tk.END, message["text"])
                     self.preview_text.see(tk.END)
@@ -204,6 +304,8 @@ class SRTTranslatorApp:
         self.src_lang.config(state="readonly")
         self.dest_lang.config(state="readonly")
         self.model_combo.config(state="readonly")
+        self.profile_combo.config(state="readonly")
+        self.engine_combo.config(state="readonly")
         self.stop_btn.config(state="disabled")
         self.stop_translation = False
         print("控件已重新启用，中止状态已重置")
@@ -213,68 +315,144 @@ class SRTTranslatorApp:
         self.src_lang.config(state="disabled")
         self.dest_lang.config(state="disabled")
         self.model_combo.config(state="disabled")
+        self.profile_combo.config(state="disabled")
+        self.engine_combo.config(state="disabled")
         self.stop_btn.config(state="disabled")
 
-    def start_translation(self):
+    def start_translation(self, resume=None):
         if not hasattr(self, 'input_file'):
             messagebox.showerror("错误", "请先拖放SRT文件")
             return
+        engine = self.engine_combo.get()
+        settings = self.get_translation_settings()
+        # 记住该模型选用的生成参数方案
+        save_profile_name(SPECIAL_MODEL if settings["use_special_model"] else settings["model"],
+                          settings["generation_profile"])
+        if engine == "独立进程" and resume is None:
+            resume = has_checkpoint(settings) and messagebox.askyesno(
+                "继续翻译", "发现该文件未完成的翻译进度，是否从中断处继续？\n\n选择“否”将重新开始翻译。")
         self.disable_controls()
         self.stop_btn.config(state="normal")
         self.status_label.config(text="正在翻译...")
         self.progress_bar["value"] = 0
         self.preview_text.delete(1.0, tk.END)
         self.stop_translation = False
+        self.translation_worker = None
+        if engine == "独立进程":
+            # 在子进程中执行翻译，转发线程随子进程结束
+            self.translation_worker = TranslationWorker(settings, self.message_queue)
+            self.translation_thread = self.translation_worker.start(resume=bool(resume))
+            return
         # 在新线程中执行翻译
-        self.translation_thread = threading.Thread(target=self.translate_srt, daemon=True)
+        target = self.run_async_engine if engine == "异步" else self.translate_srt
+        if settings["profiling"]:
+            output_path = build_output_path(settings["input_file"], settings["src_lang"], settings["dest_lang"])
+            target = functools.partial(run_profiled, target, output_path, self.message_queue.put)
+        self.translation_thread = threading.Thread(target=target, daemon=True)
         self.translation_thread.start()
 
+    def get_translation_settings(self):
+        """当前界面上的翻译设置，传给子进程时只能包含可序列化的值"""
+        return {
+            "input_file": self.input_file,
+            "src_lang": self.src_lang.get(),
+            "dest_lang": self.dest_lang.get(),
+            "api_urls": split_api_urls(self.api_entry.get()),
+            "model": self.model_combo.get(),
+            "use_special_model": self.use_translate_model.get(),
+            "use_memory": self.use_memory.get(),
+            "hedge": self.use_hedge.get(),
+            "merge_fragments": self.merge_fragments.get(),
+            "generation_profile": self.profile_combo.get(),
+            "profiling": self.profiling.get(),
+        }
+
+    def handle_worker_exit(self, message):
+        """子进程没有正常结束（崩溃或被强制结束）时，从进度文件恢复部分结果"""
+        settings = self.translation_worker.settings
+        output_path, count = recover_partial(settings)
+        self.enable_controls()
+        if message["killed"]:
+            status_text = f"翻译已强制中止，已保存 {count} 条翻译结果" if count else "翻译已强制中止"
+            self.status_label.config(text=status_text)
+            messagebox.showinfo("中止完成", f"翻译已中止。\n\n{status_text}\n\n文件名包含'_partial'标识。")
+            return
+        saved_text = f"已保存 {count} 条翻译结果到：\n{output_path}\n\n" if count else ""
+        self.status_label.config(text=f"翻译进程异常退出，已保存 {count} 条翻译结果")
+        if messagebox.askyesno("翻译进程异常退出",
+                               f"翻译进程意外退出（退出码 {message['exitcode']}）。\n\n{saved_text}是否从中断处继续翻译？"):
+            self.start_translation(resume=True)
+
+    def get_api_url(self):
+        """API地址栏中的第一个地址，线程版本只使用这一个"""
+        urls = split_api_urls(self.api_entry.get())
+        return urls[0] if urls else ""
+
+    def run_async_engine(self):
+        """在翻译线程中运行asyncio引擎，消息仍通过message_queue回到Tk主循环"""
+        from async_engine import AsyncTranslationEngine
+        settings = self.get_translation_settings()
+        engine = AsyncTranslationEngine(
+            settings["input_file"],
+            settings["src_lang"],
+            settings["dest_lang"],
+            settings["api_urls"],
+            settings["model"],
+            use_special_model=settings["use_special_model"],
+            emit=self.message_queue.put,
+            should_stop=lambda: self.stop_translation,
+            use_memory=settings["use_memory"],
+            hedge=settings["hedge"],
+            merge_fragments=settings["merge_fragments"],
+            generation_profile=settings["generation_profile"]
+        )
+        asyncio.run(engine.run())
+
     def toggle_translate_model(self):
         """切换是否使用专用翻译模型"""
         if self.use_translate_model.get():
             # 检查专用翻译模型是否存在
-            api_url = self.api_entry.get().strip()
+            api_url = self.get_api_url()
             try:
-                response = requests.get(f"{api_url}/api/tags")
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    model_names = [model["name"] for model in models]
-                    if "7shi/llama-translate:8b-q4_K_M" not in model_names:
-                        # 询问用户是否要下载模型
-                        if messagebox.askyesno("模型未找到", 
-                            "未检测到专用翻译模型，是否现在下载？\n"
-                            "下载可能需要一些时间，请确保网络连接正常。"):
-                            self.message_queue.put({
-                                "type": "status",
-                                "text": "正在下载专用翻译模型..."
-                            })
-                            # 禁用控件
-                            self.disable_controls()
-                            # 在新线程中下载模型
-                            threading.Thread(target=self.download_translate_model, daemon=True).start()
-                            return
-                        else:
-                            # 用户取消下载，取消勾选
-                            self.use_translate_model.set(False)
-                            return
+                model_names = fetch_models(api_url)
+                if SPECIAL_MODEL not in model_names:
+                    # 询问用户是否要下载模型
+                    if messagebox.askyesno("模型未找到", 
+                        "未检测到专用翻译模型，是否现在下载？\n"
+                        "下载可能需要一些时间，请确保网络连接正常。"):
+                        self.message_queue.put({
+                            "type": "status",
+                            "text": "正在下载专用翻译模型..."
+                        })
+                        # 禁用控件
+                        self.disable_controls()
+                        # 在新线程中下载模型
+                        threading.Thread(target=self.download_translate_model, daemon=True).start()
+                        return
+                    else:
+                        # 用户取消下载，取消勾选
+                        self.use_translate_model.set(False)
+                        return
             except Exception as e:
                 messagebox.showerror("错误", f"检查模型失败: {str(e)}")
                 self.use_translate_model.set(False)
                 return
                 
-            self.model_combo.set("7shi/llama-translate:8b-q4_K_M")
+            self.model_combo.set(SPECIAL_MODEL)
             self.model_combo.config(state="disabled")
+            self.on_model_selected()
         else:
             self.model_combo.config(state="readonly")
             self.refresh_models()
 
     def download_translate_model(self):
         """下载专用翻译模型"""
+        import requests
         try:
-            api_url = self.api_entry.get().strip()
+            api_url = self.get_api_url()
             response = requests.post(
                 f"{api_url}/api/pull",
-                json={"name": "7shi/llama-translate:8b-q4_K_M"}
+                json={"name": SPECIAL_MODEL}
             )
             response.raise_for_status()
             
@@ -284,7 +462,7 @@ class SRTTranslatorApp:
                 if status_response.status_code == 200:
                     models = status_response.json().get("models", [])
                     model_names = [model["name"] for model in models]
-                    if "7shi/llama-translate:8b-q4_K_M" in model_names:
+                    if SPECIAL_MODEL in model_names:
                         self.message_queue.put({
                             "type": "status",
                             "text": "专用翻译模型下载完成"
@@ -305,261 +483,388 @@ class SRTTranslatorApp:
             self.use_translate_model.set(False)
             self.enable_controls()
 
-    def translate_with_ollama(self, text, src_lang, dest_lang, max_retries=2):
-        """使用Ollama进行翻译，添加重试机制"""
+    def translate_with_ollama(self, text, src_lang, dest_lang, max_retries=2, hint=None):
+        """使用Ollama进行翻译，添加重试机制；hint为相似的翻译记忆，通用模型会以它为参考。
+        返回 (译文, 是否翻译成功)，中止或多次失败时译文为原文"""
         # 检查是否需要中止翻译
         if self.stop_translation:
             print("检测到中止信号，停止翻译")
-            return text
-        
-        # 对于超长文本（超过200字符），直接返回原文
-        if len(text) > 200:
-            print(f"文本过长({len(text)}字符)，直接返回原文: {text[:50]}...")
-            return text
+            return text, False
         
-        # 对于较短的文本，增加重试次数
-        if len(text) < 50:
-            max_retries = 3
+        # 对于超长文本（超过200字符），按句子切分后并发翻译
+        if len(text) > MAX_CHUNK_LENGTH:
+            return self.translate_long_text(text, src_lang, dest_lang)
         
-        # 如果文本包含特殊字符或格式，可能容易卡住，降低重试次数
-        if any(char in text for char in ['♪', '♫', '※', '●', '■', '★']):
-            max_retries = 1
-            print(f"检测到特殊字符，降低重试次数: {text[:30]}...")
+        max_retries = max_retries_for(text, max_retries)
         
         for attempt in range(max_retries):
             # 在每次重试前检查中止信号
             if self.stop_translation:
                 print("检测到中止信号，停止重试")
-                return text
+                return text, False
                 
             try:
                 if self.use_translate_model.get():
                     result = self.translate_with_special_model(text, src_lang, dest_lang)
                     print(f"专用模型翻译成功: {result[:50]}...")
-                    return result
+                    return result, True
                 else:
-                    result = self.translate_with_general_model(text, src_lang, dest_lang)
+                    result = self.translate_with_general_model(text, src_lang, dest_lang, hint)
                     print(f"通用模型翻译成功: {result[:50]}...")
-                    return result
+                    return result, True
             except Exception as e:
                 print(f"翻译尝试 {attempt + 1} 失败: {str(e)}")
+                if self.throughput_controller:
+                    self.throughput_controller.record_error(e)
                 if attempt < max_retries - 1:
                     time.sleep(1)  # 减少等待时间到1秒
                     continue
                 # 最后一次尝试失败，返回原文确保不丢失
                 print(f"翻译多次失败，返回原文: {text[:50]}...")
-                return text
+                return text, False
+
+    def translate_long_text(self, text, src_lang, dest_lang, max_len=MAX_CHUNK_LENGTH, max_workers=4):
+        """超长文本分块并发翻译，按原顺序重组，总耗时约等于最慢的一块；所有块都翻译成功才算成功"""
+        lines = split_text_chunks(text, max_len)
+        chunks = [chunk.strip() for line in lines for chunk in line if chunk.strip()]
+        if not chunks:
+            return text, False
+        print(f"文本过长({len(text)}字符)，切分为 {len(chunks)} 块并发翻译: {text[:50]}...")
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            outcomes = list(executor.map(
+                lambda chunk: self.translate_with_ollama(chunk, src_lang, dest_lang), chunks))
+        return (join_chunks(lines, [result for result, _ in outcomes], dest_lang),
+                all(translated for _, translated in outcomes))
 
     def translate_with_special_model(self, text, src_lang, dest_lang):
         """使用专用翻译模型进行翻译"""
+        import ollama
         try:
-            lang_map = {'中文': 'Mandarin', '英语': 'English', '日语': 'Japanese'}
-            from_lang = lang_map[src_lang]
-            to_lang = lang_map[dest_lang]
-            
-            prompt = f"""### Instruction:
-Translate {from_lang} to {to_lang}.
-
-### Input:
-{text}
-
-### Response:
-"""
+            prompt = build_special_prompt(text, src_lang, dest_lang)
             messages = [{"role": "user", "content": prompt}]
             
-            # 设置超时，使用ollama的超时参数
-            response = ollama.chat(
-                model="7shi/llama-translate:8b-q4_K_M", 
+            extra = self.generation_payload("special", prompt, len(text))
+            
+            # 设置超时，使用ollama的超时参数；与通用模型一样发到界面中填写的API地址（可以是录制代理）
+            response = ollama.Client(host=self.get_api_url()).chat(
+                model=SPECIAL_MODEL, 
                 messages=messages,
-                options={"timeout": 2}  # 2秒超时，更快响应中止信号
+                options={"timeout": 2, **extra.get("options", {})},  # 2秒超时，更快响应中止信号
+                keep_alive=extra.get("keep_alive")
             )
+            self.prompt_stats.record(response)
             result = response["message"]["content"].strip()
-            
-            # 检查结果是否合理
-            if not result or len(result) > len(text) * 3:  # 如果翻译结果异常长，可能有问题
-                print(f"专用模型翻译结果异常，原文长度: {len(text)}, 译文长度: {len(result)}")
-                if not result:
-                    raise Exception("翻译结果为空")
-            
-            return result
+            return check_special_result(text, result)
         except Exception as e:
             raise Exception(f"专用翻译模型调用失败: {str(e)}")
 
-    def translate_with_general_model(self, text, src_lang, dest_lang):
+    def generation_payload(self, kind, prompt, text_length, count=1):
+        """当前翻译所用生成参数方案给出的 options/keep_alive"""
+        if self.generation_profile is None:
+            return {}
+        return self.generation_profile.payload(kind, prompt, text_length, count)
+
+    def translate_with_general_model(self, text, src_lang, dest_lang, hint=None):
         """使用通用模型进行翻译"""
-        api_url = self.api_entry.get().strip()
+        import requests
+        api_url = self.get_api_url()
         model = self.model_combo.get()
         
-        prompt = f"请将以下{src_lang}文本翻译成{dest_lang}，只返回翻译结果，不要添加任何解释：\n{text}"
+        # 固定的系统提示词和示例在前，只有最后的字幕不同，服务端可以复用前缀的缓存
+        messages = build_general_messages(text, src_lang, dest_lang, hint)
         
         try:
             response = requests.post(
-                f"{api_url}/api/generate",
+                f"{api_url}/api/chat",
                 json={
                     "model": model,
-                    "prompt": prompt,
-                    "stream": False
+                    "messages": messages,
+                    "stream": False,
+                    **self.generation_payload("single", messages, len(text))
                 },
                 timeout=2  # 2秒超时，更快响应中止信号
             )
             response.raise_for_status()
             result = response.json()
-            return result["response"].strip()
+            self.prompt_stats.record(result)
+            return result["message"]["content"].strip()
         except requests.exceptions.Timeout:
             raise Exception(f"请求超时(2秒)，自动跳过: {text[:30]}...")
         except Exception as e:
             raise Exception(f"Ollama API调用失败: {str(e)}")
 
+    def translate_batch_with_general_model(self, texts, src_lang, dest_lang):
+        """一次请求翻译多条字幕，以JSON数组收发，条数对不上时抛出异常由调用方逐条重试"""
+        import requests
+        api_url = self.get_api_url()
+        model = self.model_combo.get()
+        
+        messages = build_batch_messages(texts, src_lang, dest_lang)
+        timeout = 2 + len(texts)  # 每多一条字幕多给1秒
+        
+        try:
+            response = requests.post(
+                f"{api_url}/api/chat",
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "stream": False,
+                    **self.generation_payload("batch", messages, sum(len(text) for text in texts), len(texts))
+                },
+                timeout=timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+            self.prompt_stats.record(data, len(texts))
+            content = data["message"]["content"]
+        except requests.exceptions.Timeout:
+            raise Exception(f"批量请求超时({timeout}秒)，共 {len(texts)} 条")
+        except Exception as e:
+            raise Exception(f"Ollama API批量调用失败: {str(e)}")
+        return parse_batch_response(content, len(texts))
+
+    def translate_cue_batch(self, texts, src_lang, dest_lang):
+        """翻译一批字幕：先查翻译记忆，几乎相同的直接复用，相似的以记忆为参考逐条翻译，其余的交给模型批量翻译"""
+        memory = self.translation_memory
+        results = [None] * len(texts)
+        plain = []
+        for n, text in enumerate(texts):
+            match = memory.lookup(text) if memory else None
+            if memory and memory.can_reuse(match):
+                print(f"复用翻译记忆(相似度 {match.score:.2f}): {text[:30]}... → {match.translation[:30]}...")
+                results[n] = match.translation
+            elif match and not self.use_translate_model.get():
+                start = time.time()
+                results[n], translated = self.translate_with_ollama(text, src_lang, dest_lang, hint=match)
+                if translated:
+                    self.throughput_controller.record_success(1, time.time() - start)
+                memory.add(text, results[n])
+            else:
+                plain.append(n)
+        
+        if plain:
+            translated = self.translate_with_model([texts[n] for n in plain], src_lang, dest_lang)
+            for n, translated_text in zip(plain, translated):
+                results[n] = translated_text
+                if memory:
+                    memory.add(texts[n], translated_text)
+        return results
+
+    def translate_with_model(self, texts, src_lang, dest_lang):
+        """翻译一批字幕并把耗时反馈给自动调优；批量失败时退回逐条翻译"""
+        controller = self.throughput_controller
+        start = time.time()
+        if len(texts) > 1 and all(len(text) <= MAX_CHUNK_LENGTH for text in texts):
+            try:
+                results = self.translate_batch_with_general_model(texts, src_lang, dest_lang)
+                controller.record_success(len(texts), time.time() - start)
+                return results
+            except Exception as e:
+                print(f"批量翻译失败，改为逐条翻译: {str(e)}")
+                controller.record_error(e)
+                start = time.time()
+        
+        outcomes = [self.translate_with_ollama(text, src_lang, dest_lang) for text in texts]
+        record_translated(controller, outcomes, time.time() - start)
+        return [result for result, _ in outcomes]
+
     def translate_srt(self):
         try:
             src_lang = self.src_lang.get()
             dest_lang = self.dest_lang.get()
-            subs = self.parse_srt(self.input_file)
-            total_subs = len(subs)
+            
+            # 并发数和每次请求的条数由自动调优决定，专用翻译模型只能逐条翻译
+            api_url = self.get_api_url()
+            use_special = self.use_translate_model.get()
+            model = SPECIAL_MODEL if use_special else self.model_combo.get()
+            self.throughput_controller = ThroughputController.load(api_url, model, allow_batching=not use_special)
+            controller = self.throughput_controller
+            self.generation_profile = GenerationProfile.for_model(model, self.profile_combo.get(), api_url)
+            self.generation_profile.start_context()
+            self.prompt_stats = PromptEvalStats()
+            
+            # 解析 → 预处理 → 翻译 → 重构 → 提交，各阶段之间用有上限的队列连接；全部完成后写入文件
+            pipeline = Pipeline(should_stop=lambda: self.stop_translation)
+            store = pipeline.timed("解析", self.parse_srt, self.input_file)
+            self.translation_memory = None
+            if self.use_memory.get():
+                self.translation_memory = pipeline.timed("载入记忆", TranslationMemory.open, src_lang, dest_lang)
+            total_subs = len(store)
             print(f"开始翻译，总共 {total_subs} 条字幕")
             # 设置进度条最大值
             self.progress_bar["maximum"] = total_subs
             self.message_queue.put({"type": "progress", "value": 0})
             self.message_queue.put({"type": "status", "text": f"正在翻译... (0/{total_subs})"})
             
-            translated_subs = []
+            # 断句的相邻字幕合成一组整句翻译，每组以 (第一条的序号, 条数) 进入流水线
+            if self.merge_fragments.get():
+                groups = pipeline.timed("合并断句", group_fragments, store)
+            else:
+                groups = [(i, 1) for i in range(total_subs)]
+            
+            translated_count = 0  # 已按顺序完成的条数，译文直接填入store
             compressed_count = 0  # 统计压缩的句子数量
+            results = {}  # 先完成的字幕等待前面的字幕完成后再按顺序写入
             
-            for i, sub in enumerate(subs):
-                current_progress = i + 1
-                print(f"=== 处理第 {current_progress}/{total_subs} 条字幕 ===")
-                print(f"原始索引: {sub.index}, 时间: {sub.start} --> {sub.end}")
-                print(f"内容: {sub.content[:100]}...")
-                
-                # 检查是否需要中止（移到循环最开始）
-                if self.stop_translation:
-                    print(f"翻译被中止，已完成 {i}/{total_subs} 条字幕")
-                    if translated_subs:  # 如果有已翻译的内容，保存它们
-                        print(f"正在保存 {len(translated_subs)} 条已翻译的字幕...")
-                        self.save_partial_translation(translated_subs, self.input_file, src_lang, dest_lang)
-                        self.message_queue.put({
-                            "type": "status",
-                            "text": f"翻译已中止，已保存 {len(translated_subs)} 条翻译结果"
-                        })
-                    else:
-                        self.message_queue.put({
-                            "type": "status",
-                            "text": "翻译已中止"
-                        })
-                    # 立即发送完成信号
-                    self.message_queue.put({
-                        "type": "complete"
-                    })
-                    print("中止处理完成，退出翻译线程")
-                    return
-                
-                # 初始化默认值，确保每条都有输出
-                translated_text = sub.content  # 默认使用原文
-                was_compressed = False
-                
+            def preprocess(units):
+                nonlocal compressed_count
+                prepared = []
+                for i, count in units:
+                    content = merged_text(store, i, count, src_lang) if count > 1 else store.content(i)
+                    print(f"=== 预处理第 {i + 1}/{total_subs} 条字幕 ===")
+                    print(f"时间: {store.time_range(i)}")
+                    print(f"内容: {content[:100]}...")
+                    try:
+                        # 检查并提取重复字符的核心内容
+                        core_text, has_repetition, repetition_info = compress_repetitive_text(content)
+                        if has_repetition:
+                            compressed_count += 1
+                            print(f"第 {i + 1} 条检测到重复字符，提取核心内容: {content[:30]}... → {core_text[:30]}...")
+                    except Exception as e:
+                        print(f"第 {i + 1} 条预处理出错: {str(e)}，使用原文")
+                        core_text, has_repetition, repetition_info = content, False, None
+                    prepared.append((i, count, core_text, has_repetition, repetition_info))
+                return prepared
+            
+            def translate(batch):
+                texts = [core_text for _, _, core_text, _, _ in batch]
                 try:
-                    original_start = sub.start
-                    original_end = sub.end
-                    original_text = sub.content
-                    
-                    # 第一步：检查并提取重复字符的核心内容
-                    core_text, has_repetition, repetition_info = self.compress_repetitive_text(original_text)
-                    if has_repetition:
-                        compressed_count += 1
-                        print(f"第 {current_progress} 条检测到重复字符，提取核心内容: {original_text[:30]}... → {core_text[:30]}...")
-                    
-                    # 第二步：决定使用哪个文本进行翻译
-                    if has_repetition:
-                        text_to_translate = core_text
-                        print(f"第 {current_progress} 条使用提取的核心内容进行翻译: {core_text[:50]}...")
-                    else:
-                        text_to_translate = original_text
-                        print(f"第 {current_progress} 条使用原文进行翻译: {original_text[:50]}...")
-                    
-                    # 第三步：翻译核心文本
+                    translated_batch = self.translate_cue_batch(texts, src_lang, dest_lang)
+                except Exception as e:
+                    print(f"第 {batch[0][0] + 1}-{batch[-1][0] + 1} 条翻译失败: {str(e)}，使用原文")
+                    translated_batch = [None] * len(batch)
+                return [item + (translated_core,) for item, translated_core in zip(batch, translated_batch)]
+            
+            def reconstruct(items):
+                outputs = []
+                for i, count, core_text, has_repetition, repetition_info, translated_core in items:
+                    current_progress = i + 1
+                    content = merged_text(store, i, count, src_lang) if count > 1 else store.content(i)
+                    # 初始化默认值，确保每条都有输出
+                    translated_text = content  # 默认使用原文
                     try:
-                        translated_core = self.translate_with_ollama(text_to_translate, src_lang, dest_lang)
                         if translated_core and translated_core.strip():
                             print(f"第 {current_progress} 条核心内容翻译成功: {translated_core[:50]}...")
-                            
-                            # 第四步：如果有重复信息，重新组合翻译结果
+                            # 如果有重复信息，重新组合翻译结果
                             if has_repetition and repetition_info:
-                                translated_text = self.reconstruct_with_repetition(translated_core, repetition_info)
+                                translated_text = reconstruct_with_repetition(translated_core, repetition_info)
                                 print(f"第 {current_progress} 条重新组合后: {translated_text[:50]}...")
                             else:
                                 translated_text = translated_core
                         else:
                             print(f"第 {current_progress} 条翻译结果为空，使用原文")
-                            translated_text = original_text
                     except Exception as e:
-                        print(f"第 {current_progress} 条翻译失败: {str(e)}，使用原文")
-                        translated_text = original_text
+                        print(f"第 {current_progress} 条处理过程出错: {str(e)}，使用原文")
+                        translated_text = content
                     
-                except Exception as e:
-                    print(f"第 {current_progress} 条处理过程出错: {str(e)}，使用原文")
-                    translated_text = sub.content
-                
-                # 无论如何都要创建并添加字幕条目，确保不丢失
-                new_index = len(translated_subs) + 1
-                translated_sub = srt.Subtitle(
-                    new_index,
-                    sub.start,
-                    sub.end,
-                    translated_text
-                )
-                translated_subs.append(translated_sub)
-                print(f"第 {current_progress} 条已添加到结果列表，新索引: {new_index}")
-                
-                # 更新进度和预览
-                if compressed_count > 0:
-                    status_suffix = f" (已提取重复内容 {compressed_count} 条)"
-                else:
-                    status_suffix = ""
-                
-                preview_prefix = f"[{current_progress}/{total_subs}]"
-                if has_repetition:
-                    preview_prefix += " [重复内容已提取]"
-                
-                self.message_queue.put({"type": "progress", "value": current_progress})
-                self.message_queue.put({
-                    "type": "status",
-                    "text": f"正在翻译... ({current_progress}/{total_subs}){status_suffix}"
-                })
-                
-                # 显示详细的处理信息
-                if has_repetition and repetition_info:
-                    repetition_desc = []
-                    for info in repetition_info:
-                        if info['type'] == 'continuous':
-                            repetition_desc.append(f"连续重复'{info['char']}'×{info['count']}")
-                        elif info['type'] == 'scattered':
-                            repetition_desc.append(f"分散重复'{info['char']}'×{info['count']}")
+                    # 预览文本也在这里生成，提交阶段只负责按顺序提交
+                    preview_prefix = f"[{current_progress}/{total_subs}]"
+                    if has_repetition and repetition_info:
+                        preview_prefix += " [重复内容已提取]"
+                        preview = f"{preview_prefix} 原文: {content[:50]}...\n提取核心: {core_text[:50]}...\n重复信息: {describe_repetition(repetition_info)}\n译文: {translated_text[:50]}...\n\n"
+                    else:
+                        preview = f"{preview_prefix} 原文: {content[:50]}...\n译文: {translated_text[:50]}...\n\n"
+                    if count == 1:
+                        outputs.append((i, translated_text, preview))
+                        continue
+                    # 整句的译文按原文长度比例分回组内各条
+                    pieces = expand_group(store, i, count, translated_text, src_lang, dest_lang)
+                    outputs.append((i, pieces[0], preview))
+                    for offset in range(1, count):
+                        outputs.append((i + offset, pieces[offset],
+                                        f"[{i + offset + 1}/{total_subs}] [合并断句] 译文: {pieces[offset][:50]}...\n\n"))
+                return outputs
+            
+            def commit(items):
+                nonlocal translated_count
+                for i, translated_text, preview in items:
+                    results[i] = (translated_text, preview)
+                # 按原顺序写入已完成的字幕
+                while translated_count in results:
+                    translated_text, preview = results.pop(translated_count)
+                    # 无论如何都要写入译文，确保不丢失
+                    store.translations[translated_count] = translated_text
+                    translated_count += 1
+                    print(f"第 {translated_count} 条已写入结果")
                     
+                    # 更新进度和预览
+                    status_suffix = f" [并发 {controller.concurrency}×{controller.batch_size}] [队列 {describe_queues(stage.stats for stage in pipeline.stages)}]"
+                    if compressed_count > 0:
+                        status_suffix += f" (已提取重复内容 {compressed_count} 条)"
+                    self.message_queue.put({"type": "progress", "value": translated_count})
+                    self.message_queue.put({
+                        "type": "status",
+                        "text": f"正在翻译... ({translated_count}/{total_subs}){status_suffix}"
+                    })
+                    self.message_queue.put({"type": "preview", "text": preview})
+                return []
+            
+            # 翻译阶段的线程数按并发上限创建，实际同时请求数跟随自动调优；
+            # 它的输入队列保持几批的余量，请求一返回就有下一批可发
+            pipeline.add_stage("预处理", preprocess, workers=1, queue_size=256, batch_size=lambda: 16)
+            pipeline.add_stage("翻译", translate, workers=controller.max_concurrency,
+                               queue_size=controller.max_concurrency * controller.max_batch_size * 2,
+                               batch_size=lambda: controller.batch_size, limit=lambda: controller.concurrency)
+            pipeline.add_stage("重构", reconstruct, workers=1, queue_size=256, batch_size=lambda: 16)
+            pipeline.add_stage("提交", commit, workers=1, queue_size=256, batch_size=lambda: 16)
+            
+            try:
+                pipeline.run(groups, on_tick=controller.maybe_adjust)
+            finally:
+                controller.save()
+                if self.translation_memory:
+                    self.translation_memory.close()
+                    print(f"翻译记忆: {self.translation_memory.describe()}")
+                print("流水线各阶段统计:\n" + format_stage_stats(pipeline.stats))
+            
+            # 检查是否被中止
+            if self.stop_translation:
+                print(f"翻译被中止，已完成 {translated_count}/{total_subs} 条字幕")
+                if translated_count:  # 如果有已翻译的内容，保存它们
+                    print(f"正在保存 {translated_count} 条已翻译的字幕...")
+                    self.save_partial_translation(store, self.input_file, src_lang, dest_lang, translated_count)
                     self.message_queue.put({
-                        "type": "preview",
-                        "text": f"{preview_prefix} 原文: {sub.content[:50]}...\n提取核心: {core_text[:50]}...\n重复信息: {', '.join(repetition_desc)}\n译文: {translated_text[:50]}...\n\n"
+                        "type": "status",
+                        "text": f"翻译已中止，已保存 {translated_count} 条翻译结果"
                     })
                 else:
                     self.message_queue.put({
-                        "type": "preview",
-                        "text": f"{preview_prefix} 原文: {sub.content[:50]}...\n译文: {translated_text[:50]}...\n\n"
+                        "type": "status",
+                        "text": "翻译已中止"
                     })
-                
-                print(f"第 {current_progress} 条处理完成，当前结果列表长度: {len(translated_subs)}")
-            
-            # 翻译完成，保存文件
-            print(f"所有翻译完成，最终结果: {len(translated_subs)} 条字幕")
-            if not self.stop_translation:
-                print("翻译全部完成，正在保存文件...")
-                self.write_srt(translated_subs, self.input_file)
-                final_message = f"翻译完成！共处理 {len(translated_subs)} 条字幕"
-                if compressed_count > 0:
-                    final_message += f"，其中 {compressed_count} 条提取并重构了重复内容"
+                # 立即发送完成信号
                 self.message_queue.put({
-                    "type": "status",
-                    "text": final_message
+                    "type": "complete"
                 })
-                self.message_queue.put({"type": "complete"})
+                print("中止处理完成，退出翻译线程")
+                return
+            
+            # 翻译完成，保存文件
+            print(f"所有翻译完成，最终结果: {translated_count} 条字幕")
+            print("翻译全部完成，正在保存文件...")
+            pipeline.timed("写入", self.write_srt, store, self.input_file)
+            final_message = f"翻译完成！共处理 {translated_count} 条字幕"
+            if compressed_count > 0:
+                final_message += f"，其中 {compressed_count} 条提取并重构了重复内容"
+            if self.translation_memory:
+                final_message += f"；翻译记忆{self.translation_memory.describe()}"
+            if len(groups) < total_subs:
+                translated = pipeline.get_stats("翻译")
+                seconds_per_cue = translated.busy / translated.processed if translated.processed else None
+                merge_summary = describe_merge(groups, total_subs, seconds_per_cue)
+                print(merge_summary)
+                final_message += f"；{merge_summary}"
+            self.message_queue.put({
+                "type": "status",
+                "text": final_message
+            })
+            self.message_queue.put({
+                "type": "preview",
+                "text": ("流水线各阶段统计:\n" + format_stage_stats(pipeline.stats) + "\n"
+                         + self.prompt_stats.describe() + "\n\n")
+            })
+            self.message_queue.put({"type": "complete"})
         except Exception as e:
             print(f"翻译过程发生严重错误: {str(e)}")
             self.message_queue.put({"type": "error", "text": f"翻译失败：{str(e)}"})
@@ -582,55 +887,13 @@ Translate {from_lang} to {to_lang}.
         self.drop_label.config(text=f"已选择文件：{os.path.basename(file_path)}")
 
     def parse_srt(self, file_path):
-        try:
-            # 尝试导入charset_normalizer进行编码检测
-            import charset_normalizer
-            with open(file_path, 'rb') as f:
-                raw = f.read()
-                result = charset_normalizer.from_bytes(raw)
-                encoding = result.best().encoding if result.best() else 'utf-8'
-                print(f"检测到文件编码: {encoding}")
-                content = raw.decode(encoding, errors='replace')
-        except ImportError:
-            print("未安装charset-normalizer，使用备用编码检测方法")
-            # 如果没有charset_normalizer，使用多种编码尝试
-            encodings = ['utf-8', 'gbk', 'shift-jis', 'cp932', 'iso-8859-1']
-            content = None
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    print(f"使用编码 {encoding} 成功读取文件")
-                    break
-                except UnicodeDecodeError:
-                    print(f"编码 {encoding} 读取失败，尝试下一个...")
-                    continue
-            
-            if content is None:
-                print("所有编码尝试失败，使用UTF-8容错模式")
-                # 如果所有编码都失败，使用utf-8并忽略错误
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-        
-        return list(parse(content))
+        return CueStore.from_file(file_path)
 
-    def save_partial_translation(self, translated_subs, input_path, src_lang, dest_lang):
-        """保存部分翻译结果"""
+    def save_partial_translation(self, store, input_path, src_lang, dest_lang, count):
+        """保存部分翻译结果（前count条）"""
         try:
-            lang_map = {'中文': 'zh', '英语': 'en', '日语': 'ja'}
-            from_code = lang_map[src_lang]
-            to_code = lang_map[dest_lang]
-            file_name, file_ext = os.path.splitext(input_path)
-            
-            # 从名称尾部查找原语言映射词并删除
-            if file_name.endswith(from_code):
-                file_name = file_name[:-(len(from_code))]
-            
-            # 加上目标语言映射词和部分标识
-            output_path = file_name + to_code + "_partial" + file_ext
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(compose(translated_subs))
+            output_path = build_output_path(input_path, src_lang, dest_lang, partial=True)
+            store.write(output_path, count)
             
             print(f"部分翻译结果已保存到: {output_path}")
             return output_path
@@ -638,20 +901,11 @@ Translate {from_lang} to {to_lang}.
             print(f"保存部分翻译结果失败: {str(e)}")
             return None
 
-    def write_srt(self, translated_subs, input_path):
+    def write_srt(self, store, input_path):
         src_lang = self.src_lang.get()
         dest_lang = self.dest_lang.get()
-        lang_map = {'中文': 'zh', '英语': 'en', '日语': 'ja'}
-        from_code = lang_map[src_lang]
-        to_code = lang_map[dest_lang]
-        file_name, file_ext = os.path.splitext(input_path)
-        # 从名称尾部查找原语言映射词并删除
-        if file_name.endswith(from_code):
-            file_name = file_name[:-(len(from_code))]
-        # 加上目标语言映射词
-        output_path = file_name + to_code + file_ext
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(compose(translated_subs))
+        output_path = build_output_path(input_path, src_lang, dest_lang)
+        store.write(output_path)
 
     def update_dest_lang(self, event=None):
         src_lang = self.src_lang.get()
@@ -672,6 +926,8 @@ Translate {from_lang} to {to_lang}.
             if result:
                 print("用户确认中止翻译")
                 self.stop_translation = True
+                if self.translation_worker:
+                    self.translation_worker.stop()
                 self.message_queue.put({
                     "type": "status",
                     "text": "正在中止翻译，请稍候..."
@@ -681,6 +937,11 @@ Translate {from_lang} to {to_lang}.
                 # 设置超时，如果线程5秒内没有结束，强制标记为完成
                 def force_complete():
                     time.sleep(5)  # 等待5秒
+                    if self.translation_worker and self.translation_thread.is_alive():
+                        # 子进程可以直接结束，转发线程会通知界面恢复部分结果
+                        print("翻译子进程超时，强制结束")
+                        self.translation_worker.kill()
+                        return
                     if self.translation_thread and self.translation_thread.is_alive():
                         print("翻译线程超时，强制完成")
                         self.message_queue.put({
@@ -695,198 +956,10 @@ Translate {from_lang} to {to_lang}.
                 threading.Thread(target=force_complete, daemon=True).start()
             # 如果用户选择不中止，什么都不做
 
-    def compress_repetitive_text(self, text):
-        """检测重复字符并提取核心内容用于翻译，返回核心内容和重复信息"""
-        if len(text.strip()) < 5:
-            return text, False, None
-        
-        original_text = text
-        repetition_info = []  # 存储重复信息
-        
-        # 第一步：检测短语重复（如：いいよ、いいよ、いいよ、 → いいよ*N）
-        # 检测常见的短语重复模式
-        phrase_patterns = [
-            r'(いいよ[、。，！？\s]*){4,}',  # いいよ重复
-            r'(そう[、。，！？\s]*){4,}',   # そう重复
-            r'(はい[、。，！？\s]*){4,}',   # はい重复
-            r'(ああ[、。，！？\s]*){4,}',   # ああ重复
-            r'(うん[、。，！？\s]*){4,}',   # うん重复
-            r'([^、。，！？\s]{1,3}[、。，！？\s]*)\1{3,}',  # 通用短语重复检测
-        ]
-        
-        for pattern in phrase_patterns:
-            matches = list(re.finditer(pattern, text))
-            if matches:
-                for match in matches:
-                    full_match = match.group(0)
-                    repeated_phrase = match.group(1) if match.groups() else match.group(0)
-                    
-                    # 计算重复次数
-                    count = len(re.findall(re.escape(repeated_phrase.rstrip('、。，！？ \n')), full_match))
-                    
-                    if count >= 4:  # 至少重复4次
-                        repetition_info.append({
-                            'type': 'phrase',
-                            'phrase': repeated_phrase.rstrip('、。，！？ \n'),
-                            'count': count,
-                            'start': match.start(),
-                            'end': match.end()
-                        })
-                        
-                        # 替换为单个短语
-                        core_text = text[:match.start()] + repeated_phrase.rstrip('、。，！？ \n') + text[match.end():]
-                        print(f"检测到短语重复'{repeated_phrase.rstrip('、。，！？ \n')}'×{count}，核心内容: {core_text[:50]}...")
-                        return core_text, True, repetition_info
-        
-        # 第二步：检测连续重复的单字符（如：ああああ → あ*4）
-        pattern = r'(.)\1{3,}'  # 匹配连续重复4次及以上的字符
-        matches = list(re.finditer(pattern, text))
-        
-        if matches:
-            # 找到连续重复，提取重复信息
-            for match in matches:
-                char = match.group(1)
-                count = len(match.group(0))
-                repetition_info.append({
-                    'type': 'continuous',
-                    'char': char,
-                    'count': count,
-                    'start': match.start(),
-                    'end': match.end()
-                })
-            
-            # 移除重复部分，保留核心内容
-            core_text = text
-            for match in reversed(matches):  # 从后往前替换，避免位置偏移
-                core_text = core_text[:match.start()] + match.group(1) + core_text[match.end():]
-            
-            print(f"检测到连续重复，核心内容: {core_text[:50]}...")
-            return core_text, True, repetition_info
-        
-        # 第三步：检测分散的重复字符（如：お、お、お、お → お*8）
-        import collections
-        char_count = collections.Counter(re.sub(r'[、。，！？\s]', '', text))
-        
-        for char, count in char_count.items():
-            if count >= 8:  # 如果某个字符出现8次以上
-                # 找到包含该字符的所有位置
-                pattern = f"{re.escape(char)}[、。，！？\\s]*"
-                matches = list(re.finditer(pattern, text))
-                
-                if len(matches) >= 6:
-                    # 记录重复信息
-                    repetition_info.append({
-                        'type': 'scattered',
-                        'char': char,
-                        'count': len(matches),
-                        'positions': [m.span() for m in matches]
-                    })
-                    
-                    # 移除重复的字符，只保留一个和其他内容
-                    core_text = text
-                    # 简单处理：移除多余的重复字符
-                    core_text = re.sub(f"({re.escape(char)}[、。，！？\\s]*)+", char, core_text)
-                    
-                    print(f"检测到分散重复字符'{char}': 出现{len(matches)}次，核心内容: {core_text[:50]}...")
-                    return core_text, True, repetition_info
-        
-        return text, False, None
-
-    def reconstruct_with_repetition(self, translated_text, repetition_info):
-        """将翻译后的文本与重复信息重新组合"""
-        if not repetition_info:
-            return translated_text
-        
-        result = translated_text
-        
-        for info in repetition_info:
-            if info['type'] == 'phrase':
-                # 短语重复：翻译短语后加上重复次数
-                original_phrase = info['phrase']
-                count = info['count']
-                
-                # 常见短语的翻译映射
-                phrase_translation = {
-                    'いいよ': '好的',
-                    'そう': '对',
-                    'はい': '是的',
-                    'ああ': '啊',
-                    'うん': '嗯'
-                }
-                
-                # 尝试翻译短语
-                if original_phrase in phrase_translation:
-                    translated_phrase = phrase_translation[original_phrase]
-                else:
-                    # 如果翻译结果中包含原短语，保持原样
-                    translated_phrase = original_phrase
-                
-                # 在翻译结果前加上重复标记
-                if original_phrase in result:
-                    result = result.replace(original_phrase, f"{translated_phrase}*{count}", 1)
-                else:
-                    result = f"{translated_phrase}*{count}" + result
-                
-                print(f"重构短语重复: {original_phrase}*{count} → {translated_phrase}*{count}")
-                
-            elif info['type'] == 'continuous':
-                # 连续重复：在翻译结果前加上重复标记
-                original_char = info['char']
-                count = info['count']
-                # 尝试找到原字符对应的翻译字符
-                # 简单处理：如果翻译结果包含对应字符，则添加重复标记
-                if original_char in ['あ', 'お']:
-                    if 'あ' in translated_text or '啊' in translated_text:
-                        result = f"啊*{count}" + result.replace('啊', '')
-                    elif 'お' in translated_text or '哦' in translated_text:
-                        result = f"哦*{count}" + result.replace('哦', '')
-                    else:
-                        # 如果没有找到对应字符，在开头添加
-                        translated_char = '啊' if original_char == 'あ' else '哦' if original_char == 'お' else original_char
-                        result = f"{translated_char}*{count}" + result
-                
-            elif info['type'] == 'scattered':
-                # 分散重复：类似处理
-                original_char = info['char']
-                count = info['count']
-                if original_char in ['あ', 'お']:
-                    translated_char = '啊' if original_char == 'あ' else '哦' if original_char == 'お' else original_char
-                    result = f"{translated_char}*{count}" + result.replace(translated_char, '', 1)
-        
-        return result
-
-    def has_excessive_repetition(self, text):
-        """检测文本是否包含大量重复字符，这类文本容易让LLM卡住"""
-        # 去除标点符号，只检查核心内容
-        clean_text = re.sub(r'[、。，！？\s]', '', text)
-        
-        if len(clean_text) < 5:  # 太短的文本不检测
-            return False
-        
-        # 检测1：单字符重复超过10次
-        for char in set(clean_text):
-            if clean_text.count(char) > 10:
-                print(f"发现字符'{char}'重复{clean_text.count(char)}次")
-                return True
-        
-        # 检测2：相同的2-3字符片段重复超过5次
-        for length in [2, 3]:
-            for i in range(len(clean_text) - length + 1):
-                fragment = clean_text[i:i+length]
-                count = len(re.findall(re.escape(fragment), clean_text))
-                if count > 5:
-                    print(f"发现片段'{fragment}'重复{count}次")
-                    return True
-        
-        # 检测3：字符种类太少（可能全是重复）
-        unique_chars = len(set(clean_text))
-        if len(clean_text) > 50 and unique_chars < 5:
-            print(f"文本长度{len(clean_text)}但只有{unique_chars}种字符")
-            return True
-        
-        return False
-
 if __name__ == "__main__":
-    root = TkinterDnD.Tk()
+    # 打包成exe后子进程需要这一步才能正常启动
+    multiprocessing.freeze_support()
+    # 拖放扩展在窗口显示后由 enable_drag_and_drop 加载
+    root = tk.Tk()
     app = SRTTranslatorApp(root)
     root.mainloop() 
\ No newline at end of file
@@ -0,0 +1,702 @@
+"""基于asyncio的翻译引擎
+
+与 SRTTranslatorApp.translate_srt 的线程版本语义相同（重复内容提取、长文本分块、
+逐条重试、按原顺序输出），但所有请求都在一个事件循环里完成，每个API地址各自限流，
+几百个在途请求也只占用少量系统线程。消息格式与 message_queue 相同，可以直接桥接到Tk。
+"""
+import asyncio
+import collections
+import json
+import os
+import time
+import urllib.parse
+
+import httpx
+
+from cue_merge import group_fragments, merged_text, expand_group, describe_merge
+from cue_store import CueStore
+from pipeline import StageStats, describe_queues, format_stage_stats
+from generation_profiles import GenerationProfile
+from hedging import HedgePolicy
+from throughput_controller import ThroughputController, record_translated
+from translation_memory import TranslationMemory, DEFAULT_REUSE_THRESHOLD, DEFAULT_HINT_THRESHOLD
+from translate_common import (
+    SPECIAL_MODEL, MAX_CHUNK_LENGTH, REQUEST_TIMEOUT, build_output_path,
+    build_checkpoint_path, max_retries_for, build_general_messages, build_batch_messages, parse_batch_response,
+    build_special_prompt, check_special_result, split_text_chunks, join_chunks, PromptEvalStats,
+    compress_repetitive_text, reconstruct_with_repetition, describe_repetition
+)
+
+# 预处理每次在工作线程中处理的条数，以及处理好等待派发的条数上限
+PREPROCESS_CHUNK = 32
+READY_QUEUE_SIZE = 256
+
+
+class Endpoint:
+    """一个Ollama地址，在途请求数不超过其自动调优给出的并发上限；
+    生成参数方案按地址分开，各地址上的模型按各自加载时的num_ctx继续用下去"""
+
+    def __init__(self, url, controller, profile):
+        self.url = url
+        self.controller = controller
+        self.profile = profile
+        self.in_flight = 0
+
+    @property
+    def free_slots(self):
+        return self.controller.concurrency - self.in_flight
+
+
+class ClientPool:
+    """每个在途请求独占一个只有一条连接的 httpx.AsyncClient，用完按服务地址放回，下次复用这条连接。
+    几百个请求共用一个客户端时，httpx 的连接池每分配一个请求都要遍历所有连接，
+    而且同一时刻发出的几个请求会被分到同一条空闲连接上，除第一个外都要等到别的请求结束才重新分配"""
+
+    def __init__(self):
+        # 创建客户端时载入证书很慢，所有客户端共用一份
+        self.ssl_context = httpx.create_ssl_context()
+        self.idle = collections.defaultdict(list)
+        self.clients = []
+
+    async def post(self, url, **kwargs):
+        netloc = urllib.parse.urlsplit(url).netloc
+        idle = self.idle[netloc]
+        client = idle.pop() if idle else self.open_client()
+        try:
+            return await client.post(url, **kwargs)
+        finally:
+            idle.append(client)
+
+    def open_client(self):
+        client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT, verify=self.ssl_context,
+                                   limits=httpx.Limits(max_connections=1, max_keepalive_connections=1))
+        self.clients.append(client)
+        return client
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+
+async def start_contexts(endpoints):
+    """各地址的生成参数方案从模型当前加载时的上下文开始，避免第一个请求就让Ollama重新加载模型"""
+    await asyncio.gather(*(asyncio.to_thread(endpoint.profile.start_context) for endpoint in endpoints))
+
+
+class SharedConnections:
+    """同一事件循环中的多个引擎（如守护进程中同时运行的任务）共用的API地址、并发名额和HTTP连接，
+    各任务的在途请求合计不超过自动调优给出的并发数，连接在任务之间保持"""
+
+    def __init__(self, api_urls, model, use_special_model=False, generation_profile=None):
+        self.model = model
+        self.endpoints = [Endpoint(url, ThroughputController.load(url, model, allow_batching=not use_special_model),
+                                   GenerationProfile.for_model(model, generation_profile, url))
+                          for url in api_urls]
+        self.slot_changed = asyncio.Condition()
+        self.client = ClientPool()
+
+    async def close(self):
+        await self.client.aclose()
+        for endpoint in self.endpoints:
+            endpoint.controller.save()
+
+
+class AsyncTranslationEngine:
+    def __init__(self, input_file, src_lang, dest_lang, api_urls, model, use_special_model=False,
+                 emit=None, should_stop=None, concurrency=None, batch_size=None,
+                 checkpoint=False, resume=False, use_memory=False,
+                 reuse_threshold=DEFAULT_REUSE_THRESHOLD, hint_threshold=DEFAULT_HINT_THRESHOLD,
+                 hedge=False, hedge_budget=0.05, merge_fragments=False, generation_profile=None,
+                 shared=None, memory=None):
+        self.input_file = input_file
+        self.src_lang = src_lang
+        self.dest_lang = dest_lang
+        self.use_special_model = use_special_model
+        self.model = SPECIAL_MODEL if use_special_model else model
+        self.emit = emit or (lambda message: None)
+        self.should_stop = should_stop or (lambda: False)
+        # 每完成一条就追加到进度文件，进程崩溃后可以从断点继续
+        self.checkpoint_path = build_checkpoint_path(input_file, src_lang, dest_lang) if checkpoint else None
+        self.resume = resume
+        self.checkpoint_file = None
+        self.use_memory = use_memory
+        self.memory_thresholds = {"reuse_threshold": reuse_threshold, "hint_threshold": hint_threshold}
+        # 由调用方传入的翻译记忆（守护进程中各任务共用）不在结束时关闭
+        self.memory = memory
+        self.owns_memory = memory is None
+        # 慢请求对冲，None表示不对冲
+        self.hedge_policy = HedgePolicy(budget=hedge_budget) if hedge else None
+        # 合并断句的字幕：第一条的序号 -> 条数，只记录多于一条的组；组内其余各条不单独翻译
+        self.merge_fragments = merge_fragments
+        self.prompt_stats = PromptEvalStats()
+        self.groups = {}
+        self.followers = set()
+
+        # 指定了并发数/批大小时使用固定值（基准测试用），否则自动调优
+        self.autotune = concurrency is None
+        self.shared = shared
+        self.endpoints = list(shared.endpoints) if shared else []
+        for url in ([] if shared else api_urls):
+            if self.autotune:
+                controller = ThroughputController.load(url, self.model, allow_batching=not use_special_model)
+            else:
+                controller = ThroughputController(url, self.model, concurrency=concurrency,
+                                                  batch_size=batch_size or 1, max_concurrency=concurrency,
+                                                  allow_batching=not use_special_model)
+            # 生成参数方案，None时使用该模型保存的方案；共用连接时使用 SharedConnections 的方案
+            profile = GenerationProfile.for_model(self.model, generation_profile, url)
+            self.endpoints.append(Endpoint(url, controller, profile))
+
+        self.client = None
+        self.slot_changed = None
+        self.store = CueStore()
+        self.prepared = {}
+        self.results = {}
+        self.done_count = 0  # 已按顺序完成的条数，译文直接填入store
+        self.compressed_count = 0
+        # 预处理好的字幕序号，翻译按此队列派发；有上限，预处理只领先一段
+        self.ready = None
+        self.stats = {
+            "解析": StageStats("解析"),
+            "预处理": StageStats("预处理"),
+            "翻译": StageStats("翻译", sum(e.controller.max_concurrency for e in self.endpoints),
+                              lambda: self.ready.qsize() if self.ready else 0),
+            "提交": StageStats("提交", depth=lambda: len(self.results)),
+            "写入": StageStats("写入"),
+        }
+
+    async def run(self):
+        try:
+            start = time.time()
+            store = await asyncio.to_thread(self.load_subtitles)
+            self.stats["解析"].record(1, time.time() - start)
+            if self.use_memory and self.memory is None:
+                self.memory = await asyncio.to_thread(
+                    TranslationMemory.open, self.src_lang, self.dest_lang, **self.memory_thresholds)
+            total_subs = len(store)
+            print(f"开始翻译(异步引擎)，总共 {total_subs} 条字幕，{len(self.endpoints)} 个API地址")
+            self.emit({"type": "progress", "value": 0, "maximum": total_subs})
+            self.emit({"type": "status", "text": f"正在翻译... (0/{total_subs})"})
+
+            if self.checkpoint_path:
+                self.open_checkpoint()
+            if self.merge_fragments:
+                start = time.time()
+                groups = group_fragments(store, self.done_count)
+                self.groups = {first: count for first, count in groups if count > 1}
+                self.followers = {i for first, count in self.groups.items() for i in range(first + 1, first + count)}
+                self.stats["预处理"].record(0, time.time() - start)
+
+            if not self.shared:
+                await start_contexts(self.endpoints)
+            if self.shared:
+                self.slot_changed = self.shared.slot_changed
+                self.client = self.shared.client
+                await self.dispatch_all()
+            else:
+                self.slot_changed = asyncio.Condition()
+                self.client = ClientPool()
+                try:
+                    await self.dispatch_all()
+                finally:
+                    await self.client.aclose()
+
+            if self.should_stop():
+                self.finish_stopped()
+                return
+
+            print(f"所有翻译完成，最终结果: {self.done_count} 条字幕")
+            output_path = build_output_path(self.input_file, self.src_lang, self.dest_lang)
+            start = time.time()
+            await asyncio.to_thread(self.write_subtitles, output_path)
+            self.stats["写入"].record(1, time.time() - start)
+            self.remove_checkpoint()
+            final_message = f"翻译完成！共处理 {self.done_count} 条字幕"
+            if self.compressed_count > 0:
+                final_message += f"，其中 {self.compressed_count} 条提取并重构了重复内容"
+            if self.memory:
+                final_message += f"；翻译记忆{self.memory.describe()}"
+            if self.hedge_policy:
+                print(f"对冲请求: {self.hedge_policy.describe()}")
+                final_message += f"；{self.hedge_policy.describe()}"
+            if self.groups:
+                translated = self.stats["翻译"]
+                seconds_per_cue = translated.busy / translated.processed if translated.processed else None
+                merge_summary = describe_merge(self.groups.items(), total_subs, seconds_per_cue)
+                print(merge_summary)
+                final_message += f"；{merge_summary}"
+            summary = format_stage_stats(self.stats.values()) + "\n" + self.prompt_stats.describe()
+            for endpoint in self.endpoints:
+                print(f"{endpoint.url} {endpoint.profile.describe()}")
+            print("流水线各阶段统计:\n" + summary)
+            self.emit({"type": "status", "text": final_message})
+            self.emit({"type": "preview", "text": "流水线各阶段统计:\n" + summary + "\n\n"})
+            self.emit({"type": "complete"})
+        except Exception as e:
+            print(f"翻译过程发生严重错误: {str(e)}")
+            self.emit({"type": "error", "text": f"翻译失败：{str(e)}"})
+        finally:
+            if self.checkpoint_file:
+                self.checkpoint_file.close()
+                self.checkpoint_file = None
+            if self.memory and self.owns_memory:
+                self.memory.close()
+            # 共用的地址由 SharedConnections 在关闭时保存调优结果
+            if self.autotune and not self.shared:
+                for endpoint in self.endpoints:
+                    endpoint.controller.save()
+
+    def load_subtitles(self):
+        self.store = CueStore.from_file(self.input_file)
+        return self.store
+
+    def write_subtitles(self, output_path):
+        return self.store.write(output_path, self.done_count)
+
+    def unit_text(self, i):
+        """第i条字幕实际要翻译的原文，合并组的第一条为整句"""
+        if i in self.groups:
+            return merged_text(self.store, i, self.groups[i], self.src_lang)
+        return self.store.content(i)
+
+    def prepare_range(self, start, end):
+        """提取字幕的重复内容，得到实际要翻译的核心文本"""
+        for i in range(start, end):
+            if i in self.followers:
+                continue
+            content = self.unit_text(i)
+            try:
+                core_text, has_repetition, repetition_info = compress_repetitive_text(content)
+                if has_repetition:
+                    self.compressed_count += 1
+            except Exception as e:
+                print(f"第 {i + 1} 条预处理出错: {str(e)}，使用原文")
+                core_text, has_repetition, repetition_info = content, False, None
+            self.prepared[i] = (core_text, has_repetition, repetition_info)
+
+    def checkpoint_header(self):
+        return {"input_file": os.path.abspath(self.input_file), "src_lang": self.src_lang,
+                "dest_lang": self.dest_lang, "model": self.model, "total": len(self.store)}
+
+    def open_checkpoint(self):
+        """继续翻译时读入已完成的部分，然后以追加方式打开进度文件"""
+        header = self.checkpoint_header()
+        done = load_checkpoint(self.checkpoint_path, header) if self.resume else None
+        if done:
+            for i, translated_text in enumerate(done):
+                self.store.translations[i] = translated_text
+            self.done_count = len(done)
+            print(f"从进度文件继续翻译，已完成 {len(done)} 条")
+            self.emit({"type": "progress", "value": len(done)})
+            self.checkpoint_file = open(self.checkpoint_path, 'a', encoding='utf-8')
+        else:
+            self.checkpoint_file = open(self.checkpoint_path, 'w', encoding='utf-8')
+            self.checkpoint_file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            self.checkpoint_file.flush()
+
+    def remove_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        if self.checkpoint_file:
+            self.checkpoint_file.close()
+            self.checkpoint_file = None
+        try:
+            os.remove(self.checkpoint_path)
+        except OSError:
+            pass
+
+    async def preprocess_all(self):
+        """在工作线程中分段预处理，处理好的序号放入有上限的队列；队列满时等待派发"""
+        total_subs = len(self.store)
+        try:
+            for start in range(self.done_count, total_subs, PREPROCESS_CHUNK):
+                if self.should_stop():
+                    break
+                end = min(total_subs, start + PREPROCESS_CHUNK)
+                began = time.time()
+                await asyncio.to_thread(self.prepare_range, start, end)
+                self.stats["预处理"].record(end - start, time.time() - began)
+                for i in range(start, end):
+                    if i not in self.followers:
+                        await self.ready.put(i)
+        finally:
+            await self.ready.put(None)
+
+    async def take_batch(self, batch_size):
+        """取出最多batch_size条已预处理的字幕，至少等到一条；没有剩余时返回空列表"""
+        first = await self.ready.get()
+        if first is None:
+            self.ready.put_nowait(None)
+            return []
+        batch = [first]
+        while len(batch) < batch_size and not self.ready.empty():
+            i = self.ready.get_nowait()
+            if i is None:
+                self.ready.put_nowait(None)
+                break
+            batch.append(i)
+        return batch
+
+    async def dispatch_all(self):
+        """按各地址的空闲并发数派发请求，中止时取消所有在途请求"""
+        self.ready = asyncio.Queue(maxsize=READY_QUEUE_SIZE)
+        producer = asyncio.create_task(self.preprocess_all())
+        tasks = set()
+        while not self.should_stop():
+            endpoint = await self.acquire_endpoint()
+            if endpoint is None:
+                continue
+            batch = await self.take_batch(endpoint.controller.batch_size)
+            if not batch:
+                await self.release_endpoint(endpoint)
+                break
+            task = asyncio.create_task(self.run_batch(endpoint, batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        producer.cancel()
+        while tasks:
+            if self.should_stop():
+                for task in tasks:
+                    task.cancel()
+            await asyncio.wait(set(tasks), timeout=0.5)
+
+    async def acquire_endpoint(self):
+        """选出空闲并发最多的地址并占用一个名额，等待最多0.5秒以便检查中止信号"""
+        async with self.slot_changed:
+            try:
+                await asyncio.wait_for(
+                    self.slot_changed.wait_for(lambda: any(e.free_slots > 0 for e in self.endpoints)), 0.5)
+            except asyncio.TimeoutError:
+                return None
+            return self.take_free_endpoint()
+
+    def take_free_endpoint(self):
+        """不等待：有空闲名额时占用空闲并发最多的地址的一个名额，没有时返回None"""
+        endpoint = max(self.endpoints, key=lambda e: e.free_slots)
+        if endpoint.free_slots <= 0:
+            return None
+        endpoint.in_flight += 1
+        return endpoint
+
+    async def release_endpoint(self, endpoint):
+        async with self.slot_changed:
+            endpoint.in_flight -= 1
+            self.slot_changed.notify_all()
+
+    async def run_batch(self, endpoint, batch):
+        start = time.time()
+        try:
+            texts = [self.prepared[i][0] for i in batch]
+            try:
+                translated_batch = await self.translate_batch(endpoint, texts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"第 {batch[0] + 1}-{batch[-1] + 1} 条翻译失败: {str(e)}，使用原文")
+                translated_batch = [None] * len(batch)
+        finally:
+            self.stats["翻译"].record(len(batch), time.time() - start)
+            await self.release_endpoint(endpoint)
+
+        for i, translated_core in zip(batch, translated_batch):
+            self.results[i] = translated_core
+        if self.autotune:
+            endpoint.controller.maybe_adjust()
+        self.flush_results()
+
+    async def translate_batch(self, endpoint, texts):
+        """翻译一批字幕：先查翻译记忆，几乎相同的直接复用，相似的以记忆为参考逐条翻译，其余的交给模型批量翻译"""
+        memory = self.memory
+        results = [None] * len(texts)
+        plain = []
+        for n, text in enumerate(texts):
+            match = memory.lookup(text) if memory else None
+            if memory and memory.can_reuse(match):
+                results[n] = match.translation
+            elif match and not self.use_special_model:
+                start = time.time()
+                results[n], translated = await self.translate_text(endpoint, text, hint=match)
+                if translated:
+                    endpoint.controller.record_success(1, time.time() - start)
+                memory.add(text, results[n])
+            else:
+                plain.append(n)
+
+        if plain:
+            translated = await self.translate_with_model(endpoint, [texts[n] for n in plain])
+            for n, translated_text in zip(plain, translated):
+                results[n] = translated_text
+                if memory:
+                    memory.add(texts[n], translated_text)
+        return results
+
+    async def translate_with_model(self, endpoint, texts):
+        """翻译一批字幕并把耗时反馈给自动调优；批量失败时退回逐条翻译"""
+        controller = endpoint.controller
+        start = time.time()
+        if len(texts) > 1 and all(len(text) <= MAX_CHUNK_LENGTH for text in texts):
+            try:
+                messages = build_batch_messages(texts, self.src_lang, self.dest_lang)
+                length = sum(len(text) for text in texts)
+                results = await self.hedged(
+                    endpoint, length,
+                    lambda target: self.chat(target, messages, timeout=REQUEST_TIMEOUT + len(texts),
+                                             extra=target.profile.payload("batch", messages, length, len(texts)),
+                                             cues=len(texts)),
+                    lambda content: parse_batch_response(content, len(texts)))
+                controller.record_success(len(texts), time.time() - start)
+                return results
+            except Exception as e:
+                print(f"批量翻译失败，改为逐条翻译: {str(e)}")
+                controller.record_error(e)
+                start = time.time()
+
+        outcomes = [await self.translate_text(endpoint, text) for text in texts]
+        record_translated(controller, outcomes, time.time() - start)
+        return [result for result, _ in outcomes]
+
+    async def translate_text(self, endpoint, text, hint=None):
+        """单条翻译，重试与长文本规则和线程版本的 translate_with_ollama 相同；hint为参考的翻译记忆。
+        返回 (译文, 是否翻译成功)，中止或多次失败时译文为原文"""
+        if self.should_stop():
+            return text, False
+
+        # 超长文本按句子切分，各块并发翻译后按原顺序重组
+        if len(text) > MAX_CHUNK_LENGTH:
+            lines = split_text_chunks(text)
+            chunks = [chunk.strip() for line in lines for chunk in line if chunk.strip()]
+            if not chunks:
+                return text, False
+            print(f"文本过长({len(text)}字符)，切分为 {len(chunks)} 块并发翻译: {text[:50]}...")
+            outcomes = await self.translate_chunks(endpoint, chunks)
+            return (join_chunks(lines, [result for result, _ in outcomes], self.dest_lang),
+                    all(translated for _, translated in outcomes))
+
+        max_retries = max_retries_for(text)
+        for attempt in range(max_retries):
+            if self.should_stop():
+                return text, False
+            try:
+                if self.use_special_model:
+                    prompt = build_special_prompt(text, self.src_lang, self.dest_lang)
+                    messages = [{"role": "user", "content": prompt}]
+                    return await self.hedged(
+                        endpoint, len(text),
+                        lambda target: self.chat(target, messages,
+                                                 extra=target.profile.payload("special", prompt, len(text))),
+                        lambda content: check_special_result(text, content.strip())), True
+                messages = build_general_messages(text, self.src_lang, self.dest_lang, hint)
+                return await self.hedged(
+                    endpoint, len(text),
+                    lambda target: self.chat(target, messages, extra=target.profile.payload("single", messages, len(text))),
+                    lambda content: content.strip()), True
+            except Exception as e:
+                print(f"翻译尝试 {attempt + 1} 失败: {type(e).__name__} {str(e)}")
+                endpoint.controller.record_error(e)
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(1)
+                    continue
+                print(f"翻译多次失败，返回原文: {text[:50]}...")
+                return text, False
+
+    async def translate_chunks(self, endpoint, chunks):
+        """长文本的各块依次用这条字幕已占用的名额翻译，有空闲名额时再占用名额并发翻译；
+        不等待名额，以免各批都占着名额互相等待"""
+        outcomes = [None] * len(chunks)
+        remaining = collections.deque(range(len(chunks)))
+
+        async def worker(target, owned):
+            try:
+                while remaining:
+                    n = remaining.popleft()
+                    outcomes[n] = await self.translate_text(target, chunks[n])
+            finally:
+                if owned:
+                    await self.release_endpoint(target)
+
+        workers = [worker(endpoint, False)]
+        for _ in range(len(chunks) - 1):
+            extra = self.take_free_endpoint()
+            if extra is None:
+                break
+            workers.append(worker(extra, True))
+        await asyncio.gather(*workers)
+        return outcomes
+
+    async def hedged(self, endpoint, size, request, parse):
+        """发送请求并解析结果；开启对冲时，超过同长度档位p95仍未返回就再发一份，采用先得到的有效结果"""
+        policy = self.hedge_policy
+        if policy is None:
+            return parse(await request(endpoint))
+
+        async def attempt(target, is_primary):
+            began = time.time()
+            try:
+                result = parse(await request(target))
+            except asyncio.CancelledError:
+                # 主请求被取消时已运行的时间是它延迟的下限，不计入的话慢请求从样本中消失，p95越来越低；
+                # 备份请求被取消时只运行了一小段，不计入
+                if is_primary:
+                    policy.record_latency(length_class, time.time() - began)
+                raise
+            except Exception:
+                policy.record_latency(length_class, time.time() - began)
+                policy.record_failure()
+                raise
+            policy.record_latency(length_class, time.time() - began)
+            return result
+
+        policy.record_request()
+        length_class = policy.length_class(size)
+        began = time.time()
+        primary = asyncio.create_task(attempt(endpoint, True))
+        pending = {primary}
+        backup = backup_endpoint = None
+        error = None
+        try:
+            delay = policy.hedge_delay(length_class)
+            if delay is not None:
+                await asyncio.wait(pending, timeout=delay)
+                if not primary.done() and policy.try_hedge():
+                    backup_endpoint = self.pick_backup_endpoint(endpoint)
+                    backup_endpoint.in_flight += 1
+                    backup = asyncio.create_task(attempt(backup_endpoint, False))
+                    pending.add(backup)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            # 节省的时间是主请求还要多久才能返回，按同档位的慢请求估计
+                            policy.record_win(policy.estimate_remaining(length_class, time.time() - began))
+                        return task.result()
+                    # 结果无效或出错时，等另一份请求
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if backup_endpoint is not None:
+                await self.release_endpoint(backup_endpoint)
+
+    def pick_backup_endpoint(self, endpoint):
+        """备份请求发到空闲并发最多的地址，一样多时优先其他地址；都已占满时也发送，额外负载由对冲预算限制"""
+        return max(self.endpoints, key=lambda e: (e.free_slots, e is not endpoint))
+
+    async def chat(self, endpoint, messages, timeout=REQUEST_TIMEOUT, extra=None, cues=1):
+        """extra为生成参数方案给出的 options/keep_alive；cues为这次请求翻译的字幕条数，用于统计提示词评估"""
+        response = await self.client.post(
+            f"{endpoint.url}/api/chat",
+            json={"model": self.model, "messages": messages, "stream": False, **(extra or {})},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        self.prompt_stats.record(data, cues)
+        return data["message"]["content"]
+
+    def flush_results(self):
+        """把已经连续完成的字幕按原顺序加入结果并通知界面"""
+        total_subs = len(self.store)
+        start = time.time()
+        flushed = 0
+        while self.done_count in self.results:
+            i = self.done_count
+            current_progress = i + 1
+            content = self.unit_text(i)
+            core_text, has_repetition, repetition_info = self.prepared.pop(i)
+            translated_core = self.results.pop(i)
+
+            translated_text = content  # 默认使用原文
+            try:
+                if translated_core and translated_core.strip():
+                    if has_repetition and repetition_info:
+                        translated_text = reconstruct_with_repetition(translated_core, repetition_info)
+                    else:
+                        translated_text = translated_core
+            except Exception as e:
+                print(f"第 {current_progress} 条处理过程出错: {str(e)}，使用原文")
+
+            if i in self.groups:
+                # 整句的译文按原文长度比例分回组内各条，其余各条随后按同样的流程写入
+                count = self.groups[i]
+                pieces = expand_group(self.store, i, count, translated_text, self.src_lang, self.dest_lang)
+                translated_text = pieces[0]
+                for offset in range(1, count):
+                    self.prepared[i + offset] = (self.store.content(i + offset), False, None)
+                    self.results[i + offset] = pieces[offset]
+
+            self.store.translations[i] = translated_text
+            self.done_count += 1
+            flushed += 1
+            if self.checkpoint_file:
+                self.checkpoint_file.write(json.dumps({"i": i, "text": translated_text}, ensure_ascii=False) + "\n")
+
+            in_flight = sum(e.in_flight for e in self.endpoints)
+            queues = describe_queues([self.stats["翻译"], self.stats["提交"]])
+            status_suffix = f" [在途请求 {in_flight}] [队列 {queues}]"
+            if self.compressed_count > 0:
+                status_suffix += f" (已提取重复内容 {self.compressed_count} 条)"
+            preview_prefix = f"[{current_progress}/{total_subs}]"
+            if has_repetition:
+                preview_prefix += " [重复内容已提取]"
+
+            self.emit({"type": "progress", "value": current_progress})
+            self.emit({"type": "status", "text": f"正在翻译... ({current_progress}/{total_subs}){status_suffix}"})
+            if has_repetition and repetition_info:
+                self.emit({
+                    "type": "preview",
+                    "text": f"{preview_prefix} 原文: {content[:50]}...\n提取核心: {core_text[:50]}...\n重复信息: {describe_repetition(repetition_info)}\n译文: {translated_text[:50]}...\n\n"
+                })
+            else:
+                self.emit({
+                    "type": "preview",
+                    "text": f"{preview_prefix} 原文: {content[:50]}...\n译文: {translated_text[:50]}...\n\n"
+                })
+        if self.checkpoint_file:
+            self.checkpoint_file.flush()
+        self.stats["提交"].record(flushed, time.time() - start)
+
+    def finish_stopped(self):
+        """中止时保存已按顺序完成的部分"""
+        print(f"翻译被中止，已完成 {self.done_count}/{len(self.store)} 条字幕")
+        if self.done_count:
+            output_path = build_output_path(self.input_file, self.src_lang, self.dest_lang, partial=True)
+            try:
+                self.write_subtitles(output_path)
+                print(f"部分翻译结果已保存到: {output_path}")
+            except Exception as e:
+                print(f"保存部分翻译结果失败: {str(e)}")
+            self.emit({"type": "status", "text": f"翻译已中止，已保存 {self.done_count} 条翻译结果"})
+        else:
+            self.emit({"type": "status", "text": "翻译已中止"})
+        self.emit({"type": "complete"})
+
+
+def load_checkpoint(checkpoint_path, header=None):
+    """读取进度文件中按顺序完成的译文；与当前任务不匹配或不存在时返回None"""
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            lines = f.read().split("\n")
+    except OSError:
+        return None
+    try:
+        saved_header = json.loads(lines[0])
+    except (ValueError, IndexError):
+        return None
+    if header is not None and saved_header != header:
+        print("进度文件与当前任务不匹配，重新开始翻译")
+        return None
+
+    done = []
+    for line in lines[1:]:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # 崩溃时最后一行可能只写了一半
+            break
+        if entry.get("i") != len(done):
+            break
+        done.append(entry["text"])
+    return done
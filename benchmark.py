@@ -0,0 +1,887 @@
+"""离线性能基准，所有场景都在本地Ollama替身服务(fake_ollama.py)上运行，不需要GPU
+
+用法:
+    python benchmark.py controller --slots 4     # 验证自动调优能否收敛到替身服务的容量
+    python benchmark.py engines                  # 比较线程版本与异步引擎在高并发下的吞吐和线程数
+    python benchmark.py memory --cues 50000      # 比较 srt.Subtitle 列表与 CueStore 的内存峰值
+    python benchmark.py pipeline --cues 20000    # 各流水线阶段的队列深度和忙碌时间
+    python benchmark.py tm --entries 200000      # 翻译记忆的查询耗时和近似句命中率
+    python benchmark.py startup --tags-delay 3   # 启动到可操作的时间（无缓存/有缓存的模型列表）
+    python benchmark.py hedge --stall-rate 0.02  # 有请求偶尔卡住时，对冲请求对延迟分位数的影响
+    python benchmark.py replay --speed 1 4 0     # 录制一次翻译，按不同倍速回放，检查结果逐字节相同
+    python benchmark.py replay --cassette run.cassette.gz --input run_ja.srt --model qwen2.5:7b
+    python benchmark.py merge --sentences 300    # 语音识别式断句字幕合并前后的请求数和耗时
+    python benchmark.py profiles --chatter 60    # 各生成参数方案的输出token数和速度
+    python benchmark.py prompts --cues 600       # 固定提示词前缀前后每条字幕的提示词评估token数和耗时
+    python benchmark.py daemon --max-jobs 1 2 4  # 多个客户端同时向守护进程提交任务时的吞吐和各客户端的等待
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from cue_merge import describe_merge
+from cue_store import CueStore, format_timestamp
+from fake_ollama import FakeOllamaServer
+from pipeline import format_stage_stats
+from throughput_controller import ThroughputController
+from translation_memory import Match, TranslationMemory, normalize, ngrams
+
+SAMPLE_LINES = [
+    "今日はとても良い天気ですね。",
+    "新しいプロジェクトを始めることになりました。",
+    "このレストランの料理は本当に美味しいです。",
+    "来週の会議の準備を進めています。",
+    "最近、新しい趣味を見つけました。",
+]
+
+
+def post_json(url, payload, timeout):
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--slots", type=int, default=4, help="替身服务同时处理的请求数")
+    parser.add_argument("--base-latency", type=float, default=0.2)
+    parser.add_argument("--per-cue-latency", type=float, default=0.03)
+    parser.add_argument("--contention", type=float, default=0.15)
+    parser.add_argument("--max-queue", type=int, default=16)
+    parser.add_argument("--tags-delay", type=float, default=0.0, help="模型列表接口的延迟(秒)")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="请求卡住的概率")
+    parser.add_argument("--stall-time", type=float, default=10.0, help="卡住的请求额外耗时(秒)")
+
+
+def start_server(args):
+    return FakeOllamaServer(slots=args.slots, base_latency=args.base_latency,
+                            per_cue_latency=args.per_cue_latency, contention=args.contention,
+                            max_queue=args.max_queue, tags_delay=args.tags_delay,
+                            stall_rate=args.stall_rate, stall_time=args.stall_time).start()
+
+
+def run_controller(args):
+    """用自动调优驱动请求，检查收敛到的并发数/批大小和吞吐"""
+    server = start_server(args)
+    controller = ThroughputController(server.url, "fake-model:latest", concurrency=args.start_concurrency,
+                                      batch_size=1, allow_batching=not args.no_batching)
+    total = args.cues
+    next_index = 0
+    done_cues = 0
+    retry_cues = 0
+    start = time.time()
+
+    def send(texts):
+        request_start = time.time()
+        # 与翻译引擎相同的固定前缀对话
+        path, payload = stable_payload("single" if len(texts) == 1 else "batch", texts, None)
+        try:
+            post_json(f"{server.url}{path}", payload, args.timeout)
+            controller.record_success(len(texts), time.time() - request_start)
+            return len(texts), len(texts)
+        except (urllib.error.URLError, OSError) as e:
+            controller.record_error(e)
+            return len(texts), 0
+
+    with ThreadPoolExecutor(max_workers=controller.max_concurrency) as executor:
+        pending = set()
+        while done_cues < total:
+            while (next_index < total or retry_cues) and len(pending) < controller.concurrency:
+                if retry_cues:
+                    # 失败的请求整批重发
+                    size = min(retry_cues, controller.batch_size)
+                    retry_cues -= size
+                else:
+                    size = min(total - next_index, controller.batch_size)
+                    next_index += size
+                batch = [SAMPLE_LINES[i % len(SAMPLE_LINES)] for i in range(size)]
+                pending.add(executor.submit(send, batch))
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                sent, translated = future.result()
+                done_cues += translated
+                retry_cues += sent - translated
+            controller.maybe_adjust()
+
+    elapsed = time.time() - start
+    server.stop()
+
+    print(f"\n{'并发':>4} {'每批':>4} {'条/秒':>8} {'平均延迟':>8} {'过载率':>6}")
+    for row in controller.history:
+        print(f"{row['concurrency']:>6} {row['batch_size']:>6} {row['cues_per_sec']:>10.2f} "
+              f"{row['avg_latency']:>10.2f} {row['overload_rate']:>8.0%}")
+    print(f"\n替身服务容量: slots={args.slots}")
+    print(f"最佳设置: 并发 {controller.best['concurrency']}，每批 {controller.best['batch_size']}，"
+          f"{controller.best['throughput']:.2f} 条/秒")
+    print(f"总计 {total} 条，耗时 {elapsed:.1f} 秒，平均 {total / elapsed:.2f} 条/秒")
+    return controller
+
+
+def write_sample_srt(path, count):
+    """生成指定条数的测试字幕"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            start, end = i * 2000, i * 2000 + 1500
+            f.write(f"{i + 1}\n{format_timestamp(start)} --> {format_timestamp(end)}\n"
+                    f"{SAMPLE_LINES[i % len(SAMPLE_LINES)]}\n\n")
+    return path
+
+
+def write_fragmented_srt(path, count, seed=1):
+    """生成语音识别式的字幕：每句话随机切成1~4条首尾相接的短字幕"""
+    rng = random.Random(seed)
+    position = 0
+    index = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            line = SAMPLE_LINES[i % len(SAMPLE_LINES)]
+            parts = rng.randint(1, 4)
+            bounds = [round(len(line) * n / parts) for n in range(parts + 1)]
+            for n in range(parts):
+                duration = 300 * (bounds[n + 1] - bounds[n])
+                index += 1
+                f.write(f"{index}\n{format_timestamp(position)} --> {format_timestamp(position + duration)}\n"
+                        f"{line[bounds[n]:bounds[n + 1]]}\n\n")
+                position += duration
+            position += 1000  # 句与句之间停顿1秒
+    return path
+
+
+class ThreadSampler:
+    """后台采样进程内的线程数峰值"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+
+    def __enter__(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+
+    def _sample(self):
+        while self.running:
+            # 不计入采样线程本身
+            self.peak = max(self.peak, threading.active_count() - 1)
+            time.sleep(self.interval)
+
+
+def start_server_process(args, port):
+    """替身服务放在独立进程中，避免它的线程计入被测进程"""
+    process = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ollama.py"),
+        "--port", str(port), "--slots", str(args.slots), "--base-latency", str(args.base_latency),
+        "--per-cue-latency", str(args.per_cue_latency), "--contention", str(args.contention),
+        "--max-queue", str(args.max_queue), "--tags-delay", str(args.tags_delay),
+        "--stall-rate", str(args.stall_rate), "--stall-time", str(args.stall_time)], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/stats", timeout=1).close()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("替身服务启动失败")
+
+
+class Setting:
+    """界面控件的替身，只提供 get()"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def fixed_controller(concurrency):
+    """并发数固定为concurrency、逐条翻译、不自动调优的 ThroughputController，替换界面使用的类"""
+    class FixedController(ThroughputController):
+        @classmethod
+        def load(cls, endpoint, model, **kwargs):
+            return cls(endpoint, model, concurrency=concurrency, batch_size=1, max_concurrency=concurrency, **kwargs)
+
+        def maybe_adjust(self):
+            return False
+    return FixedController
+
+
+def run_thread_engine(input_path, url, model, concurrency):
+    """不创建窗口，用界面的线程版本 translate_srt 翻译整个文件"""
+    import AI_Trans
+    from generation_profiles import profile_name_for
+
+    app = AI_Trans.SRTTranslatorApp.__new__(AI_Trans.SRTTranslatorApp)
+    app.src_lang, app.dest_lang = Setting("日语"), Setting("中文")
+    app.model_combo, app.api_entry = Setting(model), Setting(url)
+    app.profile_combo = Setting(profile_name_for(model))
+    app.use_translate_model, app.use_memory, app.merge_fragments = Setting(False), Setting(False), Setting(False)
+    app.progress_bar = {}
+    app.message_queue = queue.Queue()
+    app.stop_translation = False
+    app.input_file = input_path
+    original = AI_Trans.ThroughputController
+    AI_Trans.ThroughputController = fixed_controller(concurrency)
+    try:
+        app.translate_srt()
+    finally:
+        AI_Trans.ThroughputController = original
+    messages = list(app.message_queue.queue)
+    if messages[-1]["type"] != "complete":
+        raise RuntimeError(messages[-1].get("text", "线程版本翻译失败"))
+
+
+def run_engines(args):
+    """相同并发数、逐条翻译时比较界面的线程版本 translate_srt 与异步引擎的吞吐量和线程数峰值"""
+    from async_engine import AsyncTranslationEngine
+
+    process, url = start_server_process(args, args.port)
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = write_sample_srt(os.path.join(tmp_dir, "sample_ja.srt"), args.cues)
+            for concurrency in args.concurrency:
+                with ThreadSampler() as sampler:
+                    start = time.time()
+                    run_thread_engine(input_path, url, "fake-model:latest", concurrency)
+                    elapsed = time.time() - start
+                rows.append(("线程", concurrency, args.cues / elapsed, sampler.peak))
+
+                engine = AsyncTranslationEngine(input_path, "日语", "中文", [url], "fake-model:latest",
+                                                concurrency=concurrency, batch_size=1)
+                with ThreadSampler() as sampler:
+                    start = time.time()
+                    asyncio.run(engine.run())
+                    elapsed = time.time() - start
+                rows.append(("异步", concurrency, args.cues / elapsed, sampler.peak))
+    finally:
+        process.kill()
+
+    print(f"\n{'引擎':<4} {'并发':>6} {'条/秒':>10} {'线程峰值':>8}")
+    for name, concurrency, throughput, peak in rows:
+        print(f"{name:<4} {concurrency:>8} {throughput:>12.2f} {peak:>10}")
+    return rows
+
+
+def measure_peak(func):
+    """返回函数执行期间的Python内存峰值(MB)和耗时"""
+    tracemalloc.start()
+    start = time.time()
+    result = func()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak / 1024 / 1024, elapsed
+
+
+def run_memory(args):
+    """解析、填入译文、写出整个文件，比较两种存储方式的内存峰值"""
+    import srt
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = write_sample_srt(os.path.join(tmp_dir, "sample_ja.srt"), args.cues)
+        with open(input_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        output_path = os.path.join(tmp_dir, "sample_zh.srt")
+
+        def with_subtitles():
+            subs = list(srt.parse(content))
+            translated_subs = [srt.Subtitle(i + 1, sub.start, sub.end, f"[译]{sub.content}")
+                               for i, sub in enumerate(subs)]
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(srt.compose(translated_subs))
+            return subs, translated_subs
+
+        def with_cue_store():
+            store = CueStore.parse(content)
+            for i in range(len(store)):
+                store.translations[i] = f"[译]{store.content(i)}"
+            store.write(output_path)
+            return store
+
+        rows = [("srt.Subtitle", *measure_peak(with_subtitles)), ("CueStore", *measure_peak(with_cue_store))]
+
+    print(f"\n{args.cues} 条字幕（不含文件原文本身）")
+    print(f"{'存储方式':<12} {'内存峰值(MB)':>12} {'耗时(秒)':>8}")
+    for name, peak, elapsed in rows:
+        print(f"{name:<16} {peak:>12.1f} {elapsed:>10.2f}")
+    print(f"内存峰值降低为原来的 1/{rows[0][1] / rows[1][1]:.1f}")
+    return rows
+
+
+def run_pipeline(args):
+    """异步引擎跑完整个文件，输出各阶段统计；预处理忙碌时间即原先首个请求发出前模型空等的时间"""
+    from async_engine import AsyncTranslationEngine
+
+    process, url = start_server_process(args, args.port)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = write_sample_srt(os.path.join(tmp_dir, "sample_ja.srt"), args.cues)
+            engine = AsyncTranslationEngine(input_path, "日语", "中文", [url], "fake-model:latest",
+                                            concurrency=args.concurrency, batch_size=args.batch_size)
+            start = time.time()
+            asyncio.run(engine.run())
+            elapsed = time.time() - start
+    finally:
+        process.kill()
+
+    print(f"\n{args.cues} 条字幕，并发 {args.concurrency}×{args.batch_size}，耗时 {elapsed:.1f} 秒，"
+          f"{args.cues / elapsed:.2f} 条/秒")
+    print(format_stage_stats(engine.stats.values()))
+    print(f"预处理共 {engine.stats['预处理'].busy:.2f} 秒，与翻译重叠进行"
+          f"（先全部预处理再派发时，首个请求要等这么久）")
+    return engine.stats
+
+
+def run_translation_memory(args):
+    """随机生成记忆库，查询只改了一个字、加了“…”的近似句，统计命中率和单次查询耗时"""
+    rng = random.Random(args.seed)
+    characters = [chr(c) for c in range(0x3041, 0x3094)] + [chr(c) for c in range(0x4e00, 0x4e00 + 1500)]
+    words = ["".join(rng.choices(characters, k=rng.randint(1, 3))) for _ in range(args.vocabulary)]
+    # 词频按齐普夫分布，和真实字幕一样有大量常用词
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+
+    def make_line():
+        return "".join(rng.choices(words, weights, k=rng.randint(3, 8))) + rng.choice(["。", "！", "？", "…", ""])
+
+    memory = TranslationMemory(hint_threshold=args.hint_threshold)
+    lines = [make_line() for _ in range(args.entries)]
+    start = time.time()
+    for line in lines:
+        memory._insert(line, f"[译]{line}")
+    build_time = time.time() - start
+
+    queries = []
+    for line in rng.sample(lines, args.queries):
+        middle = len(line) // 2
+        queries.append((line, line[:middle] + "が" + line[middle + 1:] + "…"))
+    # 改动后相似度本来就低于阈值的不计入命中率的分母
+    reachable = 0
+    found = 0
+    timings = []
+    for source, query in queries:
+        a, b = ngrams(normalize(source)), ngrams(normalize(query))
+        reachable += 2 * len(a & b) / (len(a) + len(b)) >= memory.hint_threshold
+        start = time.perf_counter()
+        match = memory.lookup(query)
+        timings.append(time.perf_counter() - start)
+        found += match is not None and match.source == source
+    timings.sort()
+
+    print(f"\n记忆 {len(memory.sources)} 条，建立索引 {build_time:.1f} 秒")
+    print(f"查询 {len(queries)} 次: 平均 {sum(timings) / len(timings) * 1000:.3f} 毫秒，"
+          f"p99 {timings[int(len(timings) * 0.99)] * 1000:.3f} 毫秒")
+    print(f"命中原句 {found}/{reachable}（相似度可达阈值 {memory.hint_threshold} 的查询）")
+    return timings
+
+
+# 在新的解释器中启动界面并计时；没有图形界面时按界面的启动逻辑计算模型列表就绪的时间
+STARTUP_PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import AI_Trans
+result = {"import": time.perf_counter() - start}
+try:
+    import tkinter as tk
+    root = tk.Tk()
+except Exception:
+    root = None
+from model_cache import last_api_url, cached_models, fetch_models, save_models
+if root is not None:
+    app = AI_Trans.SRTTranslatorApp(root)
+    root.update()
+    result["window"] = time.perf_counter() - start
+    while str(app.start_btn["state"]) != "normal" and time.perf_counter() - start < 60:
+        root.update()
+        time.sleep(0.01)
+    result["interactive"] = time.perf_counter() - start
+    root.destroy()
+else:
+    url = last_api_url()
+    models = cached_models(url)
+    if not models:
+        models = fetch_models(url)
+        save_models(url, models)
+    result["interactive"] = time.perf_counter() - start
+    # 界面的后台刷新
+    save_models(url, fetch_models(url))
+print(json.dumps(result))
+"""
+
+# 改为按需导入之前，启动时就要导入的模块
+EAGER_IMPORTS = "import time; start = time.perf_counter(); import requests, ollama, httpx, tkinterdnd2; print(time.perf_counter() - start)"
+
+
+def run_startup(args):
+    """模拟冷启动中的Ollama，比较第一次启动（没有模型列表缓存）和之后启动的可操作时间"""
+    process, url = start_server_process(args, args.port)
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ, HOME=home, USERPROFILE=home)
+            config_dir = os.path.join(home, ".srt_trans")
+            os.makedirs(config_dir)
+            with open(os.path.join(config_dir, "models.json"), 'w', encoding='utf-8') as f:
+                json.dump({"api_url": url}, f)
+
+            eager = float(subprocess.run([sys.executable, "-c", EAGER_IMPORTS], cwd=root_dir, env=env,
+                                         capture_output=True, text=True, check=True).stdout)
+            for name in ("无缓存", "有缓存"):
+                output = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=root_dir, env=env,
+                                        capture_output=True, text=True, check=True).stdout
+                rows.append((name, json.loads(output.strip().splitlines()[-1])))
+    finally:
+        process.kill()
+
+    print(f"\n模型列表接口延迟 {args.tags_delay} 秒；原先启动时就导入的 requests/ollama/httpx/tkinterdnd2 需要 {eager:.2f} 秒")
+    print(f"{'启动':<6} {'导入(秒)':>8} {'窗口(秒)':>8} {'可操作(秒)':>10}")
+    for name, result in rows:
+        window = f"{result['window']:.2f}" if "window" in result else "-"
+        print(f"{name:<6} {result['import']:>10.2f} {window:>10} {result['interactive']:>12.2f}")
+    return rows
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_hedge(args):
+    """同一个偶尔卡住的替身服务上，分别关闭/开启对冲跑一遍，比较每批请求的延迟分位数"""
+    from async_engine import AsyncTranslationEngine
+
+    class TimedEngine(AsyncTranslationEngine):
+        async def translate_batch(self, endpoint, texts):
+            start = time.time()
+            try:
+                return await super().translate_batch(endpoint, texts)
+            finally:
+                self.latencies.append(time.time() - start)
+
+    process, url = start_server_process(args, args.port)
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = write_sample_srt(os.path.join(tmp_dir, "sample_ja.srt"), args.cues)
+            for hedge in (False, True):
+                engine = TimedEngine(input_path, "日语", "中文", [url], "fake-model:latest",
+                                     concurrency=args.concurrency, batch_size=1,
+                                     hedge=hedge, hedge_budget=args.budget)
+                engine.latencies = []
+                start = time.time()
+                asyncio.run(engine.run())
+                elapsed = time.time() - start
+                rows.append(("开启" if hedge else "关闭", sorted(engine.latencies), elapsed, engine.hedge_policy))
+    finally:
+        process.kill()
+
+    print(f"\n{args.cues} 条字幕，并发 {args.concurrency}，请求卡住概率 {args.stall_rate:.0%}，对冲预算 {args.budget:.0%}")
+    print(f"{'对冲':<4} {'p50(秒)':>8} {'p95(秒)':>8} {'p99(秒)':>8} {'最大(秒)':>8} {'总耗时(秒)':>10} {'对冲率':>8}")
+    for name, latencies, elapsed, policy in rows:
+        rate = f"{policy.hedge_rate:.1%}" if policy else "-"
+        print(f"{name:<6} {percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.95):>8.2f} "
+              f"{percentile(latencies, 0.99):>8.2f} {latencies[-1]:>8.2f} {elapsed:>12.1f} {rate:>10}")
+    before, after = rows[0][1], rows[1][1]
+    print(f"p99延迟减少 {percentile(before, 0.99) - percentile(after, 0.99):.2f} 秒，"
+          f"平均延迟减少 {sum(before) / len(before) - sum(after) / len(after):.3f} 秒；{rows[1][3].describe()}")
+    return rows
+
+
+def run_replay(args):
+    """录制（或使用已有的cassette）一次翻译，再在回放服务上按不同倍速重跑，比较耗时和输出"""
+    from async_engine import AsyncTranslationEngine
+    from cassette import CassetteRecorder, CassetteServer, describe_entries
+    from translate_common import build_output_path
+
+    def translate(input_path, url):
+        engine = AsyncTranslationEngine(input_path, "日语", "中文", [url], args.model,
+                                        concurrency=args.concurrency, batch_size=args.batch_size)
+        start = time.time()
+        asyncio.run(engine.run())
+        elapsed = time.time() - start
+        with open(build_output_path(input_path, "日语", "中文"), 'rb') as f:
+            return elapsed, f.read()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path, cassette_path = args.input, args.cassette
+        if cassette_path is None:
+            input_path = write_sample_srt(os.path.join(tmp_dir, "sample_ja.srt"), args.cues)
+            cassette_path = os.path.join(tmp_dir, "run.cassette.gz")
+            process, url = start_server_process(args, args.port)
+            recorder = CassetteRecorder(cassette_path, url).start()
+            try:
+                rows.append(("录制",) + translate(input_path, recorder.url) + (0,))
+            finally:
+                recorder.stop()
+                process.kill()
+        elif input_path is None:
+            raise Exception("使用已有的cassette时需要用 --input 指定录制时翻译的SRT文件")
+
+        for speed in args.speed:
+            server = CassetteServer(cassette_path, speed).start()
+            try:
+                elapsed, output = translate(input_path, server.url)
+            finally:
+                server.stop()
+            rows.append((f"回放 {speed:g}x" if speed else "回放 不等待", elapsed, output, server.stats["misses"]))
+        print(f"\ncassette: {describe_entries(server.entries)}")
+
+    reference = rows[0][2]
+    print(f"{'运行':<10} {'耗时(秒)':>8} {'未命中请求':>10} {'输出与第一次相同':>16}")
+    for name, elapsed, output, misses in rows:
+        print(f"{name:<12} {elapsed:>8.2f} {misses:>12} {'是' if output == reference else '否':>16}")
+    return rows
+
+
+def run_merge(args):
+    """同一份断句字幕分别关闭/开启合并翻译，比较请求数、请求耗时合计和总耗时，并检查条数和时间轴不变"""
+    from async_engine import AsyncTranslationEngine
+    from translate_common import build_output_path
+
+    server = start_server(args)
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = write_fragmented_srt(os.path.join(tmp_dir, "speech_ja.srt"), args.sentences)
+            source = CueStore.from_file(input_path)
+            for merge in (False, True):
+                requests_before = server.stats["requests"]
+                engine = AsyncTranslationEngine(input_path, "日语", "中文", [server.url], "fake-model:latest",
+                                                concurrency=args.concurrency, batch_size=args.batch_size,
+                                                merge_fragments=merge)
+                start = time.time()
+                asyncio.run(engine.run())
+                elapsed = time.time() - start
+                output = CueStore.from_file(build_output_path(input_path, "日语", "中文"))
+                same_timing = (len(output) == len(source) and output.starts == source.starts
+                               and output.ends == source.ends)
+                rows.append(("开启" if merge else "关闭", server.stats["requests"] - requests_before,
+                             engine.stats["翻译"].busy, elapsed, same_timing, engine.groups))
+    finally:
+        server.stop()
+
+    print(f"\n{args.sentences} 句切成 {len(source)} 条字幕，并发 {args.concurrency}×{args.batch_size}")
+    print(f"{'合并':<4} {'请求数':>6} {'请求耗时合计(秒)':>14} {'总耗时(秒)':>10} {'条数和时间轴不变':>14}")
+    for name, requests, busy, elapsed, same_timing, _ in rows:
+        print(f"{name:<6} {requests:>8} {busy:>20.1f} {elapsed:>13.1f} {'是' if same_timing else '否':>14}")
+    (_, requests_off, busy_off, elapsed_off, _, _), (_, requests_on, busy_on, elapsed_on, _, groups) = rows
+    print(describe_merge(groups.items(), len(source)))
+    print(f"请求数减少 {1 - requests_on / requests_off:.0%}，请求耗时合计减少 {busy_off - busy_on:.1f} 秒，"
+          f"总耗时减少 {elapsed_off - elapsed_on:.1f} 秒")
+    return rows
+
+
+def run_profiles(args):
+    """同一个会在译文后啰嗦几句的替身模型上，比较各生成参数方案的输出token数、重新加载次数、速度和译文是否干净"""
+    from async_engine import AsyncTranslationEngine
+    from generation_profiles import available_profiles
+    from translate_common import build_output_path
+
+    server = FakeOllamaServer(slots=args.slots, base_latency=args.base_latency, per_cue_latency=args.per_cue_latency,
+                              contention=args.contention, max_queue=args.max_queue, chatter=args.chatter,
+                              per_token_latency=args.per_token_latency, reload_time=args.reload_time).start()
+    names = args.profiles or list(available_profiles())
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = write_sample_srt(os.path.join(tmp_dir, "sample_ja.srt"), args.cues)
+            source = CueStore.from_file(input_path)
+            for name in names:
+                before = dict(server.stats)
+                engine = AsyncTranslationEngine(input_path, "日语", "中文", [server.url], "fake-model:latest",
+                                                concurrency=args.concurrency, batch_size=args.batch_size,
+                                                generation_profile=name)
+                start = time.time()
+                asyncio.run(engine.run())
+                elapsed = time.time() - start
+                output = CueStore.from_file(build_output_path(input_path, "日语", "中文"))
+                # 替身模型的正确译文是 "[译]原文"，多出的说明文字说明没有截住
+                clean = sum(1 for i in range(len(output)) if output.content(i) == f"[译]{source.content(i)}")
+                rows.append((name, server.stats["tokens"] - before["tokens"], server.stats["reloads"] - before["reloads"],
+                             args.cues / elapsed, clean / len(source)))
+    finally:
+        server.stop()
+
+    print(f"\n{args.cues} 条字幕，并发 {args.concurrency}×{args.batch_size}，模型在译文后追加 {args.chatter} 字说明")
+    print(f"{'方案':<10} {'输出token':>10} {'每条token':>10} {'重新加载':>8} {'条/秒':>8} {'译文干净':>8}")
+    for name, tokens, reloads, speed, clean in rows:
+        print(f"{name:<12} {tokens:>10} {tokens / args.cues:>12.1f} {reloads:>10} {speed:>10.2f} {clean:>10.0%}")
+    return rows
+
+
+def legacy_payload(kind, texts, match):
+    """改为固定前缀之前的请求：/api/generate，说明文字随请求种类不同，参考记忆放在最前面"""
+    if kind == "batch":
+        prompt = ("请将以下JSON数组中的每条日语字幕翻译成中文，只返回同样长度的JSON数组，不要添加任何解释：\n"
+                  + json.dumps(texts, ensure_ascii=False))
+    elif match:
+        prompt = f"参考“{match.source}→{match.translation}”，把下面的日语译成中文，只返回译文：\n{texts[0]}"
+    else:
+        prompt = f"请将以下日语文本翻译成中文，只返回翻译结果，不要添加任何解释：\n{texts[0]}"
+    return "/api/generate", {"model": "fake-model:latest", "prompt": prompt, "stream": False}
+
+
+def stable_payload(kind, texts, match):
+    """翻译引擎现在的请求：/api/chat，系统提示词和示例固定，参考记忆和待翻译文本在最后"""
+    from translate_common import build_batch_messages, build_general_messages
+    if kind == "batch":
+        messages = build_batch_messages(texts, "日语", "中文")
+    else:
+        messages = build_general_messages(texts[0], "日语", "中文", match)
+    return "/api/chat", {"model": "fake-model:latest", "messages": messages, "stream": False}
+
+
+def run_prompts(args):
+    """同样的请求组合（逐条、参考翻译记忆、批量）分别用以前的提示词和固定前缀的对话发送，
+    比较每条字幕的 prompt_eval_count/prompt_eval_duration；再用异步引擎完整翻译一次"""
+    from async_engine import AsyncTranslationEngine
+    from translate_common import PromptEvalStats
+
+    server = start_server(args)
+    server.prompt_token_latency = args.prompt_token_latency
+    # 每三个请求中一个批量、一个逐条、一个参考相似的翻译记忆
+    requests = []
+    i = 0
+    while i < args.cues:
+        kind = ("batch", "single", "hint")[len(requests) % 3]
+        size = args.batch_size if kind == "batch" else 1
+        texts = [f"{SAMPLE_LINES[(i + n) % len(SAMPLE_LINES)]}（{i + n}）" for n in range(size)]
+        reference = SAMPLE_LINES[(i + 1) % len(SAMPLE_LINES)]
+        match = Match(0.8, reference, f"[译]{reference}") if kind == "hint" else None
+        requests.append((kind, texts, match))
+        i += size
+
+    rows = []
+    try:
+        for name, build in (("以前的提示词", legacy_payload), ("固定前缀", stable_payload)):
+            server.prompt_cache.clear()
+            stats = PromptEvalStats()
+
+            def send(request):
+                kind, texts, match = request
+                path, payload = build(kind, texts, match)
+                stats.record(post_json(f"{server.url}{path}", payload, 30), len(texts))
+
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(send, requests))
+            rows.append((name, stats, time.time() - start))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = write_sample_srt(os.path.join(tmp_dir, "sample_ja.srt"), args.cues)
+            engine = AsyncTranslationEngine(input_path, "日语", "中文", [server.url], "fake-model:latest",
+                                            concurrency=args.concurrency, batch_size=args.batch_size)
+            asyncio.run(engine.run())
+    finally:
+        server.stop()
+
+    print(f"\n{args.cues} 条字幕，{len(requests)} 个请求（批量每批 {args.batch_size} 条、逐条、参考记忆各占三分之一），"
+          f"并发 {args.concurrency}，替身服务 {args.slots} 个处理槽")
+    print(f"{'提示词':<10} {'每条token':>10} {'每条评估(毫秒)':>14} {'总耗时(秒)':>10}")
+    for name, stats, elapsed in rows:
+        print(f"{name:<12} {stats.tokens / stats.cues:>10.1f} {stats.duration / stats.cues * 1000:>16.2f} {elapsed:>12.1f}")
+    (_, before, _), (_, after, _) = rows
+    print(f"每条字幕评估的提示词token减少 {1 - after.tokens / max(before.tokens, 1):.0%}")
+    print(f"异步引擎完整翻译: {engine.prompt_stats.describe()}")
+    return rows
+
+
+def run_daemon(args):
+    """多个客户端同时向守护进程提交任务（一个客户端一次提交多个），比较不同同时运行任务数下的总吞吐、
+    各任务从提交到完成的耗时和各客户端的平均耗时，检查大量提交的客户端不会拖慢其他客户端"""
+    from translate_daemon import TranslationDaemon
+
+    server = start_server(args)
+    sizes = [args.cues // 2, args.cues, args.cues * 2]
+    # 第一个客户端一次提交 jobs_per_client*2 个任务，其他客户端各 jobs_per_client 个
+    plan = [(f"client{c}", args.jobs_per_client * (2 if c == 0 else 1)) for c in range(args.clients)]
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sources = {size: open(write_sample_srt(os.path.join(tmp_dir, f"sample{size}_ja.srt"), size),
+                                  encoding='utf-8').read() for size in sizes}
+            for max_jobs in args.max_jobs:
+                settings = {"src_lang": "日语", "dest_lang": "中文", "api_urls": [server.url],
+                            "model": "fake-model:latest", "use_memory": False, "merge_fragments": False,
+                            "generation_profile": "标准"}
+                daemon = TranslationDaemon(settings, port=0, max_jobs=max_jobs,
+                                           jobs_dir=os.path.join(tmp_dir, f"jobs{max_jobs}")).start()
+                latencies = {}
+
+                def client(name, count, url=daemon.url):
+                    results = []
+                    jobs = [post_json(f"{url}/jobs", {"srt": sources[sizes[n % len(sizes)]], "client": name,
+                                                      "name": f"{name}_{n}.srt"}, 10) for n in range(count)]
+                    submitted = time.time()
+                    for job in jobs:
+                        # 读完流式进度即任务结束
+                        with urllib.request.urlopen(f"{url}/jobs/{job['id']}/events", timeout=600) as response:
+                            last = [json.loads(line) for line in response][-1]
+                        with urllib.request.urlopen(f"{url}/jobs/{job['id']}/result", timeout=10) as response:
+                            translated = len(CueStore.parse(response.read().decode("utf-8")))
+                        results.append((last["state"], translated == job["total"], last["finished"] - submitted))
+                    latencies[name] = results
+
+                start = time.time()
+                threads = [threading.Thread(target=client, args=item) for item in plan]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.time() - start
+                stats = daemon.status()
+                daemon.stop()
+                cues = stats["completed_cues"]
+                results = [result for name, _ in plan for result in latencies[name]]
+                rows.append((max_jobs, len(results), sum(1 for state, complete, _ in results if state == "done" and complete),
+                             cues / elapsed, percentile(sorted(r[2] for r in results), 0.5),
+                             {name: sum(r[2] for r in latencies[name]) / len(latencies[name]) for name, _ in plan},
+                             stats["served"]))
+    finally:
+        server.stop()
+
+    print(f"\n{args.clients} 个客户端，client0 提交 {plan[0][1]} 个任务，其他各 {args.jobs_per_client} 个，"
+          f"每个任务 {'/'.join(map(str, sizes))} 条字幕")
+    print(f"{'同时任务':>6} {'完成':>8} {'条/秒':>8} {'任务耗时中位数(秒)':>16}  各客户端平均耗时(秒)")
+    for max_jobs, total, done, speed, median, per_client, _ in rows:
+        clients = " ".join(f"{name}={seconds:.1f}" for name, seconds in per_client.items())
+        print(f"{max_jobs:>10} {done:>5}/{total:<4} {speed:>8.2f} {median:>20.1f}  {clients}")
+    print(f"各客户端已翻译条数: {rows[-1][6]}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SRT翻译引擎离线性能基准")
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+
+    controller_parser = subparsers.add_parser("controller", help="自动调优收敛测试")
+    add_server_arguments(controller_parser)
+    controller_parser.add_argument("--cues", type=int, default=1500)
+    controller_parser.add_argument("--start-concurrency", type=int, default=1)
+    controller_parser.add_argument("--timeout", type=float, default=5.0)
+    controller_parser.add_argument("--no-batching", action="store_true", help="只调并发数")
+    controller_parser.set_defaults(func=run_controller)
+
+    engines_parser = subparsers.add_parser("engines", help="线程版本与异步引擎对比")
+    add_server_arguments(engines_parser)
+    engines_parser.set_defaults(slots=512, max_queue=4096, base_latency=0.5, contention=0.0)
+    engines_parser.add_argument("--port", type=int, default=11436)
+    engines_parser.add_argument("--cues", type=int, default=2000)
+    engines_parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    engines_parser.set_defaults(func=run_engines)
+
+    memory_parser = subparsers.add_parser("memory", help="字幕存储内存对比")
+    memory_parser.add_argument("--cues", type=int, default=50000)
+    memory_parser.set_defaults(func=run_memory)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="流水线各阶段统计")
+    add_server_arguments(pipeline_parser)
+    pipeline_parser.set_defaults(slots=64, max_queue=4096, base_latency=0.2, per_cue_latency=0.01, contention=0.0)
+    pipeline_parser.add_argument("--port", type=int, default=11437)
+    pipeline_parser.add_argument("--cues", type=int, default=20000)
+    pipeline_parser.add_argument("--concurrency", type=int, default=64)
+    pipeline_parser.add_argument("--batch-size", type=int, default=4)
+    pipeline_parser.set_defaults(func=run_pipeline)
+
+    tm_parser = subparsers.add_parser("tm", help="翻译记忆查询耗时")
+    tm_parser.add_argument("--entries", type=int, default=200000)
+    tm_parser.add_argument("--queries", type=int, default=2000)
+    tm_parser.add_argument("--vocabulary", type=int, default=5000, help="随机词表大小")
+    tm_parser.add_argument("--hint-threshold", type=float, default=0.6)
+    tm_parser.add_argument("--seed", type=int, default=1)
+    tm_parser.set_defaults(func=run_translation_memory)
+
+    startup_parser = subparsers.add_parser("startup", help="启动到可操作的时间")
+    add_server_arguments(startup_parser)
+    startup_parser.set_defaults(tags_delay=3.0)
+    startup_parser.add_argument("--port", type=int, default=11438)
+    startup_parser.set_defaults(func=run_startup)
+
+    hedge_parser = subparsers.add_parser("hedge", help="对冲请求的延迟对比")
+    add_server_arguments(hedge_parser)
+    hedge_parser.set_defaults(slots=16, max_queue=4096, base_latency=0.2, contention=0.0, stall_rate=0.02)
+    hedge_parser.add_argument("--port", type=int, default=11439)
+    hedge_parser.add_argument("--cues", type=int, default=1000)
+    hedge_parser.add_argument("--concurrency", type=int, default=8)
+    hedge_parser.add_argument("--budget", type=float, default=0.05)
+    hedge_parser.set_defaults(func=run_hedge)
+
+    replay_parser = subparsers.add_parser("replay", help="录制与回放")
+    add_server_arguments(replay_parser)
+    replay_parser.set_defaults(slots=8, max_queue=4096, base_latency=0.2, contention=0.0, stall_rate=0.02, stall_time=3.0)
+    replay_parser.add_argument("--port", type=int, default=11440)
+    replay_parser.add_argument("--cassette", help="已有的cassette，不指定时先在替身服务上录制一次")
+    replay_parser.add_argument("--input", help="录制cassette时翻译的SRT文件")
+    replay_parser.add_argument("--model", default="fake-model:latest")
+    replay_parser.add_argument("--cues", type=int, default=300)
+    replay_parser.add_argument("--concurrency", type=int, default=8)
+    # 批大小会改变请求内容，回放时必须与录制时相同；逐条请求时不受派发时机影响
+    replay_parser.add_argument("--batch-size", type=int, default=1)
+    replay_parser.add_argument("--speed", type=float, nargs="+", default=[1.0, 4.0, 0.0], help="回放倍速，0表示不等待")
+    replay_parser.set_defaults(func=run_replay)
+
+    merge_parser = subparsers.add_parser("merge", help="断句字幕合并")
+    add_server_arguments(merge_parser)
+    merge_parser.set_defaults(slots=8, max_queue=4096, base_latency=0.2, contention=0.0)
+    merge_parser.add_argument("--sentences", type=int, default=300)
+    merge_parser.add_argument("--concurrency", type=int, default=8)
+    merge_parser.add_argument("--batch-size", type=int, default=1)
+    merge_parser.set_defaults(func=run_merge)
+
+    profiles_parser = subparsers.add_parser("profiles", help="生成参数方案对比")
+    add_server_arguments(profiles_parser)
+    profiles_parser.set_defaults(slots=8, max_queue=4096, base_latency=0.1, per_cue_latency=0.0, contention=0.0)
+    profiles_parser.add_argument("--profiles", nargs="+", help="要比较的方案，默认为全部")
+    profiles_parser.add_argument("--chatter", type=int, default=60, help="模型在译文后追加的说明文字字数")
+    profiles_parser.add_argument("--per-token-latency", type=float, default=0.01, help="每个输出字符的耗时(秒)")
+    profiles_parser.add_argument("--reload-time", type=float, default=2.0, help="num_ctx变化时重新加载模型的耗时(秒)")
+    profiles_parser.add_argument("--cues", type=int, default=300)
+    profiles_parser.add_argument("--concurrency", type=int, default=8)
+    profiles_parser.add_argument("--batch-size", type=int, default=1)
+    profiles_parser.set_defaults(func=run_profiles)
+
+    prompts_parser = subparsers.add_parser("prompts", help="固定提示词前缀的缓存命中")
+    add_server_arguments(prompts_parser)
+    prompts_parser.set_defaults(slots=4, max_queue=4096, base_latency=0.05, per_cue_latency=0.0, contention=0.0)
+    prompts_parser.add_argument("--prompt-token-latency", type=float, default=0.0005, help="评估每个提示词字符的耗时(秒)")
+    prompts_parser.add_argument("--cues", type=int, default=600)
+    prompts_parser.add_argument("--concurrency", type=int, default=4)
+    prompts_parser.add_argument("--batch-size", type=int, default=4)
+    prompts_parser.set_defaults(func=run_prompts)
+
+    daemon_parser = subparsers.add_parser("daemon", help="守护进程并发任务吞吐")
+    add_server_arguments(daemon_parser)
+    daemon_parser.set_defaults(slots=8, max_queue=4096, base_latency=0.2, contention=0.0)
+    daemon_parser.add_argument("--clients", type=int, default=3)
+    daemon_parser.add_argument("--jobs-per-client", type=int, default=2)
+    daemon_parser.add_argument("--cues", type=int, default=60, help="任务的字幕条数为其一半、一倍、两倍")
+    daemon_parser.add_argument("--max-jobs", type=int, nargs="+", default=[1, 2, 4], help="同时运行的任务数")
+    daemon_parser.set_defaults(func=run_daemon)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
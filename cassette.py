@@ -0,0 +1,305 @@
+"""Ollama请求的录制与回放
+
+录制：在本地启动一个代理，把收到的请求原样转发给真正的Ollama，同时把每个请求和响应
+（流式响应的每一块及其相对请求开始的时间）追加到cassette文件；把翻译时的API地址指向代理即可，
+界面、异步引擎、专用模型和通用模型的请求都会被录下。
+回放：在本地启动一个替身服务，按请求内容从cassette中找到录下的响应，按原来的（或按比例缩放的）
+时间逐块返回，响应内容逐字节相同。这样不需要GPU就能复现一次很慢的实际翻译，并对比引擎改动前后的表现。
+
+cassette每行一个JSON记录，文件名以 .gz 结尾时用gzip压缩。回放按 方法+路径+请求JSON 匹配，
+同样的请求录了多次时按录制顺序依次返回；请求内容会随批大小变化，回放时应固定批大小。
+
+用法:
+    python cassette.py record run.cassette.gz --target http://localhost:11434 --port 11435
+    python cassette.py replay run.cassette.gz --port 11435 --speed 2   # 两倍速回放
+"""
+import argparse
+import gzip
+import http.client
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from fake_ollama import _HTTPServer
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def request_key(method, path, payload):
+    """回放时匹配请求用的键：JSON按键排序后比较，不受客户端序列化方式影响"""
+    return method, path, json.dumps(payload, ensure_ascii=False, sort_keys=True)
+
+
+def load_cassette(path):
+    entries = []
+    with _open(path, "r") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # 录制中断时写到一半的最后一行
+                continue
+    return entries
+
+
+def describe_entries(entries):
+    latencies = [entry["chunks"][-1][0] for entry in entries if entry["chunks"]]
+    streamed = sum(1 for entry in entries if entry.get("stream"))
+    total = sum(latencies)
+    return (f"{len(entries)} 个请求（流式 {streamed} 个），响应耗时合计 {total:.1f} 秒，"
+            f"最长 {max(latencies, default=0):.2f} 秒")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def start_response(self, status, content_type, length=None):
+        """发送响应头；流式响应不带Content-Length，写完后关闭连接"""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if length is not None:
+            self.send_header("Content-Length", str(length))
+        self.end_headers()
+        self.close_connection = True
+
+    def write_chunk(self, text):
+        self.wfile.write(text.encode("utf-8"))
+        self.wfile.flush()
+
+    def send_chunks(self, status, content_type, chunks, stream, speed=None):
+        """发送录下的响应，speed不为None时按录制的时间间隔发送"""
+        length = None if stream else sum(len(text.encode("utf-8")) for _, text in chunks)
+        start = time.time()
+        headers_sent = False
+        for offset, text in chunks:
+            if speed:
+                time.sleep(max(0.0, offset / speed - (time.time() - start)))
+            if not headers_sent:
+                # 流式响应的头随第一块一起到达，非流式响应整体在最后一块到达
+                self.start_response(status, content_type, length)
+                headers_sent = True
+            self.write_chunk(text)
+
+
+class CassetteRecorder:
+    """录制代理：转发到target，把每个请求/响应追加写入cassette"""
+
+    def __init__(self, path, target, host="127.0.0.1", port=0):
+        self.path = path
+        self.target = urlsplit(target)
+        self.file = _open(path, "w")
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.count = 0
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.lock:
+            self.file.close()
+        print(f"已录制 {self.count} 个请求: {self.path}")
+
+    def record(self, entry):
+        with self.lock:
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+            self.count += 1
+
+    def forward(self, handler, method, path, body, content_type):
+        """转发请求，收到的响应边转给客户端边记录，返回 (状态码, Content-Type, 是否流式, [(相对时间, 文本块)])"""
+        start = time.time()
+        connection = http.client.HTTPConnection(self.target.hostname, self.target.port or 80)
+        try:
+            try:
+                headers = {"Content-Type": content_type} if body else {}
+                connection.request(method, path, body=body or None, headers=headers)
+                response = connection.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                error = json.dumps({"error": f"录制代理无法连接Ollama: {str(e)}"}, ensure_ascii=False)
+                chunks = [(round(time.time() - start, 3), error)]
+                self.relay(handler.send_chunks, 502, "application/json", chunks, False)
+                return 502, "application/json", False, chunks
+
+            response_type = response.getheader("Content-Type", "application/json")
+            stream = response.getheader("Content-Length") is None
+            chunks = []
+            if stream:
+                self.relay(handler.start_response, response.status, response_type)
+                # Ollama的流式响应每行一个JSON，按行读取不会切断多字节字符
+                for line in iter(response.readline, b""):
+                    chunks.append((round(time.time() - start, 3), line.decode("utf-8")))
+                    self.relay(handler.write_chunk, chunks[-1][1])
+            else:
+                data = response.read()
+                chunks.append((round(time.time() - start, 3), data.decode("utf-8")))
+                self.relay(handler.start_response, response.status, response_type, len(data))
+                self.relay(handler.write_chunk, chunks[-1][1])
+            return response.status, response_type, stream, chunks
+        finally:
+            connection.close()
+
+    @staticmethod
+    def relay(send, *args):
+        # 客户端可能已经超时断开，响应照样录下，只是发不出去
+        try:
+            send(*args)
+        except OSError:
+            pass
+
+    def _make_handler(self):
+        recorder = self
+
+        class Handler(_Handler):
+            def handle_request(self):
+                body = self.read_body()
+                try:
+                    payload = json.loads(body) if body else None
+                except ValueError:
+                    payload = body.decode("utf-8", "replace")
+                request_start = time.time()
+                content_type = self.headers.get("Content-Type", "application/json")
+                status, response_type, stream, chunks = recorder.forward(self, self.command, self.path,
+                                                                         body, content_type)
+                recorder.record({
+                    "t": round(request_start - recorder.started, 3),
+                    "method": self.command,
+                    "path": self.path,
+                    "request": payload,
+                    "status": status,
+                    "content_type": response_type,
+                    "stream": stream,
+                    "chunks": chunks,
+                })
+
+            do_GET = handle_request
+            do_POST = handle_request
+
+        return Handler
+
+
+class CassetteServer:
+    """回放替身服务：按请求内容返回录下的响应，时间按 speed 倍速缩放，speed为0时不等待"""
+
+    def __init__(self, path, speed=1.0, host="127.0.0.1", port=0):
+        self.path = path
+        self.speed = speed
+        self.entries = load_cassette(path)
+        self.responses = {}  # 请求键 -> 按录制顺序的响应
+        for entry in self.entries:
+            key = request_key(entry["method"], entry["path"], entry["request"])
+            self.responses.setdefault(key, deque()).append(entry)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "misses": 0}
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def lookup(self, method, path, payload):
+        """取出下一个录下的响应；录的次数用完后重复最后一个（如重试），没录过时返回None"""
+        with self.lock:
+            self.stats["requests"] += 1
+            responses = self.responses.get(request_key(method, path, payload))
+            if not responses:
+                self.stats["misses"] += 1
+                return None
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(_Handler):
+            def handle_request(self):
+                if self.path == "/stats":
+                    with server.lock:
+                        body = json.dumps(server.stats)
+                    self.send_chunks(200, "application/json", [(0.0, body)], False)
+                    return
+                body = self.read_body()
+                try:
+                    payload = json.loads(body) if body else None
+                except ValueError:
+                    payload = body.decode("utf-8", "replace")
+                entry = server.lookup(self.command, self.path, payload)
+                if entry is None:
+                    error = json.dumps({"error": "cassette中没有这个请求"}, ensure_ascii=False)
+                    self.send_chunks(404, "application/json", [(0.0, error)], False)
+                    return
+                # 非流式响应要在录下的耗时之后一次性返回
+                try:
+                    self.send_chunks(entry["status"], entry["content_type"], entry["chunks"],
+                                     entry.get("stream", False), server.speed)
+                except OSError:
+                    pass
+
+            do_GET = handle_request
+            do_POST = handle_request
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama请求的录制与回放")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    record_parser = subparsers.add_parser("record", help="启动录制代理")
+    record_parser.add_argument("cassette", help="cassette文件，以 .gz 结尾时压缩")
+    record_parser.add_argument("--target", default="http://localhost:11434", help="真正的Ollama地址")
+    record_parser.add_argument("--host", default="127.0.0.1")
+    record_parser.add_argument("--port", type=int, default=11435)
+    replay_parser = subparsers.add_parser("replay", help="启动回放替身服务")
+    replay_parser.add_argument("cassette")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，0表示不等待")
+    replay_parser.add_argument("--host", default="127.0.0.1")
+    replay_parser.add_argument("--port", type=int, default=11435)
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        server = CassetteRecorder(args.cassette, args.target, args.host, args.port)
+        print(f"录制代理已启动: {server.url} -> {args.target}，把API地址设为代理地址即可录制")
+    else:
+        server = CassetteServer(args.cassette, args.speed, args.host, args.port)
+        print(f"回放服务已启动: {server.url}，{describe_entries(server.entries)}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import json
+
+# 用户配置目录，用于保存跨运行的状态（如自动调优结果）
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".srt_trans")
+
+
+def load_json(name, default=None):
+    """读取配置目录下的JSON文件，不存在或损坏时返回默认值"""
+    path = os.path.join(CONFIG_DIR, name)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        if os.path.exists(path):
+            print(f"读取配置文件失败({path}): {str(e)}")
+        return default
+
+
+def save_json(name, data):
+    """写入配置目录下的JSON文件，先写临时文件再替换，避免写到一半损坏"""
+    try:
+        os.makedirs(CONFIG_DIR, exist_ok=True)
+        path = os.path.join(CONFIG_DIR, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"保存配置文件失败({name}): {str(e)}")
+        return False
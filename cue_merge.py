@@ -0,0 +1,130 @@
+"""合并断句的字幕
+
+语音识别（PotPlayer、whisper等）生成的SRT常把一句话切成3~5条很短的字幕，逐条翻译请求多，
+模型看不到整句，译文也差。这里按时间间隔、结尾标点和长度把相邻的碎片合成一句，整句翻译一次，
+再按各条原文的长度比例把译文切回原来的几条，字幕条数和时间轴都不变。
+切分点优先选在标点或空格处；译文太短切不开时各条使用原文（与翻译失败时相同）。
+"""
+import re
+
+# 两条字幕间隔超过这么多毫秒时不合并
+MAX_GAP_MS = 800
+# 一组最多合并的条数和合并后的最大字数（不超过 MAX_CHUNK_LENGTH，合并后不会再被切块）
+MAX_GROUP_SIZE = 5
+MAX_MERGED_LENGTH = 120
+
+# 以这些字符结尾的字幕视为一句话已经结束
+_SENTENCE_END = re.compile(r'[。！？!?.…♪」』）)]\s*$')
+# 对话中以“-”开头的字幕是另一个人在说话
+_DIALOGUE = re.compile(r'^\s*[-－‐]')
+# 译文中适合切开的位置（其后）
+_BREAK = re.compile(r'[，、。！？；：,.!?;:…\s]')
+# 非最后一条结尾的逗号去掉，字幕行尾一般不带逗号
+_TRAILING_COMMA = '，、, '
+
+_SPACE_SEPARATED = ('英语',)
+
+
+def is_fragment(content):
+    """单行、不以句末标点结尾的字幕可能是半句话"""
+    return bool(content.strip()) and "\n" not in content.strip() and not _SENTENCE_END.search(content)
+
+
+def group_fragments(store, start=0, max_gap_ms=MAX_GAP_MS, max_size=MAX_GROUP_SIZE, max_length=MAX_MERGED_LENGTH):
+    """从start开始把字幕分组，返回 [(第一条的序号, 条数)]，覆盖start之后的所有字幕"""
+    groups = []
+    total = len(store)
+    i = start
+    while i < total:
+        count = 1
+        length = len(store.content(i).strip())
+        while i + count < total and count < max_size:
+            last, following = i + count - 1, i + count
+            content = store.content(following).strip()
+            if (not is_fragment(store.content(last)) or not content or "\n" in content
+                    or _DIALOGUE.match(content)
+                    or store.starts[following] - store.ends[last] > max_gap_ms
+                    or length + len(content) > max_length):
+                break
+            length += len(content)
+            count += 1
+        groups.append((i, count))
+        i += count
+    return groups
+
+
+def merged_text(store, first, count, src_lang):
+    """一组字幕合成的整句；英语等以空格分词的语言用空格连接"""
+    separator = " " if src_lang in _SPACE_SEPARATED else ""
+    return separator.join(store.content(i).strip() for i in range(first, first + count))
+
+
+def split_translation(text, weights, dest_lang):
+    """按weights的比例把译文切成len(weights)段，切分点尽量落在标点或空格之后；切不开时返回None"""
+    parts = len(weights)
+    text = text.strip()
+    if parts == 1:
+        return [text]
+    space_separated = dest_lang in _SPACE_SEPARATED
+    # 以空格分词的语言按词切，否则按字切
+    units = text.split() if space_separated else list(text)
+    if len(units) < parts:
+        return None
+
+    total_weight = sum(weights) or parts
+    cuts = []
+    previous = 0
+    consumed = 0
+    for n, weight in enumerate(weights[:-1]):
+        consumed += weight
+        target = round(len(units) * consumed / total_weight)
+        # 每段至少一个单位，并给后面的每段至少留一个
+        low, high = previous + 1, len(units) - (parts - 1 - n)
+        target = min(max(target, low), high)
+        # 在目标位置附近找标点或空格之后的位置
+        window = max(1, len(units) // (parts * 3))
+        best = target
+        for offset in range(window + 1):
+            candidates = [c for c in (target - offset, target + offset) if low <= c <= high]
+            found = [c for c in candidates if _BREAK.match(units[c - 1][-1])]
+            if found:
+                best = found[0]
+                break
+        cuts.append(best)
+        previous = best
+
+    pieces = []
+    bounds = [0] + cuts + [len(units)]
+    for n in range(parts):
+        chunk = units[bounds[n]:bounds[n + 1]]
+        piece = " ".join(chunk) if space_separated else "".join(chunk).strip()
+        if n < parts - 1:
+            piece = piece.rstrip(_TRAILING_COMMA)
+        if not piece:
+            return None
+        pieces.append(piece)
+    return pieces
+
+
+def expand_group(store, first, count, translated_text, src_lang, dest_lang):
+    """把整句的译文分回组内的各条字幕；翻译失败（译文为原文）或切不开时各条使用原文"""
+    originals = [store.content(i) for i in range(first, first + count)]
+    if count == 1:
+        return [translated_text]
+    if not translated_text or translated_text.strip() == merged_text(store, first, count, src_lang).strip():
+        return originals
+    pieces = split_translation(translated_text, [len(text.strip()) for text in originals], dest_lang)
+    if pieces is None:
+        print(f"第 {first + 1}-{first + count} 条合并翻译的译文过短，无法切分，使用原文")
+        return originals
+    return pieces
+
+
+def describe_merge(groups, total, seconds_per_cue=None):
+    """合并节省的翻译条数；seconds_per_cue 为平均每条的请求耗时，用于估计节省的请求时间"""
+    merged = [count for _, count in groups if count > 1]
+    saved = sum(merged) - len(merged)
+    text = f"合并断句字幕 {len(merged)} 组共 {sum(merged)} 条，少翻译 {saved} 条（{saved / max(total, 1):.0%}）"
+    if seconds_per_cue:
+        text += f"，约节省 {saved * seconds_per_cue:.1f} 秒请求时间"
+    return text
@@ -0,0 +1,128 @@
+"""紧凑的字幕存储
+
+五万条以上的字幕如果每条都是一个 srt.Subtitle（两个 timedelta、内容字符串、proprietary
+字段、对象头），再加上一份译文的 Subtitle 列表，每条的对象开销远大于文本本身。
+这里把开始/结束时间以整数毫秒存进类型化数组，所有原文拼成一个字符串、按偏移量切片，
+译文按序号原地填入；读写SRT都直接在存储上进行，不再创建 Subtitle 对象。
+"""
+import io
+import re
+from array import array
+
+from translate_common import read_subtitle_file
+
+_TIMESTAMP = r'(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})'
+_ANY_TIMESTAMP = r'\d+:\d{1,2}:\d{1,2}[,.]\d{1,3}'
+
+
+def _block_start(timestamp):
+    """字幕开头：可省略的序号行 + 时间轴行"""
+    return r'^[ \t]*(?:\d+[ \t]*\n)?[ \t]*' + timestamp + r'[ \t]*-->[ \t]*' + timestamp
+
+
+# 与 srt.parse 相同：内容可以为空，到下一条字幕开头（中间可以隔着空行）或文件结尾为止，
+# 中间不是字幕开头的空行和文字都属于上一条字幕
+_BLOCK_PATTERN = re.compile(
+    _block_start(_TIMESTAMP) + r'[ \t]*([^\n]*)'
+    r'(?:\n(.*?))?'
+    r'(?=\n\s*?' + _block_start(_ANY_TIMESTAMP) + r'|\s*\Z)',
+    re.S | re.M
+)
+
+
+def format_timestamp(ms):
+    """毫秒 -> SRT时间格式 00:00:00,000"""
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def _to_ms(hours, minutes, seconds, millis):
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+class CueStore:
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        # 第i条原文为 text[offsets[i]:offsets[i + 1]]
+        self.offsets = array('q', [0])
+        self.text = ""
+        # 译文，未翻译的为None
+        self.translations = []
+        # 时间轴行后面的附加内容（如坐标），只有少数字幕有：序号 -> 文本
+        self.extras = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_file(cls, file_path):
+        return cls.parse(read_subtitle_file(file_path))
+
+    @classmethod
+    def parse(cls, content):
+        """解析SRT；与 srt.parse 加 srt.compose 的结果相同，字幕按开始、结束时间排序"""
+        store = cls()
+        buffer = io.StringIO()
+        position = 0
+        content = content.lstrip('\ufeff').replace('\r\n', '\n').replace('\r', '\n')
+        cues = []
+        last_end = 0
+        for match in _BLOCK_PATTERN.finditer(content):
+            skipped = content[last_end:match.start()]
+            if skipped.strip():
+                print(f"跳过无法解析的内容: {skipped.strip()[:50]}...")
+            last_end = match.end()
+            groups = match.groups()
+            cues.append((_to_ms(*groups[0:4]), _to_ms(*groups[4:8]), (groups[9] or "").strip('\n'),
+                         groups[8].strip()))
+        if content[last_end:].strip():
+            print(f"跳过无法解析的内容: {content[last_end:].strip()[:50]}...")
+        if not cues and content.strip():
+            raise Exception("未能从文件中解析出字幕，请检查SRT格式")
+        if any(cues[i][:2] > cues[i + 1][:2] for i in range(len(cues) - 1)):
+            # 与srt.compose一样按时间排序；时间相同的保持原来的顺序
+            cues.sort(key=lambda cue: cue[:2])
+        for start, end, text, extra in cues:
+            if extra:
+                store.extras[len(store.starts)] = extra
+            store.starts.append(start)
+            store.ends.append(end)
+            buffer.write(text)
+            position += len(text)
+            store.offsets.append(position)
+        store.text = buffer.getvalue()
+        store.translations = [None] * len(store.starts)
+        return store
+
+    def content(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def time_range(self, i):
+        return f"{format_timestamp(self.starts[i])} --> {format_timestamp(self.ends[i])}"
+
+    def output_text(self, i):
+        """有译文用译文，否则用原文"""
+        translation = self.translations[i]
+        return translation if translation is not None else self.content(i)
+
+    def iter_blocks(self, count=None):
+        """按SRT格式逐条生成文本块，count只输出前count条（部分结果）"""
+        count = len(self) if count is None else count
+        index = 0
+        for i in range(count):
+            # SRT内容中不能有空行，否则会被当成下一条字幕的开始；空字幕直接跳过（与srt.compose一致）
+            content = re.sub(r'\n\s*\n', '\n', self.output_text(i).strip())
+            if not content:
+                continue
+            index += 1
+            extra = self.extras.get(i)
+            yield f"{index}\n{self.time_range(i)}{' ' + extra if extra else ''}\n{content}\n\n"
+
+    def compose(self, count=None):
+        return "".join(self.iter_blocks(count))
+
+    def write(self, output_path, count=None):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for block in self.iter_blocks(count):
+                f.write(block)
+        return output_path
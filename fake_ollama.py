@@ -0,0 +1,329 @@
+"""本地Ollama替身服务，用于离线测试和性能基准
+
+模拟一条容量曲线：同时最多处理 slots 个请求（相当于 OLLAMA_NUM_PARALLEL），
+每个请求耗时 = base_latency + per_cue_latency × 条数，并随同时处理的请求数增加而变慢；
+排队超过 max_queue 时返回503。/api/tags 可以延迟 tags_delay 秒返回，模拟冷启动中的Ollama；
+按 stall_rate 的概率让一个请求卡住 stall_time 秒，模拟偶尔停不下来的生成。
+
+model_profiles 可以为每个模型指定延迟倍数和翻译质量（每条字幕被正常“翻译”的概率，
+否则原样返回原文），用于模型基准测试。响应中带有 eval_count/eval_duration 等Ollama统计字段。
+请求中 "stream": true 时与Ollama一样逐块返回（每行一个JSON），用于测试流式响应的录制与回放。
+chatter 为模型在译文后空一行追加的说明文字的字数，per_token_latency 为每个输出字符的耗时，
+请求 options 中的 num_predict 和 stop 会截断输出；num_ctx 与上次不同时模拟重新加载模型，额外耗时 reload_time 秒，
+不带 num_ctx 时按 default_ctx 加载。/api/ps 与Ollama一样列出已加载的模型和 context_length。
+提示词缓存：与Ollama一样每个处理槽保留上一次的提示词，新请求只评估与缓存中最长公共前缀之后的部分，
+每个字符耗时 prompt_token_latency 秒，并在 prompt_eval_count/prompt_eval_duration 中返回。
+
+用法: python fake_ollama.py --port 11435 --slots 4
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 流式响应每块的字数和块之间的间隔(秒)
+STREAM_PIECE = 4
+STREAM_INTERVAL = 0.01
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # 默认的监听队列只有5，高并发基准下会被直接重置连接
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端超时或被取消后断开连接是正常情况，不打印堆栈
+        pass
+
+
+class FakeOllamaServer:
+    def __init__(self, host="127.0.0.1", port=0, slots=4, base_latency=0.3,
+                 per_cue_latency=0.05, contention=0.15, max_queue=32,
+                 models=("fake-model:latest",), tags_delay=0.0, stall_rate=0.0, stall_time=10.0,
+                 model_profiles=None, chatter=0, per_token_latency=0.0, reload_time=0.0,
+                 prompt_token_latency=0.0002, default_ctx=2048):
+        self.slots = slots
+        self.base_latency = base_latency
+        self.per_cue_latency = per_cue_latency
+        self.contention = contention
+        self.max_queue = max_queue
+        # 模型名 -> {"latency": 延迟倍数, "quality": 正常翻译的概率}
+        self.model_profiles = dict(model_profiles or {})
+        self.models = list(self.model_profiles) if self.model_profiles else list(models)
+        self.tags_delay = tags_delay
+        self.chatter_text = ("\n\n注：" + "以上译文按照原文的意思翻译，保留了原句的语气和说法。" * (chatter // 26 + 1))[:chatter] if chatter else ""
+        self.per_token_latency = per_token_latency
+        self.reload_time = reload_time
+        self.default_ctx = default_ctx
+        self.loaded_ctx = {}  # 模型名 -> 当前加载时的num_ctx
+        self.prompt_token_latency = prompt_token_latency
+        self.prompt_cache = []  # 各处理槽上一次的提示词，最近用过的在后
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.slot_semaphore = threading.Semaphore(slots)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.stats = {"requests": 0, "rejected": 0, "cues": 0, "tokens": 0, "reloads": 0, "prompt_tokens": 0}
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def translate(self, text, model=None):
+        """伪翻译：给每条文本加上标记，批量请求(JSON数组)逐条处理"""
+        translate_item = self._item_translator(model)
+        array_match = re.search(r'^\[.*\]\s*$', text, re.S | re.M)
+        if array_match:
+            try:
+                items = json.loads(array_match.group(0))
+                if isinstance(items, list):
+                    return json.dumps([translate_item(item) for item in items], ensure_ascii=False), len(items)
+            except ValueError:
+                pass
+        return translate_item(text), 1
+
+    def _item_translator(self, model):
+        profile = self.model_profiles.get(model)
+        if profile is None:
+            return lambda item: f"[译]{item}"
+
+        def translate_item(item):
+            if random.random() >= profile.get("quality", 1.0):
+                return item  # 没有翻译，原样返回
+            # 把假名换成汉字，让基于文字种类的质量检查能区分“翻译过”的结果
+            return "".join(chr(0x4e00 + ord(c) % 2000) if "\u3040" <= c <= "\u30ff" else c for c in item)
+        return translate_item
+
+    def finish(self, result, model, options):
+        """模拟生成到结束：追加说明文字，按stop和num_predict截断；返回 (输出, 重新加载模型的耗时)"""
+        text = result + self.chatter_text
+        for stop in options.get("stop") or []:
+            index = text.find(stop)
+            if index != -1:
+                text = text[:index]
+        limit = options.get("num_predict")
+        if limit is not None and limit >= 0:
+            text = text[:limit]
+        reload_delay = 0.0
+        num_ctx = options.get("num_ctx") or self.default_ctx
+        with self.lock:
+            if model in self.loaded_ctx and self.loaded_ctx[model] != num_ctx:
+                reload_delay = self.reload_time
+                self.stats["reloads"] += 1
+            self.loaded_ctx[model] = num_ctx
+            self.stats["tokens"] += len(text)
+        return text, reload_delay
+
+    def evaluate_prompt(self, prompt):
+        """按缓存中最长的公共前缀计算需要评估的字符数（至少1个），并把这个提示词放进缓存"""
+        with self.lock:
+            shared = 0
+            best = None
+            for n, cached in enumerate(self.prompt_cache):
+                length = len(os.path.commonprefix([cached, prompt]))
+                if length > shared:
+                    shared, best = length, n
+            # 复用前缀最长的槽，没有可复用的就占用最久没用的槽
+            if best is not None:
+                del self.prompt_cache[best]
+            elif len(self.prompt_cache) >= self.slots:
+                del self.prompt_cache[0]
+            self.prompt_cache.append(prompt)
+            count = max(1, len(prompt) - shared)
+            self.stats["prompt_tokens"] += count
+            return count
+
+    def latency_factor(self, model):
+        return self.model_profiles.get(model, {}).get("latency", 1.0)
+
+    def process(self, cues, latency_factor=1.0, tokens=0, extra=0.0):
+        """占用一个处理槽并按容量曲线休眠，返回生成耗时；过载时返回None"""
+        with self.lock:
+            if self.waiting >= self.max_queue:
+                self.stats["rejected"] += 1
+                return None
+            self.waiting += 1
+        self.slot_semaphore.acquire()
+        try:
+            with self.lock:
+                self.waiting -= 1
+                self.active += 1
+                active = self.active
+            delay = (self.base_latency + self.per_cue_latency * cues) * (1 + self.contention * (active - 1))
+            delay = (delay + self.per_token_latency * tokens) * latency_factor + extra
+            if random.random() < self.stall_rate:
+                delay += self.stall_time
+            time.sleep(delay)
+            with self.lock:
+                self.stats["requests"] += 1
+                self.stats["cues"] += cues
+            return delay
+        finally:
+            with self.lock:
+                self.active -= 1
+            self.slot_semaphore.release()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 和Ollama一样保持连接、关闭Nagle算法，客户端连接池的行为才和实际使用时相同；
+            # 不关闭时响应头和响应体分两次发送，保持的连接上每个响应要多等一次延迟确认
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_result(self, payload, prompt_tokens, result, delay, make_body):
+                """带上Ollama的统计字段；字符数当作token数。make_body(文本) 生成响应中放文本的字段"""
+                data = {"model": payload.get("model"), "done": True, "prompt_eval_count": prompt_tokens,
+                        "prompt_eval_duration": int(prompt_tokens * server.prompt_token_latency * 1e9),
+                        "eval_count": len(result), "eval_duration": int(delay * 1e9),
+                        "total_duration": int(delay * 1e9)}
+                if not payload.get("stream"):
+                    data.update(make_body(result))
+                    self._send_json(200, data)
+                    return
+                # 流式：每块几个字，最后一块带统计字段，不带Content-Length，写完关闭连接
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for i in range(0, len(result), STREAM_PIECE):
+                    chunk = {"model": payload.get("model"), "done": False}
+                    chunk.update(make_body(result[i:i + STREAM_PIECE]))
+                    self.wfile.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(STREAM_INTERVAL)
+                data.update(make_body(""))
+                self.wfile.write((json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.close_connection = True
+
+            def _send_json(self, status, data):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    time.sleep(server.tags_delay)
+                    self._send_json(200, {"models": [{"name": name} for name in server.models]})
+                elif self.path == "/api/ps":
+                    with server.lock:
+                        loaded = [{"name": name, "model": name, "context_length": ctx}
+                                  for name, ctx in server.loaded_ctx.items()]
+                    self._send_json(200, {"models": loaded})
+                elif self.path == "/stats":
+                    with server.lock:
+                        self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": "invalid json"})
+                    return
+
+                if self.path == "/api/generate":
+                    # 通用模型提示词：说明在第一行，待翻译文本在后面
+                    prompt = payload.get("prompt", "")
+                    text = prompt.split("\n", 1)[1] if "\n" in prompt else prompt
+                    model = payload.get("model")
+                    result, cues = server.translate(text, model)
+                    result, reload_delay = server.finish(result, model, payload.get("options") or {})
+                    prompt_tokens = server.evaluate_prompt(payload.get("system", "") + prompt)
+                    delay = server.process(cues, server.latency_factor(model), len(result),
+                                           reload_delay + prompt_tokens * server.prompt_token_latency)
+                    if delay is None:
+                        self._send_json(503, {"error": "server overloaded"})
+                        return
+                    self._send_result(payload, prompt_tokens, result, delay, lambda text: {"response": text})
+                elif self.path == "/api/chat":
+                    # 通用模型的对话以系统提示词和示例开头，最后一条是待翻译的文本
+                    messages = payload.get("messages") or [{}]
+                    content = messages[-1].get("content", "")
+                    match = re.search(r"### Input:\n(.*?)\n\n### Response:", content, re.S)
+                    model = payload.get("model")
+                    result, cues = server.translate(match.group(1) if match else content, model)
+                    result, reload_delay = server.finish(result, model, payload.get("options") or {})
+                    # 按聊天模板展开后的提示词计算缓存
+                    prompt_tokens = server.evaluate_prompt(
+                        "".join(f"<|{m.get('role')}|>{m.get('content', '')}" for m in messages))
+                    delay = server.process(cues, server.latency_factor(model), len(result),
+                                           reload_delay + prompt_tokens * server.prompt_token_latency)
+                    if delay is None:
+                        self._send_json(503, {"error": "server overloaded"})
+                        return
+                    self._send_result(payload, prompt_tokens, result, delay,
+                                      lambda text: {"message": {"role": "assistant", "content": text}})
+                elif self.path == "/api/pull":
+                    self._send_json(200, {"status": "success"})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+        return Handler
+
+
+def parse_profiles(specs):
+    """把 模型名:延迟倍数:质量 形式的参数转为 model_profiles；模型名本身可以含冒号"""
+    profiles = {}
+    for spec in specs:
+        name, latency, quality = spec.rsplit(":", 2)
+        profiles[name] = {"latency": float(latency), "quality": float(quality)}
+    return profiles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地Ollama替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--slots", type=int, default=4, help="同时处理的请求数")
+    parser.add_argument("--base-latency", type=float, default=0.3, help="每个请求的固定耗时(秒)")
+    parser.add_argument("--per-cue-latency", type=float, default=0.05, help="每条字幕增加的耗时(秒)")
+    parser.add_argument("--contention", type=float, default=0.15, help="每多一个并发请求的减速比例")
+    parser.add_argument("--max-queue", type=int, default=32, help="排队上限，超过返回503")
+    parser.add_argument("--tags-delay", type=float, default=0.0, help="模型列表接口的延迟(秒)，模拟冷启动")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="请求卡住的概率")
+    parser.add_argument("--stall-time", type=float, default=10.0, help="卡住的请求额外耗时(秒)")
+    parser.add_argument("--chatter", type=int, default=0, help="译文后追加的说明文字字数")
+    parser.add_argument("--per-token-latency", type=float, default=0.0, help="每个输出字符的耗时(秒)")
+    parser.add_argument("--reload-time", type=float, default=0.0, help="num_ctx变化时重新加载模型的耗时(秒)")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0002, help="评估每个提示词字符的耗时(秒)")
+    parser.add_argument("--profile", action="append", default=[], metavar="模型名:延迟倍数:质量",
+                        help="模拟多个模型，如 fast:7b:0.5:0.8，可重复指定")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.slots, args.base_latency,
+                              args.per_cue_latency, args.contention, args.max_queue, tags_delay=args.tags_delay,
+                              stall_rate=args.stall_rate, stall_time=args.stall_time,
+                              model_profiles=parse_profiles(args.profile), chatter=args.chatter,
+                              per_token_latency=args.per_token_latency, reload_time=args.reload_time,
+                              prompt_token_latency=args.prompt_token_latency)
+    print(f"Ollama替身服务已启动: {server.url} (slots={args.slots})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
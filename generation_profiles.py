@@ -0,0 +1,165 @@
+"""按模型保存的生成参数方案
+
+不带任何参数时，Ollama按模型的默认设置生成：可能输出远多于一条字幕所需的token、上下文窗口过大、
+以较高的temperature采样，都白白占用GPU时间。方案中的参数：
+  num_predict  输出上限，按待翻译文本的字数乘以比例（字数当作token数的上限估计）
+  num_ctx      按提示词和输出上限估计，取 NUM_CTX_BUCKETS 中够用的最小一档；
+               Ollama在num_ctx变化时会重新加载模型，所以只增不减：从模型当前加载时的上下文
+               （/api/ps 的 context_length）或上次用到的一档开始，用到的最大一档按地址和模型保存
+  temperature/seed  确定性解码，同样的输入得到同样的译文
+  stop         单条翻译遇到空行即停（模型常在空行后追加说明），批量翻译不设
+  keep_alive   翻译期间模型常驻显存，避免两次请求之间被卸载
+
+方案按模型名保存在 ~/.srt_trans/generation_profiles.json，也可以在其中的 "profiles" 下自定义方案；
+"contexts" 下记录各地址上各模型用到的num_ctx。
+"""
+import threading
+
+import config_store
+
+PROFILES_FILE = "generation_profiles.json"
+NUM_CTX_BUCKETS = (1024, 2048, 4096, 8192, 16384)
+
+BUILTIN_PROFILES = {
+    # 不传任何参数，与以前的请求相同
+    "Ollama默认": {},
+    "标准": {
+        "num_predict_ratio": 4, "num_predict_min": 64,
+        "temperature": 0, "seed": 42, "num_ctx": "auto",
+        "stop": {"single": ["\n\n"], "special": ["\n\n", "###"]},
+        "keep_alive": "30m",
+    },
+    "精简": {
+        "num_predict_ratio": 2, "num_predict_min": 24,
+        "temperature": 0, "seed": 42, "top_k": 1, "num_ctx": "auto",
+        "stop": {"single": ["\n\n"], "special": ["\n\n", "###"]},
+        "keep_alive": "30m",
+    },
+}
+DEFAULT_PROFILE = "标准"
+
+# 批量请求的JSON数组中每条的引号、逗号等额外token
+BATCH_OVERHEAD_PER_ITEM = 8
+
+
+def load_settings():
+    settings = config_store.load_json(PROFILES_FILE, {})
+    return settings if isinstance(settings, dict) else {}
+
+
+def available_profiles():
+    """内置方案和配置文件中自定义的方案"""
+    profiles = dict(BUILTIN_PROFILES)
+    profiles.update(load_settings().get("profiles", {}))
+    return profiles
+
+
+def profile_name_for(model):
+    name = load_settings().get("models", {}).get(model, DEFAULT_PROFILE)
+    return name if name in available_profiles() else DEFAULT_PROFILE
+
+
+def save_profile_name(model, name):
+    settings = load_settings()
+    settings.setdefault("models", {})[model] = name
+    config_store.save_json(PROFILES_FILE, settings)
+
+
+def _context_key(api_url, model):
+    return f"{api_url} {model}"
+
+
+def saved_context(api_url, model):
+    """该地址上该模型上次用到的num_ctx，没有记录时返回0"""
+    return load_settings().get("contexts", {}).get(_context_key(api_url, model), 0)
+
+
+def save_context(api_url, model, num_ctx):
+    settings = load_settings()
+    settings.setdefault("contexts", {})[_context_key(api_url, model)] = num_ctx
+    config_store.save_json(PROFILES_FILE, settings)
+
+
+def loaded_context(api_url, model, timeout=3):
+    """模型当前加载时的上下文大小（/api/ps 的 context_length）；未加载、Ollama版本不提供或连不上时返回0"""
+    # requests 导入较慢，第一次用到时才导入
+    import requests
+    try:
+        response = requests.get(f"{api_url}/api/ps", timeout=timeout)
+        response.raise_for_status()
+        for entry in response.json().get("models", []):
+            if model in (entry.get("name"), entry.get("model")):
+                return int(entry.get("context_length") or 0)
+    except Exception as e:
+        print(f"查询模型当前的上下文大小失败: {str(e)}")
+    return 0
+
+
+class GenerationProfile:
+    def __init__(self, name=DEFAULT_PROFILE, settings=None, model=None, api_url=None):
+        self.name = name
+        self.settings = available_profiles().get(name, {}) if settings is None else settings
+        self.model = model
+        self.api_url = api_url
+        self.num_ctx = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_model(cls, model, name=None, api_url=None):
+        """name为None时使用该模型保存的方案；给出api_url时可以用 start_context 从已加载的上下文开始"""
+        return cls(name or profile_name_for(model), model=model, api_url=api_url)
+
+    def start_context(self):
+        """发请求前调用（会访问网络）：模型已加载时从它当前的上下文开始，否则从上次用到的一档开始。
+        比已加载的上下文小的num_ctx也会让Ollama重新加载模型，所以不能只按提示词长度从最小一档开始"""
+        if self.settings.get("num_ctx") != "auto" or not self.api_url or not self.model:
+            return self.num_ctx
+        start = loaded_context(self.api_url, self.model) or saved_context(self.api_url, self.model)
+        with self.lock:
+            self.num_ctx = max(self.num_ctx, start)
+            return self.num_ctx
+
+    def size_context(self, prompt_length, num_predict):
+        """够用的最小一档上下文；只增不减，避免Ollama反复重新加载模型，增大时记录下来供下次从这一档开始"""
+        needed = prompt_length + num_predict
+        bucket = next((size for size in NUM_CTX_BUCKETS if size >= needed), NUM_CTX_BUCKETS[-1])
+        with self.lock:
+            grew = bucket > self.num_ctx
+            self.num_ctx = max(self.num_ctx, bucket)
+            num_ctx = self.num_ctx
+        if grew and self.api_url and self.model:
+            save_context(self.api_url, self.model, num_ctx)
+        return num_ctx
+
+    def payload(self, kind, prompt, text_length, count=1):
+        """请求中要加的字段：options 和 keep_alive。kind 为 single/batch/special，prompt 为提示词或对话消息列表"""
+        settings = self.settings
+        if not settings:
+            return {}
+        options = {}
+        if "num_predict_ratio" in settings:
+            overhead = BATCH_OVERHEAD_PER_ITEM * count if kind == "batch" else 0
+            options["num_predict"] = max(settings.get("num_predict_min", 0),
+                                         int(text_length * settings["num_predict_ratio"]) + overhead)
+        num_ctx = settings.get("num_ctx")
+        if num_ctx == "auto":
+            prompt_length = len(prompt) if isinstance(prompt, str) else sum(len(m["content"]) for m in prompt)
+            options["num_ctx"] = self.size_context(prompt_length, options.get("num_predict", 0))
+        elif num_ctx:
+            options["num_ctx"] = num_ctx
+        for key in ("temperature", "seed", "top_k", "top_p", "repeat_penalty"):
+            if key in settings:
+                options[key] = settings[key]
+        stop = settings.get("stop", {}).get(kind)
+        if stop:
+            options["stop"] = stop
+        payload = {"options": options} if options else {}
+        if settings.get("keep_alive") is not None:
+            payload["keep_alive"] = settings["keep_alive"]
+        return payload
+
+    def describe(self):
+        parts = [f"生成参数方案: {self.name}"]
+        if self.num_ctx:
+            parts.append(f"num_ctx {self.num_ctx}")
+        return "，".join(parts)
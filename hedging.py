@@ -0,0 +1,87 @@
+"""对冲请求策略
+
+偶尔有一条生成卡住直到超时，按顺序输出的结果都要等它。对冲：一个请求运行时间超过
+同长度档位近期延迟的p95仍未返回时，再发一份相同的请求（优先发到其他地址），
+先返回有效结果的那个被采用，另一个取消。被取消的主请求按已运行的时间计入延迟，出错的请求也计入。备份请求数不超过总请求数的 budget（默认5%），
+避免在服务整体变慢时把负载翻倍。
+"""
+import threading
+from collections import deque
+
+# 按待翻译文本的字符数分档，不同长度的请求延迟差别很大
+LENGTH_CLASSES = (20, 50, 100, 200, 500)
+
+
+class HedgePolicy:
+    def __init__(self, budget=0.05, percentile=0.95, min_samples=20, window=200):
+        self.budget = budget
+        self.percentile = percentile
+        # 样本太少时p95不可靠，不对冲
+        self.min_samples = min_samples
+        self.window = window
+        self.latencies = {}  # 长度档位 -> 最近的延迟
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0  # 备份请求先返回的次数
+        self.saved = 0.0  # 备份请求先返回时，估计主请求还要多久才能返回，秒数之和
+        self.failures = 0  # 出错或结果无效的请求数（主请求和备份请求都算）
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def length_class(size):
+        for bound in LENGTH_CLASSES:
+            if size <= bound:
+                return bound
+        return None
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def record_latency(self, length_class, latency):
+        with self.lock:
+            self.latencies.setdefault(length_class, deque(maxlen=self.window)).append(latency)
+
+    def hedge_delay(self, length_class):
+        """该档位的请求运行超过这个时间就对冲，样本不足时返回None"""
+        with self.lock:
+            samples = self.latencies.get(length_class)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def estimate_remaining(self, length_class, elapsed):
+        """已运行elapsed秒仍未返回的请求估计还要多久：同档位中比elapsed更慢的样本的平均值减去elapsed。
+        没有更慢的样本时无从估计，按0计（节省的时间只会少算）"""
+        with self.lock:
+            slower = [latency for latency in self.latencies.get(length_class, ()) if latency > elapsed]
+        if not slower:
+            return 0.0
+        return sum(slower) / len(slower) - elapsed
+
+    def try_hedge(self):
+        """预算内占用一次对冲名额"""
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self, saved):
+        """saved为 estimate_remaining 估计的主请求剩余时间"""
+        with self.lock:
+            self.wins += 1
+            self.saved += max(0.0, saved)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    @property
+    def hedge_rate(self):
+        return self.hedges / self.requests if self.requests else 0.0
+
+    def describe(self):
+        return (f"对冲 {self.hedges} 次（占请求的 {self.hedge_rate:.1%}），其中备份请求先返回 {self.wins} 次，"
+                f"估计节省 {self.saved:.1f} 秒；请求出错 {self.failures} 次")
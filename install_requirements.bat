@@ -6,6 +6,7 @@ pip install srt
 pip install tkinterdnd2
 pip install requests
 pip install ollama
+pip install httpx
 pip install charset-normalizer
 
 echo.
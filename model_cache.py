@@ -0,0 +1,51 @@
+"""模型列表缓存
+
+启动时先用上次从各API地址取得的模型列表填充下拉框、启用控件，再在后台向 /api/tags 刷新；
+Ollama冷启动或暂时连不上时窗口也能立即使用。上次使用的API地址一并保存。
+模型基准测试(model_test.py)推荐的默认模型也保存在这里，下拉框优先选中它。
+"""
+import config_store
+
+MODELS_FILE = "models.json"
+DEFAULT_API_URL = "http://localhost:11434"
+
+
+def load_model_cache():
+    cache = config_store.load_json(MODELS_FILE, {})
+    return cache if isinstance(cache, dict) else {}
+
+
+def last_api_url():
+    return load_model_cache().get("api_url") or DEFAULT_API_URL
+
+
+def cached_models(api_url):
+    """该地址上次取得的模型列表，没有时返回空列表"""
+    return load_model_cache().get("models", {}).get(api_url, [])
+
+
+def save_models(api_url, models):
+    cache = load_model_cache()
+    cache["api_url"] = api_url
+    cache.setdefault("models", {})[api_url] = models
+    config_store.save_json(MODELS_FILE, cache)
+
+
+def default_model():
+    return load_model_cache().get("default_model")
+
+
+def save_default_model(model):
+    cache = load_model_cache()
+    cache["default_model"] = model
+    config_store.save_json(MODELS_FILE, cache)
+
+
+def fetch_models(api_url, timeout=5):
+    """向Ollama查询模型列表，连不上或返回错误时抛出异常"""
+    # requests 导入较慢，第一次用到时才导入
+    import requests
+    response = requests.get(f"{api_url}/api/tags", timeout=timeout)
+    if response.status_code != 200:
+        raise Exception("Ollama服务未运行或无法访问")
+    return [model["name"] for model in response.json().get("models", [])]
@@ -1,143 +1,274 @@
-import ollama
+"""翻译模型基准测试
+
+把一组字幕（默认20个日语句子，也可以指定SRT或每行一句的文本文件）交给Ollama上的每个模型，
+在几个并发数下逐条翻译，记录 字幕/秒、token/秒（Ollama返回的 eval_count）、延迟分位数、超时率和出错率，
+并用几项廉价的自动检查估计翻译质量：译文非空且不同于原文、目标语言文字的比例、长度比例、
+没有“以下是翻译”之类的多余说明。按速度排名，质量低于阈值的模型排在后面；
+--set-default 把质量达标的最快模型保存为界面中的默认模型。
+
+用法:
+    python model_test.py                                  # 测试本机Ollama上的所有模型
+    python model_test.py --models qwen2.5:7b --concurrency 1 4 8
+    python model_test.py --corpus sample_ja.srt --set-default
+    python model_test.py --fake                           # 在本地替身服务上离线运行
+"""
+import argparse
+import json
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-def test_translation(model_name="7shi/llama-translate:8b-q4_K_M"):
-    """测试翻译模型的功能"""
-    print("开始测试翻译模型...")
-    
-    # 测试用例：20个日语句子
-    test_cases = [
-        "今日はとても良い天気ですね。",
-        "新しいプロジェクトを始めることになりました。",
-        "このレストランの料理は本当に美味しいです。",
-        "来週の会議の準備を進めています。",
-        "最近、新しい趣味を見つけました。",
-        "この本はとても面白かったです。",
-        "明日は友達と映画を見に行く予定です。",
-        "新しいスマートフォンを買いました。",
-        "毎日運動するようにしています。",
-        "このアプリは使いやすいですね。",
-        "来月から新しい仕事を始めます。",
-        "週末は家族と過ごす予定です。",
-        "この問題は複雑すぎます。",
-        "新しい言語を勉強するのは楽しいです。",
-        "この映画は感動的でした。",
-        "来年の目標を考えています。",
-        "このレシピは簡単に作れます。",
-        "新しい友達ができました。",
-        "このゲームは面白いですね。",
-        "来週から旅行に行きます。"
-    ]
-
-    # 翻译结果存储
-    results = []
-    
-    # 测试翻译
-    for i, text in enumerate(test_cases, 1):
-        print(f"\n测试用例 {i}/20:")
-        print(f"原文: {text}")
-        
-        try:
-            # 翻译成中文
-            prompt = f"""### Instruction:
-Translate Japanese to Mandarin.
+import requests
 
-### Input:
-{text}
+from cue_store import CueStore
+from model_cache import last_api_url, fetch_models, save_default_model
+from translate_common import SPECIAL_MODEL, LANG_NAMES, build_general_messages, build_special_prompt
 
-### Response:
-"""
-            messages = [{"role": "user", "content": prompt}]
-            response = ollama.chat(model=model_name, messages=messages)
-            chinese_trans = response["message"]["content"].strip()
-            
-            # 翻译成英文
-            prompt = f"""### Instruction:
-Translate Japanese to English.
-
-### Input:
-{text}
-
-### Response:
-"""
-            messages = [{"role": "user", "content": prompt}]
-            response = ollama.chat(model=model_name, messages=messages)
-            english_trans = response["message"]["content"].strip()
-            
-            results.append({
-                "original": text,
-                "chinese": chinese_trans,
-                "english": english_trans
-            })
-            
-            print(f"中文翻译: {chinese_trans}")
-            print(f"英文翻译: {english_trans}")
-            
-            # 添加短暂延迟，避免请求过快
-            time.sleep(1)
-            
+# 默认测试用例：20个日语句子
+TEST_CASES = [
+    "今日はとても良い天気ですね。",
+    "新しいプロジェクトを始めることになりました。",
+    "このレストランの料理は本当に美味しいです。",
+    "来週の会議の準備を進めています。",
+    "最近、新しい趣味を見つけました。",
+    "この本はとても面白かったです。",
+    "明日は友達と映画を見に行く予定です。",
+    "新しいスマートフォンを買いました。",
+    "毎日運動するようにしています。",
+    "このアプリは使いやすいですね。",
+    "来月から新しい仕事を始めます。",
+    "週末は家族と過ごす予定です。",
+    "この問題は複雑すぎます。",
+    "新しい言語を勉強するのは楽しいです。",
+    "この映画は感動的でした。",
+    "来年の目標を考えています。",
+    "このレシピは簡単に作れます。",
+    "新しい友達ができました。",
+    "このゲームは面白いですね。",
+    "来週から旅行に行きます。",
+]
+
+# 模型在译文前后加的说明文字
+CHATTER_MARKERS = ("翻译结果", "译文：", "以下是", "Translation:", "Here is", "Sure", "###", "Note:")
+
+# 请求出错（连接失败、HTTP错误等）时代替译文的标记，与超时(None)分开统计
+ERROR = object()
+
+# 译文与原文的长度比例超出这个范围视为漏译或胡乱生成
+LENGTH_RATIO_RANGE = (0.2, 5.0)
+
+# --fake 时替身服务上模拟的模型：延迟倍数和正常翻译的概率
+FAKE_PROFILES = {
+    "qwen2.5:7b": {"latency": 1.0, "quality": 0.97},
+    "qwen2.5:3b": {"latency": 0.5, "quality": 0.7},
+    "llama3.1:8b": {"latency": 1.3, "quality": 0.9},
+    SPECIAL_MODEL: {"latency": 0.8, "quality": 0.95},
+}
+
+
+def load_corpus(path=None, limit=None):
+    """读取测试语料：SRT文件取每条字幕，其他文本文件每行一句"""
+    if path is None:
+        texts = list(TEST_CASES)
+    elif path.lower().endswith(".srt"):
+        store = CueStore.from_file(path)
+        texts = [store.content(i) for i in range(len(store)) if store.content(i).strip()]
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+    if not texts:
+        raise Exception(f"测试语料为空: {path}")
+    return texts[:limit] if limit else texts
+
+
+def translate_once(api_url, model, text, src_lang, dest_lang, timeout):
+    """翻译一条，返回 (译文, 延迟, 生成的token数)；超时返回的译文为None"""
+    if model == SPECIAL_MODEL:
+        messages = [{"role": "user", "content": build_special_prompt(text, src_lang, dest_lang)}]
+    else:
+        messages = build_general_messages(text, src_lang, dest_lang)
+    url = f"{api_url}/api/chat"
+    payload = {"model": model, "stream": False, "messages": messages}
+    start = time.time()
+    try:
+        response = requests.post(url, json=payload, timeout=timeout)
+    except requests.exceptions.Timeout:
+        return None, time.time() - start, 0
+    latency = time.time() - start
+    if response.status_code != 200:
+        raise Exception(f"模型 {model} 请求失败: HTTP {response.status_code}")
+    data = response.json()
+    result = data["message"]["content"]
+    return result.strip(), latency, data.get("eval_count", 0)
+
+
+def script_ratio(text, dest_lang):
+    """译文中属于目标语言文字的字符比例（只统计字母和汉字，不含标点数字）"""
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return 0.0
+    if dest_lang == '中文':
+        matched = sum(1 for c in letters if '一' <= c <= '鿿')
+    elif dest_lang == '日语':
+        matched = sum(1 for c in letters if '぀' <= c <= 'ヿ' or '一' <= c <= '鿿')
+    else:
+        matched = sum(1 for c in letters if c.isascii())
+    return matched / len(letters)
+
+
+def quality_score(source, result, dest_lang):
+    """0~1的质量估计：空译文或与原文相同时为0，否则取文字比例、长度比例、无多余说明三项的平均"""
+    if not result or result.strip() == source.strip():
+        return 0.0
+    low, high = LENGTH_RATIO_RANGE
+    length_ok = 1.0 if low <= len(result) / max(len(source), 1) <= high else 0.0
+    no_chatter = 0.0 if any(marker in result for marker in CHATTER_MARKERS) else 1.0
+    return (script_ratio(result, dest_lang) + length_ok + no_chatter) / 3
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_level(api_url, model, texts, concurrency, args):
+    """以固定并发数翻译整个语料一遍"""
+    def work(text):
+        try:
+            return translate_once(api_url, model, text, args.src, args.dest, args.timeout)
         except Exception as e:
             print(f"翻译出错: {str(e)}")
-            continue
-    
-    return results
-
-def evaluate_translations(results):
-    """评估翻译质量"""
-    print("\n=== 翻译质量评估 ===")
-    
-    # 评估标准
-    criteria = {
-        "准确性": "翻译是否准确传达了原文的意思",
-        "流畅性": "翻译是否自然流畅",
-        "完整性": "是否完整翻译了所有内容"
+            return ERROR, 0.0, 0
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(work, texts))
+    elapsed = max(time.time() - start, 1e-6)
+
+    # 超时和出错的请求不计入延迟和吞吐，质量按0分计
+    translated = [result if isinstance(result, str) else None for result, _, _ in results]
+    latencies = sorted(latency for result, latency, _ in results if isinstance(result, str))
+    timeouts = sum(1 for result, _, _ in results if result is None)
+    errors = sum(1 for result, _, _ in results if result is ERROR)
+    tokens = sum(count for _, _, count in results)
+    scores = [quality_score(text, result, args.dest) for text, result in zip(texts, translated)]
+    return {
+        "concurrency": concurrency,
+        "cues_per_sec": round(len(latencies) / elapsed, 2),
+        "tokens_per_sec": round(tokens / elapsed, 1),
+        "p50": round(percentile(latencies, 0.5), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "timeout_rate": round(timeouts / len(texts), 3),
+        "error_rate": round(errors / len(texts), 3),
+        "quality": round(sum(scores) / len(scores), 3),
+        "samples": [{"source": text, "result": result} for text, result in list(zip(texts, translated))[:3]],
     }
-    
-    # 评估结果
-    evaluation = {
-        "准确性": {"good": 0, "fair": 0, "poor": 0},
-        "流畅性": {"good": 0, "fair": 0, "poor": 0},
-        "完整性": {"good": 0, "fair": 0, "poor": 0}
+
+
+def benchmark_model(api_url, model, texts, args):
+    print(f"\n=== {model} ===")
+    # 第一个请求要把模型载入显存，不计入结果
+    try:
+        translate_once(api_url, model, texts[0], args.src, args.dest, max(args.timeout, 120))
+    except Exception as e:
+        print(f"模型预热失败: {str(e)}")
+    levels = []
+    for concurrency in args.concurrency:
+        level = run_level(api_url, model, texts, concurrency, args)
+        print(f"并发 {concurrency:>3}: {level['cues_per_sec']:>7.2f} 条/秒 {level['tokens_per_sec']:>8.1f} token/秒 "
+              f"p50 {level['p50']:.2f}s p95 {level['p95']:.2f}s p99 {level['p99']:.2f}s "
+              f"超时 {level['timeout_rate']:.0%} 出错 {level['error_rate']:.0%} 质量 {level['quality']:.2f}")
+        levels.append(level)
+    best = max(levels, key=lambda level: level["cues_per_sec"])
+    return {
+        "model": model,
+        "quality": round(sum(level["quality"] for level in levels) / len(levels), 3),
+        "best_cues_per_sec": best["cues_per_sec"],
+        "best_concurrency": best["concurrency"],
+        "levels": levels,
     }
-    
-    # 评估每个翻译
-    for result in results:
-        print(f"\n原文: {result['original']}")
-        print(f"中文: {result['chinese']}")
-        print(f"英文: {result['english']}")
-        
-        # 这里可以添加更详细的评估逻辑
-        # 目前使用简单的计数方式
-        
-        # 准确性评估
-        if len(result['chinese']) > 0 and len(result['english']) > 0:
-            evaluation["准确性"]["good"] += 1
-        else:
-            evaluation["准确性"]["poor"] += 1
-            
-        # 流畅性评估
-        if "。" in result['chinese'] or "。" in result['english']:
-            evaluation["流畅性"]["good"] += 1
-        else:
-            evaluation["流畅性"]["fair"] += 1
-            
-        # 完整性评估
-        if len(result['chinese']) > len(result['original']) * 0.5 and \
-           len(result['english']) > len(result['original']) * 0.5:
-            evaluation["完整性"]["good"] += 1
+
+
+def rank_models(results, min_quality):
+    """质量达标的模型按速度排在前面，其余按质量排在后面；返回 (排名, 推荐模型)。
+    专用翻译模型用专用提示词测试，界面中是单独的开关，不推荐为默认的通用模型"""
+    passed = sorted((r for r in results if r["quality"] >= min_quality), key=lambda r: -r["best_cues_per_sec"])
+    failed = sorted((r for r in results if r["quality"] < min_quality), key=lambda r: -r["quality"])
+    recommended = next((r["model"] for r in passed if r["model"] != SPECIAL_MODEL), None)
+    return passed + failed, recommended
+
+
+def format_report(ranked, recommended, args, corpus_size):
+    lines = [f"语料 {corpus_size} 条，{args.src}→{args.dest}，质量阈值 {args.min_quality:.2f}",
+             f"{'排名':<4} {'模型':<32} {'质量':>6} {'最快(条/秒)':>12} {'最佳并发':>8} {'p95(秒)':>8} {'超时率':>6} {'出错率':>6}"]
+    for rank, result in enumerate(ranked, 1):
+        best = next(level for level in result["levels"] if level["concurrency"] == result["best_concurrency"])
+        mark = "" if result["quality"] >= args.min_quality else "  (质量不达标)"
+        if result["model"] == SPECIAL_MODEL:
+            mark += "  (专用翻译模型，不作为默认模型)"
+        lines.append(f"{rank:<6} {result['model']:<32} {result['quality']:>8.2f} {result['best_cues_per_sec']:>14.2f} "
+                     f"{result['best_concurrency']:>10} {best['p95']:>10.2f} {best['timeout_rate']:>8.0%} {best['error_rate']:>8.0%}{mark}")
+    lines.append(f"推荐默认模型: {recommended}" if recommended else "没有质量达标的通用模型")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="翻译模型基准测试")
+    parser.add_argument("--api", default=None, help="Ollama API地址，默认为上次使用的地址")
+    parser.add_argument("--models", nargs="+", help="要测试的模型，默认为 /api/tags 列出的所有模型")
+    parser.add_argument("--corpus", help="测试语料，SRT文件或每行一句的文本文件")
+    parser.add_argument("--limit", type=int, help="只取语料的前N条")
+    parser.add_argument("--src", default="日语", choices=list(LANG_NAMES))
+    parser.add_argument("--dest", default="中文", choices=list(LANG_NAMES))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="依次测试的并发数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="单条请求的超时(秒)")
+    parser.add_argument("--min-quality", type=float, default=0.8, help="推荐模型需要达到的质量分")
+    parser.add_argument("--report", default="model_report.json", help="报告文件，同时写一份同名的 .txt")
+    parser.add_argument("--set-default", action="store_true", help="把推荐的模型保存为界面中的默认模型")
+    parser.add_argument("--fake", action="store_true", help="在本地Ollama替身服务上运行，模拟几个快慢、质量不同的模型")
+    args = parser.parse_args()
+
+    server = None
+    if args.fake:
+        from fake_ollama import FakeOllamaServer
+        server = FakeOllamaServer(slots=4, base_latency=0.2, per_cue_latency=0.03, contention=0.15,
+                                  max_queue=1024, model_profiles=FAKE_PROFILES).start()
+        api_url = server.url
+    else:
+        api_url = (args.api or last_api_url()).rstrip('/')
+
+    try:
+        texts = load_corpus(args.corpus, args.limit)
+        models = args.models or fetch_models(api_url)
+        if not models:
+            raise Exception("没有可用的模型，请先用 ollama pull 下载模型")
+        print(f"=== 开始模型测试: {len(models)} 个模型，{len(texts)} 条语料，并发 {args.concurrency} ===")
+        results = [benchmark_model(api_url, model, texts, args) for model in models]
+    finally:
+        if server:
+            server.stop()
+
+    ranked, recommended = rank_models(results, args.min_quality)
+    report = format_report(ranked, recommended, args, len(texts))
+    print("\n=== 测试结果 ===\n" + report)
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"api_url": api_url, "src_lang": args.src, "dest_lang": args.dest, "corpus_size": len(texts),
+                   "min_quality": args.min_quality, "recommended": recommended, "models": ranked},
+                  f, ensure_ascii=False, indent=2)
+    with open(os.path.splitext(args.report)[0] + ".txt", 'w', encoding='utf-8') as f:
+        f.write(report + "\n")
+    print(f"报告已保存: {args.report}")
+
+    if args.set_default and recommended:
+        if args.fake:
+            print("替身服务上的结果不保存为默认模型")
         else:
-            evaluation["完整性"]["fair"] += 1
-    
-    # 输出评估结果
-    print("\n=== 评估结果 ===")
-    for criterion, scores in evaluation.items():
-        print(f"\n{criterion}:")
-        print(f"优秀: {scores['good']}")
-        print(f"一般: {scores['fair']}")
-        print(f"较差: {scores['poor']}")
+            save_default_model(recommended)
+            print(f"已将 {recommended} 设为默认模型")
+
 
 if __name__ == "__main__":
-    print("=== 开始模型测试 ===")
-    results = test_translation()
-    evaluate_translations(results)
-    print("\n=== 测试完成 ===")
+    main()
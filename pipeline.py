@@ -0,0 +1,226 @@
+"""分阶段的生产者/消费者流水线
+
+每个阶段有自己的输入队列（有上限）和工作线程数：下游处理不过来时上游的 put 会阻塞，
+形成背压；上游的预处理可以提前跑在请求前面，不让模型等待Python端的正则分析或文件读写。
+每个阶段记录处理条数、忙碌时间和队列深度，可随时取快照。
+"""
+import queue
+import threading
+import time
+
+# 结束标记，从第一个阶段依次传到最后一个阶段
+_DONE = object()
+
+
+class StageStats:
+    """一个阶段的统计：处理条数、忙碌时间、当前/最大队列深度"""
+
+    def __init__(self, name, workers=1, depth=None):
+        self.name = name
+        self.workers = workers
+        self.depth = depth or (lambda: 0)
+        self.processed = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, count, busy):
+        with self.lock:
+            self.processed += count
+            self.busy += busy
+
+    def sample_depth(self):
+        depth = self.depth()
+        self.max_depth = max(self.max_depth, depth)
+        return depth
+
+    def snapshot(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        with self.lock:
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "depth": self.sample_depth(),
+                "max_depth": self.max_depth,
+                "processed": self.processed,
+                "busy": round(self.busy, 3),
+                # 忙碌时间占 (工作线程数 × 总时长) 的比例
+                "utilization": round(self.busy / (elapsed * self.workers), 3),
+            }
+
+
+def describe_queues(stats):
+    """状态栏中显示的各阶段队列深度"""
+    return " ".join(f"{s.name}{s.sample_depth()}" for s in stats)
+
+
+def format_stage_stats(stats):
+    """流水线结束时打印/显示的各阶段汇总"""
+    lines = [f"{'阶段':<6} {'线程':>4} {'条数':>8} {'忙碌(秒)':>10} {'利用率':>8} {'最大队列':>8}"]
+    for s in stats:
+        snapshot = s.snapshot()
+        lines.append(f"{snapshot['name']:<8} {snapshot['workers']:>4} {snapshot['processed']:>8} "
+                     f"{snapshot['busy']:>12.2f} {snapshot['utilization']:>10.0%} {snapshot['max_depth']:>10}")
+    return "\n".join(lines)
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, queue_size=64, batch_size=None, limit=None):
+        self.name = name
+        # func 接收一批输入，返回要交给下一阶段的输出列表
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size or (lambda: 1)
+        # 同时在处理的线程数上限，可以随自动调优变化
+        self.limit = limit or (lambda: workers)
+        self.input = queue.Queue(maxsize=queue_size)
+        self.output = None
+        self.stats = StageStats(name, workers, self.input.qsize)
+        self.active = 0
+        self.gate = threading.Condition()
+        self.remaining = workers
+        self.remaining_lock = threading.Lock()
+
+
+class Pipeline:
+    def __init__(self, should_stop=None):
+        self.stages = []
+        self.extra_stats = {}
+        self.late_stats = set()  # 流水线运行之后才开始的步骤（如最终写文件），统计排在各阶段之后
+        self.ran = False
+        self.should_stop = should_stop or (lambda: False)
+        self.error = None
+
+    def add_stage(self, name, func, workers=1, queue_size=64, batch_size=None, limit=None):
+        stage = Stage(name, func, workers, queue_size, batch_size, limit)
+        if self.stages:
+            self.stages[-1].output = stage.input
+        self.stages.append(stage)
+        return stage
+
+    def timed(self, name, func, *args):
+        """在流水线线程之外执行的步骤（如解析、最终写文件）也计入同名阶段的统计"""
+        stats = self.get_stats(name)
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            stats.record(1, time.time() - start)
+
+    def get_stats(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage.stats
+        if name not in self.extra_stats:
+            self.extra_stats[name] = StageStats(name)
+            if self.ran:
+                self.late_stats.add(name)
+        return self.extra_stats[name]
+
+    @property
+    def stats(self):
+        """按 解析 → 各阶段 → 写入 的顺序返回统计"""
+        stage_names = {stage.name for stage in self.stages}
+        extra = {name: s for name, s in self.extra_stats.items() if name not in stage_names}
+        before = [s for name, s in extra.items() if name not in self.late_stats]
+        after = [s for name, s in extra.items() if name in self.late_stats]
+        return before + [stage.stats for stage in self.stages] + after
+
+    def stopped(self):
+        return self.error is not None or self.should_stop()
+
+    def run(self, source, on_tick=None, tick_interval=0.5):
+        """把source中的每一项送入第一个阶段，等所有阶段处理完毕；任一阶段出错时抛出该异常"""
+        self.ran = True
+        threads = []
+        for stage in self.stages:
+            stage.stats.started = time.time()
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage,), daemon=True,
+                                          name=f"{stage.name}-{n + 1}")
+                thread.start()
+                threads.append(thread)
+        feeder = threading.Thread(target=self._feed, args=(source,), daemon=True, name="feeder")
+        feeder.start()
+        threads.append(feeder)
+
+        for thread in threads:
+            while thread.is_alive() and not self.stopped():
+                thread.join(tick_interval)
+                for stage in self.stages:
+                    stage.stats.sample_depth()
+                if on_tick:
+                    on_tick()
+        if self.stopped():
+            # 不等进行中的请求返回，只等最后一个阶段把手上的一批处理完，之后它不会再处理新的输入
+            last = self.stages[-1]
+            with last.gate:
+                while last.active:
+                    last.gate.wait(0.1)
+        if self.error is not None:
+            raise self.error
+
+    def _feed(self, source):
+        first = self.stages[0].input
+        try:
+            for item in source:
+                if self.stopped():
+                    break
+                first.put(item)
+        except Exception as e:
+            print(f"流水线输入出错: {str(e)}")
+            self.error = self.error or e
+        finally:
+            first.put(_DONE)
+
+    def _work(self, stage):
+        try:
+            while True:
+                item = stage.input.get()
+                if item is _DONE:
+                    # 放回去让同阶段的其他线程也能退出
+                    stage.input.put(_DONE)
+                    break
+
+                # 队列里已有的输入凑成一批，不等待
+                items = [item]
+                size = stage.batch_size()
+                while len(items) < size:
+                    try:
+                        item = stage.input.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        stage.input.put(_DONE)
+                        break
+                    items.append(item)
+
+                # 中止或出错后继续取出输入但不处理，避免上游阻塞在put上
+                with stage.gate:
+                    while stage.active >= stage.limit() and not self.stopped():
+                        stage.gate.wait(0.5)
+                    if self.stopped():
+                        continue
+                    stage.active += 1
+                start = time.time()
+                try:
+                    outputs = stage.func(items)
+                except Exception as e:
+                    print(f"流水线阶段 {stage.name} 出错: {str(e)}")
+                    self.error = self.error or e
+                    outputs = None
+                finally:
+                    stage.stats.record(len(items), time.time() - start)
+                    with stage.gate:
+                        stage.active -= 1
+                        stage.gate.notify()
+                if stage.output is not None and outputs:
+                    for output in outputs:
+                        stage.output.put(output)
+        finally:
+            with stage.remaining_lock:
+                stage.remaining -= 1
+                last = stage.remaining == 0
+            if last and stage.output is not None:
+                stage.output.put(_DONE)
@@ -0,0 +1,262 @@
+"""采样性能分析
+
+翻译慢时，用来分辨时间花在重复内容的正则分析、SRT解析/写出、JSON解码、Tk消息处理还是等待网络上。
+后台线程每隔 interval 秒取一次所有线程的调用栈（sys._current_frames），不改动被测代码，
+关闭时不创建采样线程，翻译代码中也没有任何埋点，没有额外开销。
+
+每个样本按调用栈中最内层能识别的函数归入一个阶段（解析、预处理、请求、重构、提交、写入、界面），
+HTTP库、socket和asyncio连接/收发的函数归入请求，导入模块归入导入，识别不了时按流水线线程名归类。
+线程在锁、队列、线程池、Tk主循环和sleep（重试前的退避）中空等的样本不计入。
+事件循环在select中等待时看各任务挂起在哪里：有任务在等HTTP响应时记为“等待网络”，
+否则（只有asyncio.sleep退避、队列或线程池中的任务）记为事件循环空闲，单独列出、不计入各阶段。
+结果写在输出SRT旁边：
+  *.profile.folded  每行“阶段;函数;函数... 样本数”，可直接交给 flamegraph.pl 或 speedscope 生成火焰图
+  *.profile.txt     各阶段的样本占比和自身耗时最多的前N个函数
+"""
+import asyncio
+import collections
+import functools
+import linecache
+import os
+import sys
+import threading
+import time
+
+# 函数名 -> 阶段；调用栈中最内层命中的为准，只看本项目的源文件
+STAGE_FUNCTIONS = {
+    "解析": ("parse_srt", "load_subtitles", "from_file", "parse", "read_subtitle_file", "group_fragments"),
+    "预处理": ("preprocess", "preprocess_all", "prepare_range", "compress_repetitive_text", "split_text_chunks"),
+    "请求": ("translate", "run_batch", "translate_batch", "translate_with_model", "translate_text", "hedged", "chat",
+           "translate_cue_batch", "translate_with_ollama", "translate_with_general_model",
+           "translate_batch_with_general_model", "translate_with_special_model"),
+    "重构": ("reconstruct", "reconstruct_with_repetition", "expand_group", "join_chunks"),
+    "提交": ("commit", "flush_results"),
+    "写入": ("write_srt", "write_subtitles", "write", "save_partial_translation", "finish_stopped"),
+    "界面": ("check_message_queue", "mainloop"),
+}
+# 流水线线程名（阶段名-序号）-> 阶段
+THREAD_STAGES = {"解析": "解析", "预处理": "预处理", "翻译": "请求", "重构": "重构", "提交": "提交"}
+# 调用栈最内层是这些函数时线程在空等
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"), ("queue.py", "put"),
+    ("thread.py", "_worker"), ("__init__.py", "mainloop"), ("queues.py", "get"), ("connection.py", "poll"),
+    ("connection.py", "_poll"),
+}
+# 这些包和文件中的函数归入请求（最内层的项目函数更靠内时以项目函数为准）
+NETWORK_PACKAGES = {"httpx", "httpcore", "anyio", "h11", "urllib3", "requests", "ollama", "http"}
+NETWORK_FILES = {"socket.py", "ssl.py", "selector_events.py", "streams.py", "sslproto.py"}
+# asyncio事件循环中建立连接的函数，与事件循环本身的函数在同一个文件里
+NETWORK_FUNCTIONS = {("base_events.py", "create_connection"), ("base_events.py", "_connect_sock"),
+                     ("base_events.py", "_create_connection_transport"), ("base_events.py", "getaddrinfo"),
+                     ("base_events.py", "start_tls")}
+# 事件循环在select中等待；是等网络还是空闲要看各任务挂起在哪里
+LOOP_SELECT = ("selectors.py", "select")
+IMPORT_STAGE = "导入"
+NETWORK_WAIT_STAGE = "等待网络"
+
+MAX_DEPTH = 128
+DEFAULT_INTERVAL = 0.01
+DEFAULT_TOP = 20
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+_FUNCTION_STAGES = {name: stage for stage, names in STAGE_FUNCTIONS.items() for name in names}
+
+
+@functools.lru_cache(maxsize=None)
+def _is_network_code(code):
+    filename = os.path.abspath(code.co_filename)
+    parts = set(os.path.dirname(filename).split(os.sep))
+    basename = os.path.basename(filename)
+    return (bool(parts & NETWORK_PACKAGES) or basename in NETWORK_FILES
+            or (basename, code.co_name) in NETWORK_FUNCTIONS)
+
+
+def _function_stage(code, in_project):
+    """函数所属的阶段：本项目的按函数名，导入时执行的代码归入导入，HTTP库和socket等归入请求"""
+    if in_project:
+        return _FUNCTION_STAGES.get(code.co_name)
+    if code.co_filename.startswith("<frozen importlib") or code.co_name == "<module>":
+        return IMPORT_STAGE
+    if code.co_name == "mainloop":
+        return _FUNCTION_STAGES["mainloop"]
+    if _is_network_code(code):
+        return "请求"
+    return None
+
+
+def profile_paths(output_path):
+    """输出SRT旁边的火焰图数据和摘要文件"""
+    base = os.path.splitext(output_path)[0]
+    return base + ".profile.folded", base + ".profile.txt"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()  # (阶段, 调用栈) -> 样本数
+        self.idle = 0
+        self.loop_idle = 0
+        self.samples = 0
+        self.labels = {}  # code对象 -> (显示名, 阶段或None, 是否空等, 是否在select中等待)
+        self.sleeping_lines = {}  # (code对象, 行号) -> 该行是否在sleep
+        self.running = False
+        self.thread = None
+        self.started = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self.running = True
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.elapsed = time.time() - self.started
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.sample(frame, names.get(ident, ""))
+            time.sleep(self.interval)
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            filename = os.path.basename(code.co_filename)
+            in_project = os.path.dirname(os.path.abspath(code.co_filename)) == _PROJECT_DIR
+            label = self.labels[code] = (
+                f"{code.co_name} ({filename}:{code.co_firstlineno})",
+                _function_stage(code, in_project),
+                (filename, code.co_name) in IDLE_FUNCTIONS,
+                (filename, code.co_name) == LOOP_SELECT,
+            )
+        return label
+
+    def is_sleeping(self, frame):
+        """最内层的Python函数正停在调用sleep的那一行（time.sleep是C函数，不在调用栈中）"""
+        key = (frame.f_code, frame.f_lineno)
+        sleeping = self.sleeping_lines.get(key)
+        if sleeping is None:
+            line = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+            sleeping = self.sleeping_lines[key] = "sleep(" in line
+        return sleeping
+
+    def sample(self, frame, thread_name):
+        """记录一个线程的调用栈，栈从外到内"""
+        innermost = frame
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self.label(frame.f_code))
+            frame = frame.f_back
+        if not labels:
+            return
+        _, _, idle, in_select = labels[0]
+        if idle or self.is_sleeping(innermost):
+            self.idle += 1
+            return
+        if in_select:
+            waiting = self.waiting_on_network(innermost)
+            if not waiting:
+                # 不是asyncio事件循环的select（如http.server等待连接）算作空等
+                if waiting is None:
+                    self.idle += 1
+                else:
+                    self.loop_idle += 1
+                return
+            stage = NETWORK_WAIT_STAGE
+        else:
+            stage = next((label[1] for label in labels if label[1]), None)
+            if stage is None:
+                stage = THREAD_STAGES.get(thread_name.split("-")[0], "其他")
+        self.stacks[(stage, tuple(label[0] for label in reversed(labels)))] += 1
+        self.samples += 1
+
+    def waiting_on_network(self, frame):
+        """事件循环在select中等待时，是否有任务挂起在HTTP请求中；只有挂起在asyncio.sleep、
+        队列或线程池上的任务时事件循环是空闲的。不是asyncio事件循环时返回None"""
+        loop = None
+        while frame is not None:
+            if frame.f_code.co_name == "_run_once":
+                loop = frame.f_locals.get("self")
+                break
+            frame = frame.f_back
+        if not isinstance(loop, asyncio.AbstractEventLoop):
+            return None
+        try:
+            tasks = asyncio.all_tasks(loop)
+        except RuntimeError:
+            return True
+        for task in tasks:
+            coro = task.get_coro()
+            while coro is not None:
+                code = getattr(coro, "cr_code", None) or getattr(coro, "gi_code", None)
+                if code is not None and _is_network_code(code):
+                    return True
+                coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        return False
+
+    def stage_totals(self):
+        totals = collections.Counter()
+        for (stage, _), count in self.stacks.items():
+            totals[stage] += count
+        return totals
+
+    def hotspots(self, top=DEFAULT_TOP):
+        """自身样本最多的函数：[(函数, 阶段, 自身样本, 累计样本)]"""
+        own = collections.Counter()
+        total = collections.Counter()
+        for (stage, stack), count in self.stacks.items():
+            own[(stack[-1], stage)] += count
+            for name in set(stack):
+                total[(name, stage)] += count
+        return [(name, stage, count, total[(name, stage)]) for (name, stage), count in own.most_common(top)]
+
+    def format_summary(self, top=DEFAULT_TOP):
+        samples = max(self.samples, 1)
+        lines = [f"性能分析: {self.elapsed:.1f} 秒，每 {self.interval * 1000:.0f} 毫秒采样一次，"
+                 f"有效样本 {self.samples} 个（各线程合计），空等样本 {self.idle} 个不计入",
+                 f"事件循环: 等待网络 {self.stage_totals()[NETWORK_WAIT_STAGE]} 个样本，"
+                 f"空闲 {self.loop_idle} 个样本（只有sleep退避、队列或线程池中的任务，不计入）",
+                 "", f"{'阶段':<6} {'样本':>8} {'占比':>7}"]
+        for stage, count in self.stage_totals().most_common():
+            lines.append(f"{stage:<6} {count:>10} {count / samples:>8.1%}")
+        lines += ["", f"自身样本最多的 {top} 个函数:", f"{'自身':>7} {'累计':>7}  {'阶段':<4} 函数"]
+        for name, stage, own, total in self.hotspots(top):
+            lines.append(f"{own / samples:>7.1%} {total / samples:>7.1%}  {stage:<4} {name}")
+        return "\n".join(lines)
+
+    def write(self, output_path, top=DEFAULT_TOP):
+        """把火焰图数据和摘要写到输出SRT旁边，返回 (火焰图数据路径, 摘要路径, 摘要)"""
+        folded_path, summary_path = profile_paths(output_path)
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for (stage, stack), count in sorted(self.stacks.items()):
+                # 火焰图格式以分号分隔各层，函数名中的分号和空格会破坏格式
+                frames = ";".join(name.replace(";", ",").replace(" ", "_") for name in stack)
+                f.write(f"{stage};{frames} {count}\n")
+        summary = self.format_summary(top)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(summary + "\n")
+        print(f"性能分析结果已保存: {folded_path}, {summary_path}")
+        return folded_path, summary_path, summary
+
+
+def run_profiled(func, output_path, emit=None, interval=DEFAULT_INTERVAL):
+    """在采样分析下运行func；结束后（包括出错和中止）写出结果，摘要作为预览消息交给emit"""
+    profiler = SamplingProfiler(interval).start()
+    try:
+        return func()
+    finally:
+        profiler.stop()
+        try:
+            _, _, summary = profiler.write(output_path)
+            if emit:
+                emit({"type": "preview", "text": summary + "\n\n"})
+        except OSError as e:
+            print(f"保存性能分析结果失败: {str(e)}")
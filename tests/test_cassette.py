@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+import config_store
+from async_engine import AsyncTranslationEngine
+from benchmark import write_sample_srt
+from cassette import CassetteRecorder, CassetteServer, load_cassette
+from fake_ollama import FakeOllamaServer
+from translate_common import build_output_path
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_store, "CONFIG_DIR", str(tmp_path / "config"))
+
+
+def translate(input_path, api_url):
+    # 回放按请求内容匹配，并发数和批大小要固定
+    engine = AsyncTranslationEngine(input_path, "日语", "中文", [api_url], "fake-model:latest",
+                                    concurrency=2, batch_size=4)
+    asyncio.run(engine.run())
+    output_path = build_output_path(input_path, "日语", "中文")
+    with open(output_path, encoding="utf-8") as f:
+        output = f.read()
+    os.remove(output_path)
+    return output
+
+
+def test_replay_returns_recorded_responses(tmp_path):
+    input_path = write_sample_srt(str(tmp_path / "sample_ja.srt"), 20)
+    cassette_path = str(tmp_path / "run.cassette.gz")
+    fake = FakeOllamaServer(base_latency=0.01, per_cue_latency=0, contention=0).start()
+    recorder = CassetteRecorder(cassette_path, fake.url).start()
+    try:
+        recorded = translate(input_path, recorder.url)
+    finally:
+        recorder.stop()
+        fake.stop()
+    assert load_cassette(cassette_path)
+
+    server = CassetteServer(cassette_path, speed=0).start()
+    try:
+        replayed = translate(input_path, server.url)
+    finally:
+        server.stop()
+    assert server.stats["requests"] > 0 and server.stats["misses"] == 0
+    assert replayed == recorded and "[译]" in replayed
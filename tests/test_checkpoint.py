@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import config_store
+from async_engine import AsyncTranslationEngine, load_checkpoint
+from benchmark import write_sample_srt
+from cue_store import CueStore
+from fake_ollama import FakeOllamaServer
+from translate_common import build_checkpoint_path, build_output_path
+from translate_worker import recover_partial
+
+TOTAL = 20
+DONE = 8
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_store, "CONFIG_DIR", str(tmp_path / "config"))
+
+
+@pytest.fixture
+def server():
+    server = FakeOllamaServer(base_latency=0.01, per_cue_latency=0, contention=0).start()
+    yield server
+    server.stop()
+
+
+def write_partial_checkpoint(input_path, truncated_tail=True):
+    """模拟上次运行在完成DONE条后崩溃，最后一行只写了一半"""
+    checkpoint_path = build_checkpoint_path(input_path, "日语", "中文")
+    header = {"input_file": os.path.abspath(input_path), "src_lang": "日语", "dest_lang": "中文",
+              "model": "fake-model:latest", "total": TOTAL}
+    with open(checkpoint_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for i in range(DONE):
+            f.write(json.dumps({"i": i, "text": f"已完成{i}"}, ensure_ascii=False) + "\n")
+        if truncated_tail:
+            f.write('{"i": 8, "te')
+    return checkpoint_path
+
+
+def test_resume_skips_cues_already_done(tmp_path, server):
+    input_path = write_sample_srt(str(tmp_path / "sample_ja.srt"), TOTAL)
+    checkpoint_path = write_partial_checkpoint(input_path)
+    assert len(load_checkpoint(checkpoint_path)) == DONE
+
+    engine = AsyncTranslationEngine(input_path, "日语", "中文", [server.url], "fake-model:latest",
+                                    concurrency=2, batch_size=1, checkpoint=True, resume=True)
+    asyncio.run(engine.run())
+
+    assert server.stats["cues"] == TOTAL - DONE
+    store = CueStore.from_file(build_output_path(input_path, "日语", "中文"))
+    assert [store.content(i) for i in range(DONE)] == [f"已完成{i}" for i in range(DONE)]
+    assert all(store.content(i).startswith("[译]") for i in range(DONE, TOTAL))
+    # 完成后删除进度文件
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_mismatched_checkpoint_starts_over(tmp_path, server):
+    input_path = write_sample_srt(str(tmp_path / "sample_ja.srt"), TOTAL)
+    write_partial_checkpoint(input_path)
+    # 上次用的是另一个模型，进度文件不能沿用
+    engine = AsyncTranslationEngine(input_path, "日语", "中文", [server.url], "other-model:latest",
+                                    concurrency=2, batch_size=1, checkpoint=True, resume=True)
+    asyncio.run(engine.run())
+    assert server.stats["cues"] == TOTAL
+
+
+def test_recover_partial_writes_done_cues(tmp_path):
+    input_path = write_sample_srt(str(tmp_path / "sample_ja.srt"), TOTAL)
+    write_partial_checkpoint(input_path)
+    output_path, count = recover_partial({"input_file": input_path, "src_lang": "日语", "dest_lang": "中文"})
+    assert count == DONE
+    store = CueStore.from_file(output_path)
+    assert store.content(DONE - 1) == f"已完成{DONE - 1}"
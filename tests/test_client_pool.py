@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from async_engine import ClientPool
+from fake_ollama import FakeOllamaServer
+
+
+@pytest.fixture
+def servers():
+    servers = [FakeOllamaServer(slots=16, base_latency=0.05, per_cue_latency=0, contention=0).start()
+               for _ in range(2)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+async def post_all(pool, urls):
+    responses = await asyncio.gather(*(pool.post(f"{url}/api/pull", json={}) for url in urls))
+    return [response.json()["status"] for response in responses]
+
+
+def test_each_request_in_flight_has_own_client(servers):
+    first, second = (server.url for server in servers)
+
+    async def main():
+        pool = ClientPool()
+        try:
+            assert await post_all(pool, [first] * 8) == ["success"] * 8
+            assert len(pool.clients) == 8
+            # 之后的请求复用空闲的客户端和它保持的连接
+            await post_all(pool, [first] * 8)
+            assert len(pool.clients) == 8
+            # 其他地址的请求不占用这些连接
+            await post_all(pool, [second] * 2)
+            assert len(pool.clients) == 10
+            return {netloc: len(idle) for netloc, idle in pool.idle.items()}
+        finally:
+            await pool.aclose()
+
+    idle = asyncio.run(main())
+    assert sorted(idle.values()) == [2, 8]
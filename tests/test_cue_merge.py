@@ -0,0 +1,35 @@
+from cue_merge import expand_group, group_fragments, merged_text, split_translation
+from cue_store import CueStore
+
+
+def make_store(cues):
+    """cues为 (开始毫秒, 结束毫秒, 内容)"""
+    blocks = []
+    for n, (start, end, content) in enumerate(cues, 1):
+        blocks.append(f"{n}\n00:00:{start // 1000:02d},{start % 1000:03d} --> "
+                      f"00:00:{end // 1000:02d},{end % 1000:03d}\n{content}\n")
+    return CueStore.parse("\n".join(blocks))
+
+
+def test_fragments_are_grouped_until_sentence_end():
+    store = make_store([(0, 900, "今日は"), (1000, 1900, "とても良い"), (2000, 2900, "天気ですね。"),
+                        (3000, 3900, "明日は雨")])
+    assert group_fragments(store) == [(0, 3), (3, 1)]
+    assert merged_text(store, 0, 3, "日语") == "今日はとても良い天気ですね。"
+
+
+def test_long_gap_and_dialogue_break_groups():
+    store = make_store([(0, 900, "今日は"), (5000, 5900, "とても良い"), (6000, 6900, "- 天気ですね。")])
+    assert group_fragments(store) == [(0, 1), (1, 1), (2, 1)]
+
+
+def test_translation_is_split_back_by_length():
+    pieces = split_translation("今天天气，非常好。", [3, 5, 6], "中文")
+    assert len(pieces) == 3 and "".join(pieces).replace("，", "") == "今天天气非常好。"
+    assert split_translation("好", [3, 5], "中文") is None
+
+
+def test_failed_translation_keeps_originals():
+    store = make_store([(0, 900, "今日は"), (1000, 1900, "良い天気")])
+    assert expand_group(store, 0, 2, "今日は良い天気", "日语", "中文") == ["今日は", "良い天気"]
+    assert expand_group(store, 0, 2, "好", "日语", "中文") == ["今日は", "良い天気"]
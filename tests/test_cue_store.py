@@ -0,0 +1,56 @@
+import srt
+
+from cue_store import CueStore, format_timestamp
+
+# 格式不规范和乱序的输入，CueStore 的解析+输出应与 srt.parse+srt.compose 相同
+MALFORMED = {
+    "缺少序号": ("1\n00:00:01,000 --> 00:00:02,000\na\n\n00:00:03,000 --> 00:00:04,000\nb\n\n"
+             "3\n00:00:05,000 --> 00:00:06,000\nc\n\n4\n00:00:07,000 --> 00:00:08,000\nd\n"),
+    "全部没有序号": "00:00:01,000 --> 00:00:02,000\na\n\n00:00:03,000 --> 00:00:04,000\nb\n",
+    "空行后的文字": ("1\n00:00:01,000 --> 00:00:02,000\na\n\nstray text\n\n"
+               "2\n00:00:03,000 --> 00:00:04,000\nb\n"),
+    "乱序": ("1\n00:00:05,000 --> 00:00:06,000\nlate\n\n2\n00:00:01,000 --> 00:00:02,000\nearly\n\n"
+           "3\n00:00:03,000 --> 00:00:04,000\nmiddle\n"),
+    "空字幕和多余空行": "1\n00:00:01,000 --> 00:00:02,000\n\n2\n00:00:03,000 --> 00:00:04,000\nb\n\n\n\n",
+    "CRLF和BOM": "﻿1\r\n00:00:01,000 --> 00:00:02,000\r\nx\r\ny\r\n\r\n2\r\n00:00:03,000 --> 00:00:04,000\r\nb",
+    "句点毫秒和行尾坐标": "1\n00:00:01.5 --> 00:00:02.000 X1:0 X2:10\n多行\n内容\n",
+}
+
+
+def test_matches_srt_on_malformed_and_unsorted_input():
+    for name, content in MALFORMED.items():
+        expected = list(srt.parse(content.lstrip("﻿")))
+        store = CueStore.parse(content)
+        assert len(store) == len(expected), name
+        assert store.compose() == srt.compose(expected), name
+
+
+def test_sorted_by_time_like_srt_compose():
+    store = CueStore.parse(MALFORMED["乱序"])
+    assert [store.content(i) for i in range(len(store))] == ["early", "middle", "late"]
+    assert list(store.starts) == [1000, 3000, 5000]
+
+
+def test_unparsed_text_is_reported(capsys):
+    store = CueStore.parse("garbage at the top\n\n1\n00:00:01,000 --> 00:00:02,000\na\n")
+    assert len(store) == 1
+    assert "跳过无法解析的内容" in capsys.readouterr().out
+
+
+def test_no_cues_raises():
+    try:
+        CueStore.parse("not a subtitle file")
+    except Exception as e:
+        assert "未能从文件中解析出字幕" in str(e)
+    else:
+        raise AssertionError("应当抛出异常")
+
+
+def test_translations_and_partial_write(tmp_path):
+    content = "".join(f"{i + 1}\n{format_timestamp(i * 1000)} --> {format_timestamp(i * 1000 + 500)}\n第{i}条\n\n"
+                      for i in range(5))
+    store = CueStore.parse(content)
+    store.translations[1] = "译文\n\n第二行"
+    path = store.write(str(tmp_path / "out.srt"), count=3)
+    written = list(srt.parse(open(path, encoding="utf-8").read()))
+    assert [sub.content for sub in written] == ["第0条", "译文\n第二行", "第2条"]
@@ -0,0 +1,49 @@
+import time
+
+from translate_daemon import FairJobQueue, Job
+
+
+def make_job(job_id, client, priority=0):
+    job = Job(job_id, f"/tmp/{job_id}_ja.srt", {"src_lang": "日语", "dest_lang": "中文"}, priority, client)
+    job.created = time.time() + int(job_id) * 1e-3
+    return job
+
+
+def test_client_with_fewer_cues_goes_first():
+    queue = FairJobQueue()
+    jobs = [make_job("1", "a"), make_job("2", "a"), make_job("3", "b")]
+    for job in jobs:
+        queue.push(job)
+    first = queue.pop()
+    queue.charge(first, 100)
+    assert first.id == "1"
+    assert queue.pop().id == "3"
+    assert queue.pop().id == "2"
+    assert queue.pop() is None
+
+
+def test_priority_beats_fairness():
+    queue = FairJobQueue()
+    queue.push(make_job("1", "a"))
+    queue.push(make_job("2", "b", priority=5))
+    assert queue.positions() == {"2": 1, "1": 2}
+    assert queue.pop().id == "2"
+
+
+def test_idle_client_cannot_bank_credit():
+    queue = FairJobQueue()
+    busy = make_job("1", "a")
+    queue.push(busy)
+    queue.charge(queue.pop(), 500)
+    queue.push(make_job("2", "b"))
+    # 新来的客户端从活跃客户端中的最小值算起
+    assert queue.describe()["served"]["b"] == 500
+
+
+def test_remove_only_waiting_jobs():
+    queue = FairJobQueue()
+    job = make_job("1", "a")
+    queue.push(job)
+    assert queue.remove(job)
+    assert not queue.remove(job)
+    assert queue.describe() == {"waiting": 0, "served": {"a": 0}}
@@ -0,0 +1,53 @@
+import pytest
+import requests
+
+import config_store
+from fake_ollama import FakeOllamaServer
+from generation_profiles import GenerationProfile, saved_context
+
+MODEL = "fake-model:latest"
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_store, "CONFIG_DIR", str(tmp_path))
+
+
+@pytest.fixture
+def server():
+    server = FakeOllamaServer(base_latency=0, per_cue_latency=0, contention=0, default_ctx=4096).start()
+    yield server
+    server.stop()
+
+
+def generate(server, payload):
+    response = requests.post(f"{server.url}/api/generate",
+                             json={"model": MODEL, "prompt": "翻译\n今日は", "stream": False, **payload}, timeout=5)
+    response.raise_for_status()
+
+
+def test_context_never_shrinks():
+    profile = GenerationProfile("标准")
+    assert profile.payload("single", "x" * 3000, 10)["options"]["num_ctx"] == 4096
+    assert profile.payload("single", "x" * 10, 10)["options"]["num_ctx"] == 4096
+
+
+def test_starts_from_loaded_context(server):
+    generate(server, {})
+    profile = GenerationProfile.for_model(MODEL, "标准", server.url)
+    assert profile.start_context() == 4096
+    generate(server, profile.payload("single", "短い", 2))
+    assert server.stats["reloads"] == 0
+
+
+def test_starts_from_saved_context_when_not_loaded(server):
+    profile = GenerationProfile.for_model(MODEL, "标准", server.url)
+    profile.payload("single", "x" * 6000, 10)
+    assert saved_context(server.url, MODEL) == 8192
+    assert GenerationProfile.for_model(MODEL, "标准", server.url).start_context() == 8192
+
+
+def test_default_profile_sends_no_context(server):
+    profile = GenerationProfile.for_model(MODEL, "Ollama默认", server.url)
+    assert profile.start_context() == 0
+    assert profile.payload("single", "短い", 2) == {}
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import config_store
+from async_engine import AsyncTranslationEngine
+from hedging import HedgePolicy
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_store, "CONFIG_DIR", str(tmp_path))
+
+
+def make_engine(tmp_path, policy):
+    engine = AsyncTranslationEngine(str(tmp_path / "x_ja.srt"), "日语", "中文", ["http://a", "http://b"],
+                                    "fake-model:latest", hedge=True)
+    engine.hedge_policy = policy
+    return engine
+
+
+def run_hedged(engine, request):
+    async def main():
+        engine.slot_changed = asyncio.Condition()
+        return await engine.hedged(engine.endpoints[0], 10, request, lambda content: content)
+    return asyncio.run(main())
+
+
+def warmed_policy(latency=0.05, samples=20, slow=0):
+    """samples个样本，其中slow个是1秒的慢请求；按中位数对冲"""
+    policy = HedgePolicy(budget=1.0, percentile=0.5, min_samples=samples)
+    for n in range(samples):
+        policy.record_request()
+        policy.record_latency(policy.length_class(10), 1.0 if n < slow else latency)
+    return policy
+
+
+def test_hedge_delay_needs_enough_samples():
+    policy = HedgePolicy(min_samples=3)
+    policy.record_latency(20, 1.0)
+    assert policy.hedge_delay(20) is None
+    policy.record_latency(20, 2.0)
+    policy.record_latency(20, 3.0)
+    assert policy.hedge_delay(20) == 3.0
+
+
+def test_budget_limits_hedges():
+    policy = HedgePolicy(budget=0.05)
+    for _ in range(40):
+        policy.record_request()
+    assert policy.try_hedge() and policy.try_hedge()
+    assert not policy.try_hedge()
+
+
+def test_remaining_time_is_estimated_from_slower_samples():
+    policy = warmed_policy(slow=4)
+    assert abs(policy.estimate_remaining(20, 0.2) - 0.8) < 1e-9
+    assert policy.estimate_remaining(20, 2.0) == 0.0
+
+
+def test_cancelled_primary_latency_is_recorded(tmp_path):
+    policy = warmed_policy(slow=4)
+    engine = make_engine(tmp_path, policy)
+
+    async def request(target):
+        await asyncio.sleep(0.5 if target.url == "http://a" else 0.01)
+        return target.url
+
+    result = run_hedged(engine, request)
+    assert result == "http://b"
+    # 主请求运行了约0.06秒，同档位更慢的样本都是1秒
+    assert policy.wins == 1 and 0.8 < policy.saved < 0.95
+    samples = policy.latencies[policy.length_class(10)]
+    # 备份请求的耗时和被取消的主请求已运行的时间
+    assert len(samples) == 22 and sorted(samples)[-5] >= 0.05
+    assert "节省" in policy.describe()
+
+
+def test_failures_are_recorded(tmp_path):
+    policy = warmed_policy()
+    engine = make_engine(tmp_path, policy)
+
+    async def request(target):
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        run_hedged(engine, request)
+    assert policy.failures == 1
+    assert len(policy.latencies[policy.length_class(10)]) == 21
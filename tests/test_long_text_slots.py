@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+import config_store
+from async_engine import AsyncTranslationEngine
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_store, "CONFIG_DIR", str(tmp_path))
+
+
+def run_chunks(tmp_path, concurrency, held, count):
+    """一个地址的并发上限为concurrency，已占用held个名额（其中一个是这条字幕的），翻译count块；
+    返回 (各块结果, 同时在途的块数峰值, 结束后的在途数)"""
+    engine = AsyncTranslationEngine(str(tmp_path / "x_ja.srt"), "日语", "中文", ["http://a"], "fake-model:latest")
+    endpoint = engine.endpoints[0]
+    endpoint.controller.concurrency = concurrency
+    endpoint.in_flight = held
+    active = peak = 0
+
+    async def translate_text(target, chunk, hint=None):
+        nonlocal active, peak
+        assert target.in_flight <= concurrency
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return f"[译]{chunk}", True
+
+    engine.translate_text = translate_text
+
+    async def main():
+        engine.slot_changed = asyncio.Condition()
+        return await engine.translate_chunks(endpoint, [f"块{n}" for n in range(count)])
+
+    outcomes = asyncio.run(main())
+    return outcomes, peak, endpoint.in_flight
+
+
+def test_chunks_take_free_slots(tmp_path):
+    outcomes, peak, in_flight = run_chunks(tmp_path, concurrency=4, held=1, count=6)
+    assert outcomes == [(f"[译]块{n}", True) for n in range(6)]
+    assert peak == 4 and in_flight == 1
+
+
+def test_chunks_share_held_slot_when_full(tmp_path):
+    outcomes, peak, in_flight = run_chunks(tmp_path, concurrency=2, held=2, count=5)
+    assert [result for result, _ in outcomes] == [f"[译]块{n}" for n in range(5)]
+    assert peak == 1 and in_flight == 2
@@ -0,0 +1,31 @@
+import argparse
+
+import model_test
+
+
+def test_errors_are_reported_apart_from_timeouts(monkeypatch):
+    def translate_once(api_url, model, text, src_lang, dest_lang, timeout):
+        if text == "出错":
+            raise Exception("HTTP 500")
+        if text == "超时":
+            return None, timeout, 0
+        return "今天天气很好。", 0.2, 5
+
+    monkeypatch.setattr(model_test, "translate_once", translate_once)
+    args = argparse.Namespace(src="日语", dest="中文", timeout=30)
+    level = model_test.run_level("http://a", "m", ["今日はいい天気", "出错", "超时", "出错"], 2, args)
+    assert level["error_rate"] == 0.5 and level["timeout_rate"] == 0.25
+    # 出错的请求不计入延迟分位数
+    assert level["p50"] == level["p99"] == 0.2
+    assert level["samples"][1]["result"] is None
+
+
+def test_special_model_is_never_recommended():
+    results = [{"model": model_test.SPECIAL_MODEL, "quality": 0.95, "best_cues_per_sec": 20.0},
+               {"model": "qwen2.5:7b", "quality": 0.9, "best_cues_per_sec": 10.0},
+               {"model": "qwen2.5:3b", "quality": 0.5, "best_cues_per_sec": 30.0}]
+    ranked, recommended = model_test.rank_models(results, 0.8)
+    assert [r["model"] for r in ranked] == [model_test.SPECIAL_MODEL, "qwen2.5:7b", "qwen2.5:3b"]
+    assert recommended == "qwen2.5:7b"
+    _, recommended = model_test.rank_models(results[:1], 0.8)
+    assert recommended is None
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from pipeline import Pipeline
+
+
+def test_items_flow_through_all_stages_in_batches():
+    pipeline = Pipeline()
+    collected = []
+    batches = []
+
+    def double(items):
+        batches.append(len(items))
+        return [item * 2 for item in items]
+
+    pipeline.add_stage("预处理", double, workers=2, queue_size=8, batch_size=lambda: 4)
+    pipeline.add_stage("提交", lambda items: collected.extend(items) or [], queue_size=8)
+    pipeline.run(range(100), tick_interval=0.01)
+    assert sorted(collected) == [n * 2 for n in range(100)]
+    assert max(batches) <= 4
+    names = [s.name for s in pipeline.stats]
+    assert names == ["预处理", "提交"]
+    assert pipeline.stats[0].processed == 100
+
+
+def test_stage_error_stops_pipeline():
+    pipeline = Pipeline()
+
+    def fail(items):
+        raise ValueError("坏数据")
+
+    pipeline.add_stage("翻译", fail)
+    with pytest.raises(ValueError):
+        pipeline.run(range(10), tick_interval=0.01)
+
+
+def test_limit_caps_concurrent_workers():
+    pipeline = Pipeline()
+    lock = threading.Lock()
+    active = [0, 0]  # 当前、最大
+
+    def work(items):
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        threading.Event().wait(0.005)
+        with lock:
+            active[0] -= 1
+        return []
+
+    pipeline.add_stage("翻译", work, workers=8, limit=lambda: 2)
+    pipeline.run(range(40), tick_interval=0.01)
+    assert active[1] <= 2
+
+
+def test_timed_steps_are_ordered_around_stages():
+    pipeline = Pipeline()
+    pipeline.timed("解析", lambda: None)
+    pipeline.add_stage("提交", lambda items: [])
+    pipeline.run([1], tick_interval=0.01)
+    pipeline.timed("写入", lambda: None)
+    assert [s.name for s in pipeline.stats] == ["解析", "提交", "写入"]
@@ -0,0 +1,31 @@
+import json
+
+from translate_common import build_batch_messages, build_general_messages, build_prompt_prefix
+from translation_memory import Match
+
+
+def encoded(messages):
+    """请求体中messages的JSON，去掉结尾的方括号后可以比较前缀"""
+    return json.dumps(messages, ensure_ascii=False).encode("utf-8")[:-1]
+
+
+def test_single_batch_and_hint_share_byte_identical_prefix():
+    for src_lang, dest_lang in (("日语", "中文"), ("英语", "日语")):
+        prefix = encoded(list(build_prompt_prefix(src_lang, dest_lang)))
+        hint = Match(0.8, "明日は雨です", "明天下雨", False)
+        requests = [
+            build_general_messages("今日は晴れです", src_lang, dest_lang),
+            build_general_messages("今日は晴れです", src_lang, dest_lang, hint),
+            build_batch_messages(["今日は", "晴れです"], src_lang, dest_lang),
+        ]
+        for messages in requests:
+            assert encoded(messages).startswith(prefix + b", ")
+        # 前缀之后才是各请求不同的部分
+        assert requests[0][-1]["content"] == "今日は晴れです"
+        assert requests[1][-3:-1] == [{"role": "user", "content": "明日は雨です"},
+                                      {"role": "assistant", "content": "明天下雨"}]
+
+
+def test_prefix_differs_only_by_language_pair():
+    assert build_prompt_prefix("日语", "中文") == build_prompt_prefix("日语", "中文")
+    assert build_prompt_prefix("日语", "中文") != build_prompt_prefix("日语", "英语")
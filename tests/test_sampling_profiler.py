@@ -0,0 +1,84 @@
+import asyncio
+import sys
+import threading
+import time
+
+from sampling_profiler import SamplingProfiler, NETWORK_WAIT_STAGE
+
+NETWORK_LIBRARY = """
+import asyncio
+
+async def receive_response():
+    await asyncio.sleep(10)
+"""
+
+
+def compiled(source, filename):
+    namespace = {}
+    exec(compile(source, filename, "exec"), namespace)
+    return namespace
+
+
+def sample_loop(make_tasks):
+    """在后台事件循环中启动任务，等它进入select后采样一次"""
+    profiler = SamplingProfiler()
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    stop = asyncio.Event()
+
+    async def main():
+        tasks = make_tasks()
+        started.set()
+        await stop.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    thread = threading.Thread(target=lambda: loop.run_until_complete(main()), daemon=True)
+    thread.start()
+    started.wait(5)
+    time.sleep(0.1)
+    profiler.sample(sys._current_frames()[thread.ident], "")
+    loop.call_soon_threadsafe(stop.set)
+    thread.join(5)
+    loop.close()
+    return profiler
+
+
+def test_backoff_sleep_is_loop_idle():
+    profiler = sample_loop(lambda: [asyncio.ensure_future(asyncio.sleep(10))])
+    assert profiler.loop_idle == 1 and profiler.samples == 0
+
+
+def test_pending_http_request_is_network_wait():
+    library = compiled(NETWORK_LIBRARY, "/site-packages/httpcore/_async/connection.py")
+    profiler = sample_loop(lambda: [asyncio.ensure_future(library["receive_response"]())])
+    assert profiler.loop_idle == 0
+    assert profiler.stage_totals()[NETWORK_WAIT_STAGE] == 1
+
+
+def test_library_and_import_frames_are_classified():
+    profiler = SamplingProfiler()
+    connect = compiled("def _sock_connect(sock): pass", "/usr/lib/python3.11/asyncio/selector_events.py")
+    assert profiler.label(connect["_sock_connect"].__code__)[1] == "请求"
+    module = compile("x = 1", "/site-packages/requests/__init__.py", "exec")
+    assert profiler.label(module)[1] == "导入"
+    other = compiled("def f(): pass", "/usr/lib/python3.11/json/decoder.py")
+    assert profiler.label(other["f"].__code__)[1] is None
+
+
+def test_time_sleep_in_retry_is_idle():
+    profiler = SamplingProfiler()
+    ready = threading.Event()
+
+    def retry():
+        ready.set()
+        time.sleep(0.5)
+
+    thread = threading.Thread(target=retry, daemon=True)
+    thread.start()
+    ready.wait(5)
+    time.sleep(0.05)
+    profiler.sample(sys._current_frames()[thread.ident], "翻译-0")
+    thread.join()
+    assert profiler.idle == 1 and profiler.samples == 0
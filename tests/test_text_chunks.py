@@ -0,0 +1,46 @@
+from translate_common import join_chunks, split_text_chunks
+
+
+def flatten(lines):
+    return [chunk for line in lines for chunk in line]
+
+
+def test_short_text_is_one_chunk():
+    assert split_text_chunks("今日はいい天気ですね。", 200) == [["今日はいい天気ですね。"]]
+
+
+def test_splits_at_sentence_boundaries():
+    text = "一二三四五。" * 3 + "六七八九十！"
+    chunks = flatten(split_text_chunks(text, 12))
+    assert chunks == ["一二三四五。一二三四五。", "一二三四五。六七八九十！"]
+    assert "".join(chunks) == text
+
+
+def test_english_period_only_ends_sentence_after_word():
+    chunks = flatten(split_text_chunks("It costs 3.5 dollars. Then we left. OK.", 22))
+    assert chunks == ["It costs 3.5 dollars. ", "Then we left. OK."]
+
+
+def test_long_sentence_splits_at_clauses():
+    text = "あいうえお、かきくけこ、さしすせそ、たちつてと。"
+    chunks = flatten(split_text_chunks(text, 12))
+    assert all(len(chunk) <= 12 for chunk in chunks)
+    assert chunks[0] == "あいうえお、かきくけこ、"
+    assert "".join(chunks) == text
+
+
+def test_long_run_without_punctuation_is_cut_by_length():
+    text = "あ" * 25
+    assert flatten(split_text_chunks(text, 10)) == ["あ" * 10, "あ" * 10, "あ" * 5]
+
+
+def test_newlines_are_kept():
+    lines = split_text_chunks("一行目。\n\n三行目です。二文目。", 6)
+    assert lines == [["一行目。"], [], ["三行目です。", "二文目。"]]
+
+
+def test_chunks_are_joined_in_order():
+    lines = split_text_chunks("一行目。\n三行目です。二文目。", 6)
+    translated = [f"<{chunk}>" for chunk in flatten(lines)]
+    assert join_chunks(lines, translated, "中文") == "<一行目。>\n<三行目です。><二文目。>"
+    assert join_chunks([["a. ", "b."]], ["A.", "B."], "英语") == "A. B."
@@ -0,0 +1,62 @@
+import pytest
+
+import config_store
+from throughput_controller import ThroughputController, classify_error, record_translated
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_store, "CONFIG_DIR", str(tmp_path))
+
+
+def make_controller(**kwargs):
+    return ThroughputController("http://a", "m", window_size=4, **kwargs)
+
+
+def test_only_translated_cues_count_as_success():
+    controller = make_controller()
+    record_translated(controller, [("1", True), ("二", False), ("3", True)], 1.0)
+    assert controller.window_cues == 2 and controller.window_successes == 1
+    record_translated(controller, [("一", False), ("二", False)], 1.0)
+    assert controller.window_cues == 2 and controller.window_requests == 1
+    # 译文和原文相同（如专有名词）也是翻译成功
+    record_translated(controller, [("東京", True)], 1.0)
+    assert controller.window_cues == 3 and controller.window_successes == 2
+
+
+def test_overload_halves_concurrency():
+    controller = make_controller(concurrency=8, batch_size=4)
+    for _ in range(8):
+        controller.record_error(TimeoutError("timed out"))
+    assert controller.maybe_adjust()
+    assert (controller.concurrency, controller.batch_size) == (4, 2)
+
+
+def test_high_latency_backs_off_before_timeouts():
+    controller = make_controller(concurrency=6, batch_size=3)
+    for _ in range(6):
+        controller.record_success(3, controller.latency_limit() + 0.5)
+    assert controller.maybe_adjust()
+    assert (controller.concurrency, controller.batch_size) == (5, 2)
+    assert controller.best["throughput"] == 0.0
+
+
+def test_lower_latency_wins_ties():
+    controller = make_controller(concurrency=4)
+    controller.best = {"throughput": 10.0, "latency": 1.0, "concurrency": 8, "batch_size": 1}
+    controller.window_start -= 1.0
+    for _ in range(4):
+        controller.record_success(2.5, 0.5)
+    controller.maybe_adjust()
+    assert controller.best["concurrency"] == 4 and controller.best["latency"] == 0.5
+
+
+def test_classify_error_follows_cause():
+    try:
+        try:
+            raise TimeoutError("read timed out")
+        except TimeoutError as e:
+            raise Exception("翻译失败") from e
+    except Exception as e:
+        assert classify_error(e) == "timeout"
+    assert classify_error(ValueError("bad json")) is None
@@ -0,0 +1,82 @@
+import threading
+
+from translation_memory import TranslationMemory, is_reusable_variant, normalize
+
+
+def make_memory(pairs, **kwargs):
+    memory = TranslationMemory(**kwargs)
+    for source, translation in pairs:
+        memory.add(source, translation)
+    return memory
+
+
+def test_exact_match_after_normalization_is_reused():
+    memory = make_memory([("今日はいい天気ですね。", "今天天气真好啊。")])
+    match = memory.lookup("今日はいい天気ですね…")
+    assert memory.can_reuse(match)
+    assert match.translation == "今天天气真好啊。"
+
+
+def test_different_number_is_never_reused():
+    memory = make_memory([(f"テスト文{i}です。", f"[译]テスト文{i}です。") for i in range(200)])
+    for i in range(200):
+        match = memory.lookup(f"テスト文{i}です。")
+        assert match.translation == f"[译]テスト文{i}です。"
+    memory = make_memory([("テスト文1です。", "[译]テスト文1です。")])
+    match = memory.lookup("テスト文11です。")
+    assert match is not None and not memory.can_reuse(match)
+
+
+def test_dropped_case_particle_is_reused():
+    memory = make_memory([("私は新しいプロジェクトを始めることになりました", "我要开始一个新项目了")])
+    match = memory.lookup("私は新しいプロジェクト始めることになりました")
+    assert memory.can_reuse(match)
+
+
+def test_sentence_final_particle_is_never_reused():
+    memory = make_memory([("明日の朝は早くあの店に行くよ", "我会早点去那家店")])
+    for query in ("明日の朝は早くあの店に行くな", "明日の朝は早くあの店に行くか", "明日の朝は早くあの店に行くの",
+                  "明日の朝は早くあの店に行く", "明日の朝は早くあの店に行くよね"):
+        match = memory.lookup(query)
+        assert match is not None and not memory.can_reuse(match), query
+
+
+def test_other_small_edits_are_only_hints():
+    memory = make_memory([("新しいプロジェクトを始めることになりました", "要开始新项目了")])
+    match = memory.lookup("新しいプロジェクトを止めることになりました")
+    assert match is not None and match.score >= 0.6
+    assert not memory.can_reuse(match)
+
+
+def test_reusable_variant_rules():
+    assert is_reusable_variant(normalize("東京に行く"), normalize("東京行く"))
+    assert not is_reusable_variant(normalize("行くよ"), normalize("行くね"))
+    assert not is_reusable_variant(normalize("私は行く"), normalize("私も行く"))
+    assert not is_reusable_variant(normalize("猫の本"), normalize("猫本"))
+    assert not is_reusable_variant(normalize("第2話"), normalize("第3話"))
+    assert not is_reusable_variant(normalize("OK です"), normalize("NG です"))
+    assert not is_reusable_variant(normalize("行きます"), normalize("行きました"))
+
+
+def test_lookup_while_adding_from_threads():
+    memory = TranslationMemory()
+    errors = []
+
+    def writer(offset):
+        for i in range(500):
+            memory.add(f"文{offset}の{i}番目です", f"第{offset}句第{i}条")
+
+    def reader():
+        try:
+            for i in range(500):
+                memory.lookup(f"文0の{i}番目です")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)] + [threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(memory.sources) == 2000
@@ -0,0 +1,185 @@
+import threading
+import time
+
+import config_store
+from translate_common import REQUEST_TIMEOUT
+
+# 调优结果按 (API地址, 模型) 保存在这个文件里，作为下次运行的起点
+STATE_FILE = "throughput.json"
+# 平均延迟超过请求超时的这个比例时回退一步，不等到大量超时才减半
+LATENCY_LIMIT_RATIO = 0.75
+
+
+def classify_error(exc):
+    """判断异常是否属于服务端过载（超时或5xx），沿异常链向上查找原始异常"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if "Timeout" in type(exc).__name__:
+            return "timeout"
+        # requests/httpx把状态码放在response上，ollama和urllib放在异常本身
+        response = getattr(exc, "response", None)
+        status_code = (getattr(response, "status_code", None) or getattr(exc, "status_code", None)
+                       or getattr(exc, "code", None))
+        if isinstance(status_code, int) and status_code >= 500:
+            return "server"
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def record_translated(controller, outcomes, latency):
+    """逐条翻译完的一批 [(译文, 是否翻译成功)] 反馈给自动调优：只有翻译成功的条数计入成功；
+    退回原文的各条在重试时每次失败都已 record_error，这里不再计入"""
+    translated = sum(1 for _, ok in outcomes if ok)
+    if translated:
+        controller.record_success(translated, latency)
+
+
+class ThroughputController:
+    """根据实测吞吐量和延迟自动调整并发数与每次请求的字幕条数
+
+    出现超时或5xx时并发数减半（乘性减）；平均延迟逼近超时时并发数和批大小各减一；否则按爬山法每个窗口调整一步：
+    吞吐提升则沿当前方向继续，下降或持平则反向，同时在并发数与批大小之间轮换。
+    吞吐相近的设置中平均延迟更低的记为最佳。
+    """
+
+    def __init__(self, endpoint, model, concurrency=2, batch_size=1,
+                 max_concurrency=16, max_batch_size=8, allow_batching=True,
+                 window_size=8, overload_threshold=0.1):
+        self.endpoint = endpoint
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_batch_size = max_batch_size if allow_batching else 1
+        self.concurrency = max(1, min(concurrency, self.max_concurrency))
+        self.batch_size = max(1, min(batch_size, self.max_batch_size))
+        self.window_size = window_size
+        self.overload_threshold = overload_threshold
+
+        self.lock = threading.Lock()
+        # 爬山状态：当前调整的参数及各自方向
+        self.knob = "concurrency"
+        self.direction = {"concurrency": 1, "batch_size": 1}
+        self.last_throughput = None
+        self.best = {"throughput": 0.0, "latency": None, "concurrency": self.concurrency,
+                     "batch_size": self.batch_size}
+        self.history = []
+        self._reset_window()
+
+    @classmethod
+    def load(cls, endpoint, model, **kwargs):
+        """从上次运行收敛的结果开始"""
+        state = config_store.load_json(STATE_FILE, {}) or {}
+        saved = state.get(f"{endpoint}|{model}")
+        if saved:
+            kwargs.setdefault("concurrency", saved.get("concurrency", 2))
+            kwargs.setdefault("batch_size", saved.get("batch_size", 1))
+            print(f"读取到自动调优结果: 并发 {kwargs['concurrency']}，每批 {kwargs['batch_size']} 条")
+        return cls(endpoint, model, **kwargs)
+
+    def save(self):
+        """保存吞吐最高的设置，供下次运行使用"""
+        if self.best["throughput"] <= 0:
+            return
+        state = config_store.load_json(STATE_FILE, {}) or {}
+        state[f"{self.endpoint}|{self.model}"] = {
+            "concurrency": self.best["concurrency"],
+            "batch_size": self.best["batch_size"],
+            "cues_per_sec": round(self.best["throughput"], 3),
+            "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        config_store.save_json(STATE_FILE, state)
+
+    def _reset_window(self):
+        self.window_start = time.time()
+        self.window_cues = 0
+        self.window_requests = 0
+        self.window_successes = 0
+        self.window_overloads = 0
+        self.window_latency = 0.0
+
+    def latency_limit(self):
+        """请求的超时按 REQUEST_TIMEOUT 加每批条数计算，与翻译引擎一致"""
+        timeout = REQUEST_TIMEOUT + (self.batch_size if self.batch_size > 1 else 0)
+        return timeout * LATENCY_LIMIT_RATIO
+
+    def record_success(self, cues, latency):
+        """cues为这次请求实际翻译成功的条数，退回原文的不算"""
+        with self.lock:
+            self.window_cues += cues
+            self.window_requests += 1
+            self.window_successes += 1
+            self.window_latency += latency
+
+    def record_error(self, exc):
+        kind = classify_error(exc)
+        with self.lock:
+            self.window_requests += 1
+            if kind:
+                self.window_overloads += 1
+
+    def maybe_adjust(self):
+        """窗口内样本足够时调整一次参数，返回是否发生了变化"""
+        with self.lock:
+            if self.window_requests < max(self.window_size, self.concurrency):
+                return False
+            elapsed = max(time.time() - self.window_start, 1e-6)
+            throughput = self.window_cues / elapsed
+            overload_rate = self.window_overloads / self.window_requests
+            successes = self.window_successes
+            avg_latency = self.window_latency / successes if successes else 0.0
+            old = (self.concurrency, self.batch_size)
+
+            if overload_rate > self.overload_threshold:
+                # 超时/5xx增多：乘性减，并清空吞吐基准重新爬山
+                self.concurrency = max(1, self.concurrency // 2)
+                self.batch_size = max(1, self.batch_size // 2)
+                self.direction = {"concurrency": 1, "batch_size": 1}
+                self.last_throughput = None
+                reason = f"过载率 {overload_rate:.0%}，回退"
+            elif avg_latency > self.latency_limit():
+                # 请求在服务端排队，延迟逼近超时：加性减，避免接下来成批超时
+                self.concurrency = max(1, self.concurrency - 1)
+                self.batch_size = max(1, self.batch_size - 1)
+                self.direction = {"concurrency": -1, "batch_size": -1}
+                self.last_throughput = None
+                reason = f"平均延迟 {avg_latency:.2f} 秒接近超时，回退"
+            else:
+                # 吞吐明显更高，或持平但平均延迟更低时记为最佳
+                best_latency = self.best["latency"]
+                if (throughput > self.best["throughput"] * 1.05
+                        or (throughput >= self.best["throughput"] * 0.95
+                            and (best_latency is None or avg_latency < best_latency))):
+                    self.best = {"throughput": throughput, "latency": avg_latency, "concurrency": self.concurrency,
+                                 "batch_size": self.batch_size}
+                if self.last_throughput is not None and throughput < self.last_throughput * 1.05:
+                    # 没有明显提升：当前参数反向，并换另一个参数继续尝试
+                    self.direction[self.knob] *= -1
+                    if self.max_batch_size > 1:
+                        self.knob = "batch_size" if self.knob == "concurrency" else "concurrency"
+                self.last_throughput = throughput
+                self._step(self.knob)
+                reason = "爬山"
+
+            self.history.append({
+                "time": round(time.time(), 3),
+                "concurrency": old[0],
+                "batch_size": old[1],
+                "cues_per_sec": round(throughput, 3),
+                "avg_latency": round(avg_latency, 3),
+                "overload_rate": round(overload_rate, 3),
+            })
+            self._reset_window()
+            changed = old != (self.concurrency, self.batch_size)
+            if changed:
+                print(f"自动调优({reason}): 吞吐 {throughput:.2f} 条/秒，平均延迟 {avg_latency:.2f} 秒，"
+                      f"并发 {old[0]}→{self.concurrency}，每批 {old[1]}→{self.batch_size}")
+            return changed
+
+    def _step(self, knob):
+        limit = self.max_concurrency if knob == "concurrency" else self.max_batch_size
+        value = getattr(self, knob) + self.direction[knob]
+        if value < 1 or value > limit:
+            # 到达边界时掉头
+            self.direction[knob] *= -1
+            value = max(1, min(limit, getattr(self, knob) + self.direction[knob]))
+        setattr(self, knob, value)
@@ -0,0 +1,455 @@
+"""翻译引擎共用的文本处理、提示词和文件工具，线程引擎与异步引擎共享同一套语义"""
+import collections
+import functools
+import json
+import os
+import re
+import threading
+
+# 专用翻译模型
+SPECIAL_MODEL = "7shi/llama-translate:8b-q4_K_M"
+
+# 界面语言名 -> 专用翻译模型使用的语言名
+LANG_NAMES = {'中文': 'Mandarin', '英语': 'English', '日语': 'Japanese'}
+
+# 界面语言名 -> 输出文件名后缀
+LANG_CODES = {'中文': 'zh', '英语': 'en', '日语': 'ja'}
+
+# 超过这个长度的字幕按句子切分后再翻译
+MAX_CHUNK_LENGTH = 200
+
+# 单条请求的超时时间(秒)，较短的超时可以更快响应中止信号
+REQUEST_TIMEOUT = 2
+
+
+def read_subtitle_file(file_path):
+    """读取字幕文件并自动检测编码，返回解码后的文本"""
+    try:
+        # 尝试导入charset_normalizer进行编码检测
+        import charset_normalizer
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+            result = charset_normalizer.from_bytes(raw)
+            encoding = result.best().encoding if result.best() else 'utf-8'
+            print(f"检测到文件编码: {encoding}")
+            content = raw.decode(encoding, errors='replace')
+    except ImportError:
+        print("未安装charset-normalizer，使用备用编码检测方法")
+        # 如果没有charset_normalizer，使用多种编码尝试
+        encodings = ['utf-8', 'gbk', 'shift-jis', 'cp932', 'iso-8859-1']
+        content = None
+        for encoding in encodings:
+            try:
+                with open(file_path, 'r', encoding=encoding) as f:
+                    content = f.read()
+                print(f"使用编码 {encoding} 成功读取文件")
+                break
+            except UnicodeDecodeError:
+                print(f"编码 {encoding} 读取失败，尝试下一个...")
+                continue
+        
+        if content is None:
+            print("所有编码尝试失败，使用UTF-8容错模式")
+            # 如果所有编码都失败，使用utf-8并忽略错误
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                content = f.read()
+    
+    return content
+
+
+def build_output_path(input_path, src_lang, dest_lang, partial=False):
+    """输出文件名：去掉原语言后缀，加上目标语言后缀，部分结果再加_partial"""
+    from_code = LANG_CODES[src_lang]
+    to_code = LANG_CODES[dest_lang]
+    file_name, file_ext = os.path.splitext(input_path)
+    # 从名称尾部查找原语言映射词并删除
+    if file_name.endswith(from_code):
+        file_name = file_name[:-(len(from_code))]
+    # 加上目标语言映射词
+    suffix = "_partial" if partial else ""
+    return file_name + to_code + suffix + file_ext
+
+
+def build_checkpoint_path(input_path, src_lang, dest_lang):
+    """翻译进度文件，与部分结果放在一起，用于崩溃或中止后继续翻译"""
+    partial_path = build_output_path(input_path, src_lang, dest_lang, partial=True)
+    return os.path.splitext(partial_path)[0] + ".progress.jsonl"
+
+
+def split_api_urls(text):
+    """API地址栏可以填写多个地址，用逗号或空格分隔"""
+    return [url.rstrip('/') for url in re.split(r'[,，\s]+', text.strip()) if url]
+
+
+def max_retries_for(text, max_retries=2):
+    """根据文本特征决定重试次数"""
+    # 对于较短的文本，增加重试次数
+    if len(text) < 50:
+        max_retries = 3
+    
+    # 如果文本包含特殊字符或格式，可能容易卡住，降低重试次数
+    if any(char in text for char in ['♪', '♫', '※', '●', '■', '★']):
+        max_retries = 1
+        print(f"检测到特殊字符，降低重试次数: {text[:30]}...")
+    return max_retries
+
+
+# 少量示例用的平行句子，按语言对组成示例对话
+_EXAMPLE_SENTENCES = [
+    {'中文': '等一下，还没结束呢！', '英语': "Wait, it's not over yet!", '日语': 'ちょっと待って、まだ終わってない！'},
+    {'中文': '辛苦了，明天见。', '英语': 'Good work today. See you tomorrow.', '日语': 'お疲れさまでした。また明日。'},
+]
+
+
+@functools.lru_cache(maxsize=None)
+def build_prompt_prefix(src_lang, dest_lang):
+    """通用模型对话的固定前缀：系统提示词和示例对话。
+
+    同一语言对的单条、批量和参考记忆的请求都以这段逐字节相同的前缀开头，只有最后的字幕不同，
+    Ollama可以复用已经计算过的前缀（KV缓存），不必每条字幕都重新评估说明和示例。"""
+    system = (f"你是字幕翻译器。把用户发来的{src_lang}字幕翻译成{dest_lang}，只返回译文，不要添加任何解释。"
+              f"用户发来JSON数组时，逐条翻译，只返回同样长度的JSON数组。")
+    messages = [{"role": "system", "content": system}]
+    for example in _EXAMPLE_SENTENCES:
+        messages.append({"role": "user", "content": example[src_lang]})
+        messages.append({"role": "assistant", "content": example[dest_lang]})
+    messages.append({"role": "user", "content": json.dumps(
+        [example[src_lang] for example in _EXAMPLE_SENTENCES], ensure_ascii=False)})
+    messages.append({"role": "assistant", "content": json.dumps(
+        [example[dest_lang] for example in _EXAMPLE_SENTENCES], ensure_ascii=False)})
+    return tuple(messages)
+
+
+def build_general_messages(text, src_lang, dest_lang, match=None):
+    """单条翻译的对话；有相似的翻译记忆时，把记忆作为一轮示例放在固定前缀之后"""
+    messages = list(build_prompt_prefix(src_lang, dest_lang))
+    if match:
+        messages.append({"role": "user", "content": match.source})
+        messages.append({"role": "assistant", "content": match.translation})
+    messages.append({"role": "user", "content": text})
+    return messages
+
+
+def build_batch_messages(texts, src_lang, dest_lang):
+    return list(build_prompt_prefix(src_lang, dest_lang)) + [
+        {"role": "user", "content": json.dumps(texts, ensure_ascii=False)}]
+
+
+def parse_batch_response(content, count):
+    """解析批量翻译返回的JSON数组，条数对不上时抛出异常"""
+    # 模型可能在数组前后加说明文字，只取最外层的方括号部分
+    start, end = content.find('['), content.rfind(']')
+    try:
+        results = json.loads(content[start:end + 1]) if start != -1 and end > start else None
+    except ValueError:
+        results = None
+    if not isinstance(results, list) or len(results) != count:
+        raise Exception(f"批量翻译结果条数不匹配: 期望 {count} 条")
+    return [str(result).strip() for result in results]
+
+
+class PromptEvalStats:
+    """累计Ollama响应中的 prompt_eval_count/prompt_eval_duration，按翻译的字幕条数平均。
+    前缀被服务端缓存时，这两个值只包含新评估的部分"""
+
+    def __init__(self):
+        self.requests = 0
+        self.cues = 0
+        self.tokens = 0
+        self.duration = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, data, cues=1):
+        with self.lock:
+            self.requests += 1
+            self.cues += cues
+            self.tokens += data.get("prompt_eval_count") or 0
+            self.duration += (data.get("prompt_eval_duration") or 0) / 1e9
+
+    def describe(self):
+        with self.lock:
+            if not self.cues:
+                return "提示词评估: 无请求"
+            return (f"提示词评估: 平均每条字幕 {self.tokens / self.cues:.1f} token、"
+                    f"{self.duration / self.cues * 1000:.1f} 毫秒（{self.requests} 个请求）")
+
+
+@functools.lru_cache(maxsize=None)
+def _special_template(src_lang, dest_lang):
+    """专用模型模板在原文前后的固定部分"""
+    return (f"### Instruction:\nTranslate {LANG_NAMES[src_lang]} to {LANG_NAMES[dest_lang]}.\n\n### Input:\n",
+            "\n\n### Response:\n")
+
+
+def build_special_prompt(text, src_lang, dest_lang):
+    prefix, suffix = _special_template(src_lang, dest_lang)
+    return prefix + text + suffix
+
+
+def check_special_result(text, result):
+    """检查专用模型的结果是否合理"""
+    if not result or len(result) > len(text) * 3:  # 如果翻译结果异常长，可能有问题
+        print(f"专用模型翻译结果异常，原文长度: {len(text)}, 译文长度: {len(result)}")
+        if not result:
+            raise Exception("翻译结果为空")
+    return result
+
+
+def join_chunks(lines, translated, dest_lang):
+    """按原来的行结构重组分块译文，英文译文块之间需要空格"""
+    joiner = ' ' if dest_lang == '英语' else ''
+    translated = iter(translated)
+    translated_lines = []
+    for line in lines:
+        translated_lines.append(joiner.join(next(translated) for chunk in line if chunk.strip()))
+    return '\n'.join(translated_lines)
+
+
+def describe_repetition(repetition_info):
+    """预览窗口中显示的重复信息"""
+    repetition_desc = []
+    for info in repetition_info:
+        if info['type'] == 'continuous':
+            repetition_desc.append(f"连续重复'{info['char']}'×{info['count']}")
+        elif info['type'] == 'scattered':
+            repetition_desc.append(f"分散重复'{info['char']}'×{info['count']}")
+    return ', '.join(repetition_desc)
+
+
+def split_text_chunks(text, max_len=MAX_CHUNK_LENGTH):
+    """将超长文本按句子、分句边界切分为不超过max_len的片段，按行返回以保留换行"""
+    # 句末标点（中日文。！？及英文标点），允许后跟右引号/括号
+    sentence_pattern = r'[。！？!?…]+[」』”’"）)]*\s*|(?<=[A-Za-z0-9"\')])\.\s+'
+    # 分句标点
+    clause_pattern = r'[、，,；;：:]\s*'
+
+    lines = []
+    for line in text.split('\n'):
+        pieces = []
+        for sentence in _split_keep_delimiter(line, sentence_pattern):
+            if len(sentence) <= max_len:
+                pieces.append(sentence)
+                continue
+            # 单句仍然过长，继续按分句切分
+            for clause in _split_keep_delimiter(sentence, clause_pattern):
+                # 分句依旧过长时只能按长度硬切
+                while len(clause) > max_len:
+                    pieces.append(clause[:max_len])
+                    clause = clause[max_len:]
+                if clause:
+                    pieces.append(clause)
+
+        # 贪心合并相邻片段，在不超长的前提下尽量减少请求数
+        chunks = []
+        for piece in pieces:
+            if chunks and len(chunks[-1]) + len(piece) <= max_len:
+                chunks[-1] += piece
+            else:
+                chunks.append(piece)
+        lines.append(chunks)
+    return lines
+
+
+def _split_keep_delimiter(text, pattern):
+    """按正则切分文本，分隔符保留在前一段末尾"""
+    parts = re.split(f"({pattern})", text)
+    segments = []
+    for i in range(0, len(parts), 2):
+        segment = parts[i] + (parts[i + 1] if i + 1 < len(parts) else '')
+        if segment:
+            segments.append(segment)
+    return segments
+
+
+def compress_repetitive_text(text):
+    """检测重复字符并提取核心内容用于翻译，返回核心内容和重复信息"""
+    if len(text.strip()) < 5:
+        return text, False, None
+
+    original_text = text
+    repetition_info = []  # 存储重复信息
+
+    # 第一步：检测短语重复（如：いいよ、いいよ、いいよ、 → いいよ*N）
+    # 检测常见的短语重复模式
+    phrase_patterns = [
+        r'(いいよ[、。，！？\s]*){4,}',  # いいよ重复
+        r'(そう[、。，！？\s]*){4,}',   # そう重复
+        r'(はい[、。，！？\s]*){4,}',   # はい重复
+        r'(ああ[、。，！？\s]*){4,}',   # ああ重复
+        r'(うん[、。，！？\s]*){4,}',   # うん重复
+        r'([^、。，！？\s]{1,3}[、。，！？\s]*)\1{3,}',  # 通用短语重复检测
+    ]
+
+    for pattern in phrase_patterns:
+        matches = list(re.finditer(pattern, text))
+        if matches:
+            for match in matches:
+                full_match = match.group(0)
+                repeated_phrase = match.group(1) if match.groups() else match.group(0)
+
+                # 计算重复次数
+                count = len(re.findall(re.escape(repeated_phrase.rstrip('、。，！？ \n')), full_match))
+
+                if count >= 4:  # 至少重复4次
+                    repetition_info.append({
+                        'type': 'phrase',
+                        'phrase': repeated_phrase.rstrip('、。，！？ \n'),
+                        'count': count,
+                        'start': match.start(),
+                        'end': match.end()
+                    })
+
+                    # 替换为单个短语
+                    core_phrase = repeated_phrase.rstrip('、。，！？ \n')
+                    core_text = text[:match.start()] + core_phrase + text[match.end():]
+                    print(f"检测到短语重复'{core_phrase}'×{count}，核心内容: {core_text[:50]}...")
+                    return core_text, True, repetition_info
+
+    # 第二步：检测连续重复的单字符（如：ああああ → あ*4）
+    pattern = r'(.)\1{3,}'  # 匹配连续重复4次及以上的字符
+    matches = list(re.finditer(pattern, text))
+
+    if matches:
+        # 找到连续重复，提取重复信息
+        for match in matches:
+            char = match.group(1)
+            count = len(match.group(0))
+            repetition_info.append({
+                'type': 'continuous',
+                'char': char,
+                'count': count,
+                'start': match.start(),
+                'end': match.end()
+            })
+
+        # 移除重复部分，保留核心内容
+        core_text = text
+        for match in reversed(matches):  # 从后往前替换，避免位置偏移
+            core_text = core_text[:match.start()] + match.group(1) + core_text[match.end():]
+
+        print(f"检测到连续重复，核心内容: {core_text[:50]}...")
+        return core_text, True, repetition_info
+
+    # 第三步：检测分散的重复字符（如：お、お、お、お → お*8）
+    char_count = collections.Counter(re.sub(r'[、。，！？\s]', '', text))
+
+    for char, count in char_count.items():
+        if count >= 8:  # 如果某个字符出现8次以上
+            # 找到包含该字符的所有位置
+            pattern = f"{re.escape(char)}[、。，！？\\s]*"
+            matches = list(re.finditer(pattern, text))
+
+            if len(matches) >= 6:
+                # 记录重复信息
+                repetition_info.append({
+                    'type': 'scattered',
+                    'char': char,
+                    'count': len(matches),
+                    'positions': [m.span() for m in matches]
+                })
+
+                # 移除重复的字符，只保留一个和其他内容
+                core_text = text
+                # 简单处理：移除多余的重复字符
+                core_text = re.sub(f"({re.escape(char)}[、。，！？\\s]*)+", char, core_text)
+
+                print(f"检测到分散重复字符'{char}': 出现{len(matches)}次，核心内容: {core_text[:50]}...")
+                return core_text, True, repetition_info
+
+    return text, False, None
+
+
+def reconstruct_with_repetition(translated_text, repetition_info):
+    """将翻译后的文本与重复信息重新组合"""
+    if not repetition_info:
+        return translated_text
+
+    result = translated_text
+
+    for info in repetition_info:
+        if info['type'] == 'phrase':
+            # 短语重复：翻译短语后加上重复次数
+            original_phrase = info['phrase']
+            count = info['count']
+
+            # 常见短语的翻译映射
+            phrase_translation = {
+                'いいよ': '好的',
+                'そう': '对',
+                'はい': '是的',
+                'ああ': '啊',
+                'うん': '嗯'
+            }
+
+            # 尝试翻译短语
+            if original_phrase in phrase_translation:
+                translated_phrase = phrase_translation[original_phrase]
+            else:
+                # 如果翻译结果中包含原短语，保持原样
+                translated_phrase = original_phrase
+
+            # 在翻译结果前加上重复标记
+            if original_phrase in result:
+                result = result.replace(original_phrase, f"{translated_phrase}*{count}", 1)
+            else:
+                result = f"{translated_phrase}*{count}" + result
+
+            print(f"重构短语重复: {original_phrase}*{count} → {translated_phrase}*{count}")
+
+        elif info['type'] == 'continuous':
+            # 连续重复：在翻译结果前加上重复标记
+            original_char = info['char']
+            count = info['count']
+            # 尝试找到原字符对应的翻译字符
+            # 简单处理：如果翻译结果包含对应字符，则添加重复标记
+            if original_char in ['あ', 'お']:
+                if 'あ' in translated_text or '啊' in translated_text:
+                    result = f"啊*{count}" + result.replace('啊', '')
+                elif 'お' in translated_text or '哦' in translated_text:
+                    result = f"哦*{count}" + result.replace('哦', '')
+                else:
+                    # 如果没有找到对应字符，在开头添加
+                    translated_char = '啊' if original_char == 'あ' else '哦' if original_char == 'お' else original_char
+                    result = f"{translated_char}*{count}" + result
+
+        elif info['type'] == 'scattered':
+            # 分散重复：类似处理
+            original_char = info['char']
+            count = info['count']
+            if original_char in ['あ', 'お']:
+                translated_char = '啊' if original_char == 'あ' else '哦' if original_char == 'お' else original_char
+                result = f"{translated_char}*{count}" + result.replace(translated_char, '', 1)
+
+    return result
+
+
+def has_excessive_repetition(text):
+    """检测文本是否包含大量重复字符，这类文本容易让LLM卡住"""
+    # 去除标点符号，只检查核心内容
+    clean_text = re.sub(r'[、。，！？\s]', '', text)
+
+    if len(clean_text) < 5:  # 太短的文本不检测
+        return False
+
+    # 检测1：单字符重复超过10次
+    for char in set(clean_text):
+        if clean_text.count(char) > 10:
+            print(f"发现字符'{char}'重复{clean_text.count(char)}次")
+            return True
+
+    # 检测2：相同的2-3字符片段重复超过5次
+    for length in [2, 3]:
+        for i in range(len(clean_text) - length + 1):
+            fragment = clean_text[i:i+length]
+            count = len(re.findall(re.escape(fragment), clean_text))
+            if count > 5:
+                print(f"发现片段'{fragment}'重复{count}次")
+                return True
+
+    # 检测3：字符种类太少（可能全是重复）
+    unique_chars = len(set(clean_text))
+    if len(clean_text) > 50 and unique_chars < 5:
+        print(f"文本长度{len(clean_text)}但只有{unique_chars}种字符")
+        return True
+
+    return False
@@ -0,0 +1,497 @@
+"""翻译守护进程：本地HTTP任务接口
+
+把字幕翻译作为共享服务运行，下载工具、媒体服务器等通过HTTP提交任务，不必每个用户开一个窗口。
+启动时载入一次设置，各任务在同一个事件循环中运行异步引擎（与界面的异步引擎相同），
+共用到Ollama的连接、并发名额（SharedConnections）和翻译记忆，并用 keep_alive 让模型常驻显存。
+
+等待的任务按优先级（数字大的先运行）排队，同一优先级内按客户端公平轮转：
+每个客户端累计已开始翻译的字幕条数，条数最少的客户端的任务先运行，一个客户端提交很多任务也不会挤占其他客户端；
+客户端闲置后再提交时从当前活跃客户端中的最小值算起，不能攒下额度。
+
+接口（请求和响应均为JSON，除非另有说明）:
+    POST   /jobs                {"srt": 字幕文本, "src_lang", "dest_lang", "model", "priority", "client", "name"}
+    GET    /jobs                所有任务的状态
+    GET    /jobs/<id>           任务状态和进度
+    GET    /jobs/<id>/events    流式进度，每行一个JSON消息（与界面的 message_queue 消息相同），任务结束后关闭
+    GET    /jobs/<id>/result    翻译好的SRT文件
+    DELETE /jobs/<id>           取消任务（运行中的任务保存已完成的部分后结束）
+    GET    /stats               队列、运行中任务数和各客户端的已翻译条数
+
+用法:
+    python translate_daemon.py --model qwen2.5:7b --port 8765 --max-jobs 2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from config_store import CONFIG_DIR
+from cue_store import CueStore
+from translate_common import LANG_CODES, SPECIAL_MODEL, build_output_path, split_api_urls
+
+JOBS_DIR = os.path.join(CONFIG_DIR, "jobs")
+# 已结束的任务保留这么多个，更早的连同文件一起删除
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    def __init__(self, job_id, input_path, settings, priority=0, client="default"):
+        self.id = job_id
+        self.input_path = input_path
+        self.settings = settings
+        self.priority = priority
+        self.client = client
+        self.state = "queued"  # queued → running → done/failed/cancelled
+        self.total = 0
+        self.progress = 0
+        self.message = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.events = []
+        self.changed = threading.Condition()
+
+    @property
+    def output_path(self):
+        return build_output_path(self.input_path, self.settings["src_lang"], self.settings["dest_lang"])
+
+    def emit(self, message):
+        """引擎的消息：更新进度并通知正在读取流式进度的连接"""
+        with self.changed:
+            if message["type"] == "progress":
+                self.total = message.get("maximum", self.total)
+                self.progress = message["value"]
+            elif message["type"] == "status":
+                self.message = message["text"]
+            elif message["type"] == "error":
+                self.message = message["text"]
+                self.state = "failed"
+            self.events.append(message)
+            self.changed.notify_all()
+
+    def finish(self, state):
+        with self.changed:
+            if self.state not in ("failed",):
+                self.state = state
+            self.finished = time.time()
+            self.changed.notify_all()
+
+    @property
+    def done(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def snapshot(self, position=None):
+        return {
+            "id": self.id, "client": self.client, "priority": self.priority, "state": self.state,
+            "src_lang": self.settings["src_lang"], "dest_lang": self.settings["dest_lang"],
+            "model": self.settings["model"], "progress": self.progress, "total": self.total,
+            "message": self.message, "position": position, "created": self.created,
+            "started": self.started, "finished": self.finished,
+        }
+
+
+class FairJobQueue:
+    """按优先级排队，同一优先级内已翻译条数最少的客户端先运行"""
+
+    def __init__(self):
+        self.waiting = []
+        self.served = {}  # 客户端 -> 已开始翻译的字幕条数
+        self.active = {}  # 客户端 -> 排队和运行中的任务数
+        self.lock = threading.Lock()
+
+    def push(self, job):
+        with self.lock:
+            if not self.active.get(job.client):
+                # 闲置后再提交的客户端从活跃客户端中的最小值算起，不能攒下额度
+                busy = [self.served[c] for c, n in self.active.items() if n and c in self.served]
+                self.served[job.client] = max(self.served.get(job.client, 0), min(busy, default=0))
+            self.active[job.client] = self.active.get(job.client, 0) + 1
+            self.waiting.append(job)
+
+    def pop(self):
+        with self.lock:
+            if not self.waiting:
+                return None
+            # 优先级高的先，同优先级已翻译条数少的客户端先，再按提交顺序
+            job = max(self.waiting, key=lambda j: (j.priority, -self.served.get(j.client, 0), -j.created))
+            self.waiting.remove(job)
+            return job
+
+    def charge(self, job, cues):
+        with self.lock:
+            self.served[job.client] = self.served.get(job.client, 0) + cues
+
+    def release(self, job):
+        with self.lock:
+            self.active[job.client] -= 1
+
+    def remove(self, job):
+        """取消还在排队的任务，返回是否在队列中"""
+        with self.lock:
+            if job in self.waiting:
+                self.waiting.remove(job)
+                self.active[job.client] -= 1
+                return True
+            return False
+
+    def positions(self):
+        """排队任务按当前规则的运行顺序"""
+        with self.lock:
+            order = sorted(self.waiting, key=lambda j: (-j.priority, self.served.get(j.client, 0), j.created))
+            return {job.id: n + 1 for n, job in enumerate(order)}
+
+    def describe(self):
+        with self.lock:
+            return {"waiting": len(self.waiting), "served": dict(self.served)}
+
+
+class TranslationDaemon:
+    def __init__(self, settings, host="127.0.0.1", port=8765, max_jobs=2, jobs_dir=JOBS_DIR):
+        # 默认设置，提交任务时可以覆盖语言和模型
+        self.settings = settings
+        self.max_jobs = max_jobs
+        self.jobs_dir = jobs_dir
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.queue = FairJobQueue()
+        self.running = 0
+        self.completed_cues = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = None
+        self.pools = {}  # 模型 -> SharedConnections
+        self.memories = {}  # (原语言, 目标语言) -> TranslationMemory
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.http_thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="daemon-loop")
+        self.loop_thread.start()
+        # 启动时就建立连接并载入默认模型，第一个任务不用等模型加载
+        asyncio.run_coroutine_threadsafe(self.get_pool(self.model_for(self.settings)), self.loop)
+        self.http_thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="daemon-http")
+        self.http_thread.start()
+        return self
+
+    def stop(self):
+        for job in list(self.jobs.values()):
+            if not job.done:
+                self.cancel(job)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        future = asyncio.run_coroutine_threadsafe(self.close_pools(), self.loop)
+        try:
+            future.result(timeout=10)
+        except Exception as e:
+            print(f"关闭连接出错: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout=5)
+        for memory in self.memories.values():
+            memory.close()
+
+    @staticmethod
+    def model_for(settings):
+        return SPECIAL_MODEL if settings.get("use_special_model") else settings["model"]
+
+    async def get_pool(self, model):
+        """各模型共用的连接；每个地址上的生成参数方案也只有一个，所有任务都用它，num_ctx不会因任务不同而变"""
+        from async_engine import SharedConnections, start_contexts
+        pool = self.pools.get(model)
+        if pool is None:
+            pool = self.pools[model] = SharedConnections(self.settings["api_urls"], model, model == SPECIAL_MODEL,
+                                                         self.settings.get("generation_profile"))
+            await start_contexts(pool.endpoints)
+            await self.warm_up(pool)
+        return pool
+
+    async def warm_up(self, pool):
+        """发送一个空请求让Ollama载入模型；options和keep_alive与之后的翻译请求相同，载入后不会再重新加载"""
+        for endpoint in pool.endpoints:
+            payload = endpoint.profile.payload("single", "", 0)
+            try:
+                await pool.client.post(f"{endpoint.url}/api/generate",
+                                       json={"model": pool.model, "stream": False, **payload}, timeout=120)
+                print(f"已载入模型 {pool.model}: {endpoint.url}")
+            except Exception as e:
+                print(f"预先载入模型失败({endpoint.url}): {str(e)}")
+
+    async def close_pools(self):
+        for pool in self.pools.values():
+            await pool.close()
+
+    def get_memory(self, src_lang, dest_lang):
+        from translation_memory import TranslationMemory
+        key = (src_lang, dest_lang)
+        with self.lock:
+            if key not in self.memories:
+                self.memories[key] = TranslationMemory.open(src_lang, dest_lang, **{
+                    name: self.settings[name] for name in ("reuse_threshold", "hint_threshold") if name in self.settings})
+            return self.memories[key]
+
+    def submit(self, request):
+        """新建任务并排队，返回任务；请求内容不合法时抛出异常"""
+        srt_text = request.get("srt")
+        if not isinstance(srt_text, str) or not srt_text.strip():
+            raise ValueError("缺少字幕内容(srt)")
+        settings = dict(self.settings)
+        for key in ("src_lang", "dest_lang", "model", "use_special_model"):
+            if request.get(key) is not None:
+                settings[key] = request[key]
+        if settings["src_lang"] not in LANG_CODES or settings["dest_lang"] not in LANG_CODES:
+            raise ValueError(f"不支持的语言，可选: {'、'.join(LANG_CODES)}")
+        if settings["src_lang"] == settings["dest_lang"]:
+            raise ValueError("原语言和目标语言相同")
+        # 先解析一遍，格式不对时直接拒绝
+        total = len(CueStore.parse(srt_text))
+
+        job_id = f"{next(self.ids):06d}"
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        name = re.sub(r'[^\w.-]', '_', os.path.splitext(os.path.basename(request.get("name") or "subtitle"))[0])
+        input_path = os.path.join(job_dir, f"{name}_{LANG_CODES[settings['src_lang']]}.srt")
+        with open(input_path, 'w', encoding='utf-8') as f:
+            f.write(srt_text)
+        job = Job(job_id, input_path, settings, int(request.get("priority", 0)), str(request.get("client") or "default"))
+        job.total = total
+        with self.lock:
+            self.jobs[job_id] = job
+            self.prune()
+        self.queue.push(job)
+        print(f"收到任务 {job_id}: 客户端 {job.client}，优先级 {job.priority}，{total} 条字幕")
+        self.loop.call_soon_threadsafe(self.schedule)
+        return job
+
+    def prune(self):
+        finished = sorted((job for job in self.jobs.values() if job.done), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+            shutil.rmtree(os.path.dirname(job.input_path), ignore_errors=True)
+
+    def cancel(self, job):
+        job.cancelled = True
+        if self.queue.remove(job):
+            job.finish("cancelled")
+
+    def schedule(self):
+        """在事件循环中运行：有空闲名额时按队列规则启动下一个任务"""
+        while self.running < self.max_jobs:
+            job = self.queue.pop()
+            if job is None:
+                break
+            self.running += 1
+            self.loop.create_task(self.run_job(job))
+
+    async def run_job(self, job):
+        from async_engine import AsyncTranslationEngine
+        settings = job.settings
+        try:
+            job.started = time.time()
+            job.state = "running"
+            self.queue.charge(job, job.total)
+            pool = await self.get_pool(self.model_for(settings))
+            memory = (await asyncio.to_thread(self.get_memory, settings["src_lang"], settings["dest_lang"])
+                      if settings.get("use_memory") else None)
+            engine = AsyncTranslationEngine(
+                job.input_path, settings["src_lang"], settings["dest_lang"], settings["api_urls"],
+                settings["model"], use_special_model=settings.get("use_special_model", False),
+                emit=job.emit, should_stop=lambda: job.cancelled, use_memory=memory is not None,
+                hedge=settings.get("hedge", False), hedge_budget=settings.get("hedge_budget", 0.05),
+                merge_fragments=settings.get("merge_fragments", False),
+                shared=pool, memory=memory)
+            await engine.run()
+            if job.cancelled:
+                job.finish("cancelled")
+            elif os.path.exists(job.output_path):
+                with self.lock:
+                    self.completed_cues += job.total
+                job.finish("done")
+            else:
+                job.finish("failed")
+        except Exception as e:
+            print(f"任务 {job.id} 出错: {str(e)}")
+            job.emit({"type": "error", "text": f"翻译失败：{str(e)}"})
+            job.finish("failed")
+        finally:
+            elapsed = (job.finished or time.time()) - job.started
+            print(f"任务 {job.id} 结束: {job.state}，耗时 {elapsed:.1f} 秒")
+            self.queue.release(job)
+            self.running -= 1
+            self.schedule()
+
+    def status(self):
+        positions = self.queue.positions()
+        with self.lock:
+            jobs = list(self.jobs.values())
+            completed_cues = self.completed_cues
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        uptime = time.time() - self.started
+        return {"jobs": states, "running": self.running, "max_jobs": self.max_jobs,
+                "completed_cues": completed_cues, "cues_per_sec": round(completed_cues / uptime, 2),
+                "uptime": round(uptime, 1), "positions": positions, **self.queue.describe()}
+
+    def _make_handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, data):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _find_job(self, parts):
+                job = daemon.jobs.get(parts[1]) if len(parts) > 1 else None
+                if job is None:
+                    self._send_json(404, {"error": "任务不存在"})
+                return job
+
+            def do_POST(self):
+                if urlsplit(self.path).path.rstrip("/") != "/jobs":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    job = daemon.submit(request)
+                except Exception as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                self._send_json(201, job.snapshot(daemon.queue.positions().get(job.id)))
+
+            def do_DELETE(self):
+                parts = urlsplit(self.path).path.strip("/").split("/")
+                if parts[0] != "jobs" or len(parts) != 2:
+                    self._send_json(404, {"error": "not found"})
+                    return
+                job = self._find_job(parts)
+                if job:
+                    daemon.cancel(job)
+                    self._send_json(200, job.snapshot())
+
+            def do_GET(self):
+                parts = urlsplit(self.path).path.strip("/").split("/")
+                if parts == ["stats"]:
+                    self._send_json(200, daemon.status())
+                elif parts == ["jobs"]:
+                    positions = daemon.queue.positions()
+                    self._send_json(200, [job.snapshot(positions.get(job.id)) for job in list(daemon.jobs.values())])
+                elif parts[0] == "jobs" and len(parts) == 2:
+                    job = self._find_job(parts)
+                    if job:
+                        self._send_json(200, job.snapshot(daemon.queue.positions().get(job.id)))
+                elif parts[0] == "jobs" and len(parts) == 3 and parts[2] == "events":
+                    job = self._find_job(parts)
+                    if job:
+                        self.stream_events(job)
+                elif parts[0] == "jobs" and len(parts) == 3 and parts[2] == "result":
+                    job = self._find_job(parts)
+                    if job:
+                        self.send_result(job)
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def stream_events(self, job):
+                """逐行写出任务的消息，先补发已有的，任务结束后关闭连接"""
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+                self.end_headers()
+                self.close_connection = True
+                sent = 0
+                try:
+                    while True:
+                        with job.changed:
+                            while sent == len(job.events) and not job.done:
+                                job.changed.wait(1.0)
+                            events = job.events[sent:]
+                            done = job.done
+                        for event in events:
+                            self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                        sent += len(events)
+                        self.wfile.flush()
+                        if done and sent == len(job.events):
+                            self.wfile.write((json.dumps({"type": "job", **job.snapshot()}, ensure_ascii=False)
+                                              + "\n").encode("utf-8"))
+                            break
+                except OSError:
+                    # 客户端断开
+                    pass
+
+            def send_result(self, job):
+                if job.state != "done":
+                    self._send_json(409, {"error": f"任务尚未完成: {job.state}"})
+                    return
+                with open(job.output_path, 'rb') as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-subrip; charset=utf-8")
+                self.send_header("Content-Disposition",
+                                 f'attachment; filename="{os.path.basename(job.output_path)}"')
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SRT字幕翻译守护进程")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--api", default="http://localhost:11434", help="Ollama地址，多个地址用逗号分隔")
+    parser.add_argument("--model", default="", help="默认模型，提交任务时可以指定其他模型")
+    parser.add_argument("--special-model", action="store_true", help="默认使用专用翻译模型")
+    parser.add_argument("--src", default="日语", choices=list(LANG_CODES), help="默认原语言")
+    parser.add_argument("--dest", default="中文", choices=list(LANG_CODES), help="默认目标语言")
+    parser.add_argument("--max-jobs", type=int, default=2, help="同时运行的任务数，各任务共用并发名额")
+    parser.add_argument("--profile", help="生成参数方案，默认为各模型保存的方案")
+    parser.add_argument("--no-memory", action="store_true", help="不使用翻译记忆")
+    parser.add_argument("--no-merge", action="store_true", help="不合并断句的相邻字幕")
+    parser.add_argument("--hedge", action="store_true", help="慢请求超过p95时再发一份备份请求")
+    parser.add_argument("--jobs-dir", default=JOBS_DIR, help="保存任务字幕文件的目录")
+    args = parser.parse_args()
+
+    settings = {
+        "src_lang": args.src,
+        "dest_lang": args.dest,
+        "api_urls": split_api_urls(args.api),
+        "model": args.model,
+        "use_special_model": args.special_model,
+        "use_memory": not args.no_memory,
+        "merge_fragments": not args.no_merge,
+        "hedge": args.hedge,
+        "generation_profile": args.profile,
+    }
+    daemon = TranslationDaemon(settings, args.host, args.port, args.max_jobs, args.jobs_dir).start()
+    print(f"翻译守护进程已启动: {daemon.url}（同时运行 {args.max_jobs} 个任务）")
+    try:
+        daemon.http_thread.join()
+    except KeyboardInterrupt:
+        print("正在停止...")
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""独立进程翻译
+
+翻译引擎在子进程中运行，进度和预览消息经 multiprocessing 队列送回界面进程，
+正则分析、字幕写出、大段JSON解析不再与Tk争抢GIL。子进程卡死可以强制结束，
+崩溃时界面照常可用，已完成的部分可从进度文件恢复并继续翻译。
+
+命令行用法:
+    python translate_worker.py 输入.srt --src 日语 --dest 中文 --model qwen2.5:7b
+    python translate_worker.py 输入.srt --model qwen2.5:7b --record run.cassette.gz   # 录制请求和响应
+    python translate_worker.py 输入.srt --model qwen2.5:7b --replay run.cassette.gz   # 不连接Ollama回放
+    python translate_worker.py 输入.srt --model qwen2.5:7b --profiling   # 采样分析，结果写在输出SRT旁边
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+
+from cue_store import CueStore
+from translation_memory import DEFAULT_REUSE_THRESHOLD, DEFAULT_HINT_THRESHOLD
+from translate_common import build_output_path, build_checkpoint_path, split_api_urls
+
+
+def create_engine(settings, emit, should_stop, resume=False):
+    from async_engine import AsyncTranslationEngine
+    return AsyncTranslationEngine(
+        settings["input_file"],
+        settings["src_lang"],
+        settings["dest_lang"],
+        settings["api_urls"],
+        settings["model"],
+        use_special_model=settings.get("use_special_model", False),
+        emit=emit,
+        should_stop=should_stop,
+        checkpoint=True,
+        resume=resume,
+        use_memory=settings.get("use_memory", False),
+        reuse_threshold=settings.get("reuse_threshold", DEFAULT_REUSE_THRESHOLD),
+        hint_threshold=settings.get("hint_threshold", DEFAULT_HINT_THRESHOLD),
+        hedge=settings.get("hedge", False),
+        hedge_budget=settings.get("hedge_budget", 0.05),
+        merge_fragments=settings.get("merge_fragments", False),
+        generation_profile=settings.get("generation_profile")
+    )
+
+
+def run_engine(engine, settings, emit):
+    """运行引擎；开启性能分析时在采样分析下运行"""
+    if not settings.get("profiling"):
+        asyncio.run(engine.run())
+        return
+    from sampling_profiler import run_profiled
+    output_path = build_output_path(settings["input_file"], settings["src_lang"], settings["dest_lang"])
+    run_profiled(lambda: asyncio.run(engine.run()), output_path, emit)
+
+
+def worker_main(settings, event_queue, stop_event, resume):
+    """子进程入口"""
+    engine = create_engine(settings, event_queue.put, stop_event.is_set, resume)
+    run_engine(engine, settings, event_queue.put)
+
+
+def has_checkpoint(settings):
+    return os.path.exists(build_checkpoint_path(settings["input_file"], settings["src_lang"], settings["dest_lang"]))
+
+
+def recover_partial(settings):
+    """根据进度文件写出部分翻译结果，返回 (输出路径, 条数)"""
+    from async_engine import load_checkpoint
+    checkpoint_path = build_checkpoint_path(settings["input_file"], settings["src_lang"], settings["dest_lang"])
+    done = load_checkpoint(checkpoint_path)
+    if not done:
+        return None, 0
+    try:
+        store = CueStore.from_file(settings["input_file"])
+        store.translations[:len(done)] = done
+        output_path = build_output_path(settings["input_file"], settings["src_lang"], settings["dest_lang"],
+                                        partial=True)
+        store.write(output_path, len(done))
+        print(f"已从进度文件恢复 {len(done)} 条翻译结果: {output_path}")
+        return output_path, len(done)
+    except Exception as e:
+        print(f"恢复部分翻译结果失败: {str(e)}")
+        return None, 0
+
+
+class TranslationWorker:
+    """界面进程中的翻译子进程句柄：启动、中止、强制结束，并把消息转发到message_queue"""
+
+    def __init__(self, settings, message_queue):
+        self.settings = settings
+        self.message_queue = message_queue
+        # Tk进程不能安全地fork，统一使用spawn
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.event_queue = None
+        self.stop_event = None
+        self.killed = False
+
+    def start(self, resume=False):
+        """启动子进程，返回转发线程（子进程结束后转发线程随之结束）"""
+        self.killed = False
+        self.event_queue = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.process = self.context.Process(
+            target=worker_main,
+            args=(self.settings, self.event_queue, self.stop_event, resume),
+            daemon=True
+        )
+        self.process.start()
+        print(f"翻译子进程已启动，PID: {self.process.pid}")
+        bridge_thread = threading.Thread(target=self.forward_messages, daemon=True)
+        bridge_thread.start()
+        return bridge_thread
+
+    def stop(self):
+        """请求子进程中止，子进程会保存部分结果后退出"""
+        if self.stop_event:
+            self.stop_event.set()
+
+    def kill(self):
+        """子进程没有响应中止信号时强制结束"""
+        if self.process and self.process.is_alive():
+            self.killed = True
+            self.process.terminate()
+
+    def forward_messages(self):
+        """把子进程消息转到message_queue；子进程没有发出结束消息就退出时视为崩溃"""
+        finished = False
+        while True:
+            try:
+                message = self.event_queue.get(timeout=0.2)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+                continue
+            except (EOFError, OSError):
+                break
+            self.message_queue.put(message)
+            if message["type"] in ("complete", "error"):
+                finished = True
+
+        self.process.join(timeout=1)
+        if not finished:
+            print(f"翻译子进程异常退出，退出码: {self.process.exitcode}")
+            self.message_queue.put({
+                "type": "worker_exited",
+                "exitcode": self.process.exitcode,
+                "killed": self.killed
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SRT字幕翻译（命令行）")
+    parser.add_argument("input_file", help="要翻译的SRT文件")
+    parser.add_argument("--src", default="英语", choices=["英语", "日语", "中文"], help="原语言")
+    parser.add_argument("--dest", default="中文", choices=["英语", "日语", "中文"], help="目标语言")
+    parser.add_argument("--model", default="", help="Ollama模型名")
+    parser.add_argument("--api", default="http://localhost:11434", help="API地址，多个地址用逗号分隔")
+    parser.add_argument("--special-model", action="store_true", help="使用专用翻译模型")
+    parser.add_argument("--resume", action="store_true", help="从进度文件继续翻译")
+    parser.add_argument("--no-memory", action="store_true", help="不使用翻译记忆")
+    parser.add_argument("--profile", help="生成参数方案（如 标准、精简、Ollama默认），默认为该模型保存的方案")
+    parser.add_argument("--no-merge", action="store_true", help="不合并断句的相邻字幕")
+    parser.add_argument("--hedge", action="store_true", help="慢请求超过p95时再发一份备份请求")
+    parser.add_argument("--hedge-budget", type=float, default=0.05, help="备份请求占总请求数的上限")
+    parser.add_argument("--reuse-threshold", type=float, default=DEFAULT_REUSE_THRESHOLD,
+                        help="相似度达到此值时直接复用翻译记忆")
+    parser.add_argument("--hint-threshold", type=float, default=DEFAULT_HINT_THRESHOLD,
+                        help="相似度达到此值时把翻译记忆作为参考传给模型")
+    parser.add_argument("--profiling", action="store_true", help="采样分析各阶段耗时，火焰图数据和摘要写在输出SRT旁边")
+    parser.add_argument("--record", metavar="CASSETTE", help="把发给Ollama的请求和响应录制到cassette文件")
+    parser.add_argument("--replay", metavar="CASSETTE", help="不连接Ollama，回放cassette中录下的响应")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="回放倍速，0表示不等待")
+    args = parser.parse_args()
+
+    settings = {
+        "input_file": args.input_file,
+        "src_lang": args.src,
+        "dest_lang": args.dest,
+        "api_urls": split_api_urls(args.api),
+        "model": args.model,
+        "use_special_model": args.special_model,
+        "use_memory": not args.no_memory,
+        "reuse_threshold": args.reuse_threshold,
+        "hint_threshold": args.hint_threshold,
+        "hedge": args.hedge,
+        "hedge_budget": args.hedge_budget,
+        "merge_fragments": not args.no_merge,
+        "generation_profile": args.profile,
+        "profiling": args.profiling,
+    }
+
+    # 录制/回放时在本进程内启动代理或替身服务，请求发给它
+    server = None
+    if args.record:
+        from cassette import CassetteRecorder
+        server = CassetteRecorder(args.record, settings["api_urls"][0]).start()
+        settings["api_urls"] = [server.url]
+    elif args.replay:
+        from cassette import CassetteServer
+        server = CassetteServer(args.replay, args.replay_speed).start()
+        settings["api_urls"] = [server.url]
+
+    def emit(message):
+        if message["type"] in ("status", "error"):
+            print(message["text"])
+
+    engine = create_engine(settings, emit, lambda: False, args.resume)
+    try:
+        run_engine(engine, settings, emit)
+    except KeyboardInterrupt:
+        print("已中断，可使用 --resume 继续翻译")
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
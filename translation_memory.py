@@ -0,0 +1,220 @@
+"""相似句翻译记忆
+
+字幕中反复出现的句子常常只差标点、全角/半角、结尾的“…”或省略了一个格助词，逐字比对的缓存命中不了。
+这里把原文规范化（NFKC统一全半角、去掉标点和空白）后按二元字组建立倒排索引，
+查询时从最稀有的字组开始统计候选的共有字组数（跳过倒排表很长的常用字组），
+只对共有最多的几十个候选用Dice系数计算相似度，几十万条记忆下单次查询也在1毫秒以内。
+
+相似度高不代表只差标点：“テスト文11です。”与“テスト文1です。”的相似度也在0.9以上。
+所以只有规范化后完全相同，或只在句中多/少一个格助词（数字和拉丁字母串完全相同）且相似度达到 reuse_threshold 时
+才直接复用译文。句末的终助词改变语气和意思（行くよ/行くな/行くか/行くの），不算可复用的差别；
+其余相似度达到 hint_threshold 的只把记忆作为参考传给模型。
+记忆按语言对追加保存在 ~/.srt_trans/memory 下。
+"""
+import difflib
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, namedtuple
+
+from config_store import CONFIG_DIR
+from translate_common import LANG_CODES
+
+DEFAULT_REUSE_THRESHOLD = 0.9
+DEFAULT_HINT_THRESHOLD = 0.6
+
+# 倒排表超过这个长度的字组视为常用字组；每次查询最多精确计算这么多个候选
+MAX_POSTING = 256
+MAX_CANDIDATES = 32
+
+# 与 compress_repetitive_text 中的 [、。，！？\s] 同一思路，NFKC之后全角标点已变为半角
+_IGNORED = re.compile(r'[、。，,.!?！？…\s・「」『』（）()【】\[\]"\'“”‘’~〜♪]+')
+
+# 口语中常被省略的格助词：句中只多/少其中一个时可以直接复用译文。
+# も・と・の・で・や 及终助词 ね・よ・か・な・わ・さ 会改变意思或语气，不在其中
+PARTICLES = frozenset(["は", "が", "を", "に", "へ"])
+# 数字串和拉丁字母串，两句中必须完全相同才能直接复用
+_EXACT_RUNS = re.compile(r'[0-9]+|[a-z]+')
+
+# reusable 为可以直接复用译文（见 is_reusable_variant），否则只能作为参考
+Match = namedtuple("Match", ["score", "source", "translation", "reusable"], defaults=(False,))
+
+
+def normalize(text):
+    """规范化原文：统一全半角和大小写，去掉标点和空白"""
+    return _IGNORED.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def is_reusable_variant(key, other):
+    """两个规范化原文是否只在句中多/少一个格助词，且数字串和拉丁字母串完全相同；
+    助词替换成另一个助词、差别在句末时都不算"""
+    if _EXACT_RUNS.findall(key) != _EXACT_RUNS.findall(other):
+        return False
+    opcodes = [op for op in difflib.SequenceMatcher(None, key, other, autojunk=False).get_opcodes() if op[0] != "equal"]
+    if len(opcodes) != 1:
+        return False
+    tag, i1, i2, j1, j2 = opcodes[0]
+    # 差别在句首或句末的不算：句末是终助词的位置
+    if i1 == 0 or j1 == 0 or i2 == len(key) or j2 == len(other):
+        return False
+    if tag == "insert":
+        return other[j1:j2] in PARTICLES
+    if tag == "delete":
+        return key[i1:i2] in PARTICLES
+    return False
+
+
+def ngrams(key):
+    """二元字组集合，单字的句子以自身为字组"""
+    if len(key) < 2:
+        return frozenset([key]) if key else frozenset()
+    return frozenset(key[i:i + 2] for i in range(len(key) - 1))
+
+
+def memory_path(src_lang, dest_lang):
+    return os.path.join(CONFIG_DIR, "memory", f"{LANG_CODES[src_lang]}_{LANG_CODES[dest_lang]}.jsonl")
+
+
+class TranslationMemory:
+    def __init__(self, path=None, reuse_threshold=DEFAULT_REUSE_THRESHOLD, hint_threshold=DEFAULT_HINT_THRESHOLD):
+        self.path = path
+        self.reuse_threshold = reuse_threshold
+        self.hint_threshold = min(hint_threshold, reuse_threshold)
+        self.sources = []
+        self.translations = []
+        self.grams = []
+        self.keys = []
+        self.exact = {}  # 规范化原文 -> 记忆序号
+        self.postings = {}  # 字组 -> 含有该字组的记忆序号列表
+        self.lock = threading.Lock()
+        self.file = None
+        self.hits = {"reuse": 0, "hint": 0, "miss": 0}
+
+    @classmethod
+    def open(cls, src_lang, dest_lang, **kwargs):
+        """读入该语言对已保存的记忆，新增的记忆追加写入同一文件"""
+        memory = cls(memory_path(src_lang, dest_lang), **kwargs)
+        memory.load()
+        return memory
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 上次写到一半的最后一行
+                        continue
+                    self._insert(entry["s"], entry["t"])
+        except OSError:
+            pass
+        if self.sources:
+            print(f"已载入翻译记忆 {len(self.sources)} 条: {self.path}")
+
+    def _insert(self, source, translation):
+        """加入索引，返回是否有变化"""
+        key = normalize(source)
+        if not key:
+            return False
+        index = self.exact.get(key)
+        if index is not None:
+            # 同一句以最新的译文为准
+            changed = self.translations[index] != translation
+            self.translations[index] = translation
+            return changed
+        grams = ngrams(key)
+        index = len(self.sources)
+        self.sources.append(source)
+        self.translations.append(translation)
+        self.grams.append(grams)
+        self.keys.append(key)
+        self.exact[key] = index
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(index)
+        return True
+
+    def add(self, source, translation):
+        """记录模型给出的译文；空译文或与原文相同（翻译失败）时不记录"""
+        if not translation or not translation.strip() or translation.strip() == source.strip():
+            return
+        with self.lock:
+            if self._insert(source, translation) and self.path:
+                if self.file is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self.file = open(self.path, 'a', encoding='utf-8')
+                self.file.write(json.dumps({"s": source, "t": translation}, ensure_ascii=False) + "\n")
+
+    def lookup(self, text):
+        """返回相似度不低于 hint_threshold 的最相似记忆，没有时返回None。
+        线程引擎的各翻译线程会同时加入记忆，查询与加入使用同一把锁"""
+        key = normalize(text)
+        if not key:
+            return None
+        with self.lock:
+            return self._count(self._lookup(key))
+
+    def _lookup(self, key):
+        index = self.exact.get(key)
+        if index is not None:
+            return Match(1.0, self.sources[index], self.translations[index], True)
+
+        grams = ngrams(key)
+        size = len(grams)
+        t = self.hint_threshold
+        # Dice ≥ t 时，候选的字组数在 [size·t/(2-t), size·(2-t)/t] 之间，且至少与查询共有 ceil(size·t/(2-t)) 个字组
+        min_overlap = max(1, math.ceil(size * t / (2 - t) - 1e-9))
+        min_size, max_size = size * t / (2 - t), size * (2 - t) / t
+
+        # 从最稀有的字组开始统计共有字组数；太常见的字组（如“です”）倒排表很长，不参与统计，
+        # 只把它们视为可能共有，相应降低候选需要的共有数
+        counts = Counter()
+        skipped = 0
+        for postings in sorted((self.postings.get(gram, ()) for gram in grams), key=len):
+            if len(postings) > MAX_POSTING:
+                if counts:
+                    skipped += 1
+                    continue
+                # 所有字组都很常见时只看最近的记忆
+                postings = postings[-MAX_POSTING:]
+            counts.update(postings)
+        need = max(1, min_overlap - skipped)
+
+        best, best_score = None, t
+        for candidate, count in counts.most_common(MAX_CANDIDATES):
+            if count < need:
+                break
+            other = self.grams[candidate]
+            if not min_size <= len(other) <= max_size:
+                continue
+            score = 2 * len(grams & other) / (size + len(other))
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            return None
+        reusable = best_score >= self.reuse_threshold and is_reusable_variant(key, self.keys[best])
+        return Match(best_score, self.sources[best], self.translations[best], reusable)
+
+    def _count(self, match):
+        if match is None:
+            self.hits["miss"] += 1
+        elif self.can_reuse(match):
+            self.hits["reuse"] += 1
+        else:
+            self.hits["hint"] += 1
+        return match
+
+    def can_reuse(self, match):
+        return match is not None and match.reusable
+
+    def describe(self):
+        return f"复用 {self.hits['reuse']} 条，参考 {self.hits['hint']} 条，共 {len(self.sources)} 条记忆"
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None